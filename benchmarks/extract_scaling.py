@@ -0,0 +1,45 @@
+"""
+How extraction time scales with the number of worker processes.
+
+    python -m benchmarks.extract_scaling path/to/repo --max-jobs 8
+
+Runs the git log engine once in a single process and then with 2..N
+worker processes, without the stats cache so every run computes every
+diff, and prints the wall time and speed-up of each run. The parallel
+runs are checked against the single-process output.
+"""
+import json
+import time
+
+import typer
+from git import Repo
+from typing_extensions import Annotated
+
+from gminer.extractor import emit_commit_records, emit_commit_records_in_parallel, SHARD_SIZE
+
+
+def timed(records) -> tuple[float, list[str]]:
+    start = time.perf_counter()
+    texts = [json.dumps(record) for record in records]
+    return time.perf_counter() - start, texts
+
+
+def main(
+        repo_path: str,
+        max_jobs: Annotated[int, typer.Option("--max-jobs", "-j")] = 4,
+        shard_size: Annotated[int, typer.Option("--shard-size")] = SHARD_SIZE
+):
+    repository = Repo(repo_path)
+    baseline, expected = timed(emit_commit_records(repository))
+    print(f"{len(expected)} commits")
+    print("jobs  seconds  speed-up")
+    print(f"{1:4d} {baseline:8.2f} {1:8.2f}x")
+    for jobs in range(2, max_jobs + 1):
+        elapsed, texts = timed(emit_commit_records_in_parallel(repository, jobs, use_cache=False,
+                                                               shard_size=shard_size))
+        assert texts == expected, f"{jobs} jobs gave a different extract"
+        print(f"{jobs:4d} {elapsed:8.2f} {baseline / elapsed:8.2f}x")
+
+
+if __name__ == '__main__':
+    typer.run(main)
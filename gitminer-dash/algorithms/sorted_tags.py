@@ -1,9 +1,13 @@
 import git
 
+from gminer.ref_index import load_ref_index
+from gminer.types import RefKind
+
 
 def get_most_recent_tags(repo: git.Repo, desired):
-    sorted_tags = sorted(
-        repo.tags,
-        key=(lambda x: x.commit.authored_datetime)
-    )
-    return sorted_tags[-desired:]
+    """
+    The `desired` most recently authored tags, oldest first. They are
+    sorted from the ref index, so only the tags returned are looked up.
+    """
+    sorted_tags = load_ref_index(repo.common_dir).by_date(RefKind.tag)
+    return [git.TagReference(repo, tag.refname) for tag in sorted_tags[-desired:]]
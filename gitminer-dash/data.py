@@ -7,6 +7,8 @@ from functools import cache
 
 from git import Repo, Commit
 
+from gminer.stats_cache import CommitStats, cached_commit_stats
+
 
 # Link this to any local repo, until we can make this
 # a handy-dandy drag-n-drop or dir selection input field
@@ -28,3 +30,12 @@ def commits_in_period(beginning: datetime, ending: datetime) -> Iterable[Commit]
         this_date = delta.committed_datetime
         if beginning <= this_date <= ending:
             yield delta
+
+
+def commit_stats(commits: Iterable[Commit]) -> dict[str, CommitStats]:
+    """
+    Stats (shaped like commit.stats) for all the commits at once, keyed by sha.
+    They come from the repository's stats cache, so git only runs for
+    commits that no page or extract has seen before.
+    """
+    return cached_commit_stats(get_repo().common_dir, (commit.hexsha for commit in commits))
@@ -1,10 +1,63 @@
-from dash import html
+from datetime import datetime
+from functools import cache
+
+import pandas as pd
+from dash import html, register_page, callback, Output, Input
+from dash.dash_table import DataTable
+
+from data import get_repo
+from gminer.ref_index import load_ref_index
+from gminer.types import RefKind
+
+register_page(
+    module=__name__,  # Where it's found
+    name="Branches",  # Menu item name
+)
+
+
+@cache
+def prepared_data_frame():
+    """
+    Local and remote branches, the most recently committed first,
+    straight from the ref index: no commit is read to build it.
+    """
+    index = load_ref_index(get_repo().common_dir)
+    now = datetime.now().astimezone()
+    branches = [ref for kind in (RefKind.branch, RefKind.remote) for ref in index.of_kind(kind) if ref.commit]
+    rows = [
+        {
+            'Branch': ref.name,
+            'Kind': ref.kind,
+            'Last Commit': ref.committed.isoformat(sep=' '),
+            'Days Since': (now - ref.committed).days,
+            'Commit': ref.commit[:10],
+        }
+        for ref in sorted(branches, key=lambda ref: ref.committed, reverse=True)
+    ]
+    columns = ['Branch', 'Kind', 'Last Commit', 'Days Since', 'Commit']
+    return pd.DataFrame(rows, columns=columns)
 
-# Comment to keep page from rendering
-# register_page(__name__)
 
 layout = html.Div(
     [
-        html.H2("This is the branches page"),
+        html.H2("Branches"),
+        html.P(
+            id="id-no-branches-message",
+            children="No branches found in repository."
+        ),
+        DataTable(id="id-branches-table", sort_action="native"),
     ]
 )
+
+
+@callback(
+    [
+        Output("id-branches-table", "data"),
+        Output("id-no-branches-message", "style")
+    ],
+    Input("id-branches-table", "id")
+)
+def update_table(_):
+    data = prepared_data_frame()
+    style = {"display": "block"} if data.empty else {"display": "none"}
+    return data.to_dict('records'), style
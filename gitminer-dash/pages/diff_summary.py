@@ -36,10 +36,13 @@ layout = html.Div(
 @log
 def get_diffs_in_period(start: datetime, end: datetime) -> pd.DataFrame:
     counts = defaultdict(int)
-    for commit in data.commits_in_period(start, end):
+    commits = list(data.commits_in_period(start, end))
+    all_stats = data.commit_stats(commits)
+    for commit in commits:
         day = commit.committed_datetime.date()
-        inserted = commit.stats.total["insertions"]
-        deleted = commit.stats.total["deletions"]
+        totals = all_stats[commit.hexsha].total
+        inserted = totals["insertions"]
+        deleted = totals["deletions"]
 
         possible_mods = min(inserted, deleted)
         counts[day, "possible mods"] += possible_mods
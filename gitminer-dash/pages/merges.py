@@ -33,12 +33,13 @@ def prepare_dataframe():
         "lines",
         "files"
     ]
+    all_stats = data.commit_stats(recent_merges)
     source = (
         (commit.hexsha,
          commit.committed_datetime.date(),
          commit.message,
-         commit.stats.total["lines"],
-         commit.stats.total["files"])
+         all_stats[commit.hexsha].total["lines"],
+         all_stats[commit.hexsha].total["files"])
         for commit in recent_merges
     )
     result = pd.DataFrame(source, columns=columns).sort_values(by="date")
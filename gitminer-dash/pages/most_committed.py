@@ -70,13 +70,10 @@ def calculate_usages(period: str):
 
     counter = Counter()
     all_commits = list(data.commits_in_period(begin, end))
+    all_stats = data.commit_stats(all_commits)
     for commit in all_commits:
-        try:
-            files = commit.stats.files.keys()
-            counter.update(files)
-        except ValueError as e:
-            print("Stop me if you've seen this one before")
-            raise e
+        files = all_stats[commit.hexsha].files.keys()
+        counter.update(files)
     return counter.most_common(20)
 
 
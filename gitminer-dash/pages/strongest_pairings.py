@@ -40,11 +40,14 @@ layout = html.Div(
 
 def create_affinity_list(start: datetime, end: datetime) -> list[dict[str, str]]:
     affinities = defaultdict(int)
-    for commit in data.commits_in_period(start, end):
-        files_in_commit = len(commit.stats.files)
+    commits = list(data.commits_in_period(start, end))
+    all_stats = data.commit_stats(commits)
+    for commit in commits:
+        files = all_stats[commit.hexsha].files
+        files_in_commit = len(files)
         if files_in_commit < 2:
             continue
-        for combo in combinations(commit.stats.files, 2):
+        for combo in combinations(files, 2):
             ordered_key = tuple(sorted(combo))
             affinities[ordered_key] += 1 / files_in_commit
     affinity_first_list = [
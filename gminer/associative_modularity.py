@@ -1,34 +1,65 @@
 import os
-import statistics
 from collections import Counter, defaultdict
 from collections.abc import Mapping
-from itertools import combinations
-from typing import Any, Iterable
+from datetime import datetime
+from typing import Any, Iterable, NamedTuple
 
 import networkx as nx
-import pandas
+import numpy
 from networkx import Graph
-from pandas import DataFrame
+from scipy import sparse
 
-from gminer.types import GitHistoryDataframe, FEKey
+from gminer.cochange import CoChangeAnalysis, MegaCommitPolicy, order_of_first_cochange
+from gminer.communities import louvain_communities
+from gminer.history_store import HistoryStore, load_history
+from gminer.types import EdgeThreshold, GitHistoryDataframe, GroupingMethod, MegaCommitAction
 from gminer.utility import read_git_history_from_file
 
+History = GitHistoryDataframe | HistoryStore
 
-def strongest_pairs_by_ranking(commit_history: GitHistoryDataframe):
-    connection_rankings = calculate_relative_strengths(commit_history)
-    pairing_count: Counter = count_combinations(commit_history)
-    ranked_list_of_pairs = ((value, pair, pairing_count[pair])
-                            for pair, value in connection_rankings.items())
-    strong_pairs = sorted(ranked_list_of_pairs, reverse=True)
-    return strong_pairs
 
+class GroupingOptions(NamedTuple):
+    """
+    Which pairs join files into groups, and how the groups are found:
+        spread      pairs stronger than (max - mean) / 5 + mean
+        quantile    pairs stronger than that quantile of all strengths
+        top-k       each file's top_k strongest pairs
+    then either the connected components of those pairs, or Louvain
+    communities of them (which split up what would be one giant component).
+    """
+    threshold: EdgeThreshold = EdgeThreshold.spread
+    quantile: float = 0.99
+    top_k: int = 3
+    method: GroupingMethod = GroupingMethod.components
+    resolution: float = 1.0
 
-def count_combinations(p: GitHistoryDataframe) -> Counter:
-    return Counter(
-        pair
-        for files in p.files
-        for pair in combinations([file[FEKey.filename] for file in files], 2)
-    )
+
+def as_history_store(history: History) -> HistoryStore:
+    return history if isinstance(history, HistoryStore) else HistoryStore.from_dataframe(history)
+
+
+def cochange_analysis(history: History | CoChangeAnalysis,
+                      policy: MegaCommitPolicy = MegaCommitPolicy(), jobs: int = 1) -> CoChangeAnalysis:
+    """
+    The shared single-pass analysis the functions below are views of;
+    pass one in to ask several of them about the same history.
+    """
+    if isinstance(history, CoChangeAnalysis):
+        return history
+    return CoChangeAnalysis(as_history_store(history), policy, jobs)
+
+
+def strongest_pairs_by_ranking(commit_history: History | CoChangeAnalysis, limit: int = None):
+    """
+    (strength, pair, count) for each pair of files, strongest first, as
+    sorted(..., reverse=True) would order them. Only the first `limit`
+    entries are built.
+    """
+    return cochange_analysis(commit_history).strongest_pairs(limit)
+
+
+def count_combinations(p: History | CoChangeAnalysis) -> Counter:
+    return Counter(cochange_analysis(p).pair_counts())
 
 
 def create_graph_from_pair_mapping(pairings: Mapping[tuple[str, str], Any]) -> nx.Graph:
@@ -41,32 +72,19 @@ def create_graph_from_pair_mapping(pairings: Mapping[tuple[str, str], Any]) -> n
     return graph
 
 
-def create_graph_from_dataframe(history: GitHistoryDataframe):
-    source = []
-    for files in history.files:
-        commit_files = [x[FEKey.filename] for x in files]
-        if len(commit_files) < 1:
-            continue
-        for pair in combinations(commit_files, 2):
-            source.append(pair)
-    return nx.Graph(source)
+def create_graph_from_dataframe(history: History | CoChangeAnalysis):
+    return cochange_analysis(history).graph()
 
 
-def list_mega_commits(history: DataFrame):
-    for (index, (hashcode, date, message, files)) in history[['hash', 'date', 'message', 'files']].iterrows():
-        if len(files) > 100:
-            yield index, len(files), hashcode, date, message
+def list_mega_commits(history: History | CoChangeAnalysis):
+    yield from cochange_analysis(history).list_mega_commits()
 
 
-def list_super_connectors(history: DataFrame):
-    graph = create_graph_from_dataframe(history)
-    listed = [(neighbor_count, filename)
-              for filename, neighbor_count in graph.degree]
-    biggest_first = sorted(listed, reverse=True)
-    return biggest_first[:20]
+def list_super_connectors(history: History | CoChangeAnalysis):
+    return cochange_analysis(history).super_connectors(20)
 
 
-def calculate_relative_strengths(commit_df: GitHistoryDataframe) -> defaultdict:
+def calculate_relative_strengths(commit_df: History | CoChangeAnalysis) -> defaultdict:
     """
     collect filenames from commit history, and calculate
     cumulative relative strength of connections between them.
@@ -78,24 +96,20 @@ def calculate_relative_strengths(commit_df: GitHistoryDataframe) -> defaultdict:
     If the files appeared together in each of the commits given above,
     then the strength of connection is .61 (quite high).
 
+    The sums are worked out as a sparse matrix product (see gminer.cochange).
+
     @return: dict of (file,file):strength
     """
-    assert 'files' in commit_df.columns
-    result = defaultdict(float)
-    for files in commit_df.files:
-        strength = (1.0 / len(files)) if files else 0
-        filenames = [x[FEKey.filename] for x in files]
-        for pair in combinations(filenames, 2):
-            result[pair] += strength
-    return result
+    assert isinstance(commit_df, (HistoryStore, CoChangeAnalysis)) or 'files' in commit_df.columns
+    return defaultdict(float, cochange_analysis(commit_df).pair_strengths())
 
 
-def print_neighbors_list(commit_df: pandas.DataFrame, limit=10):
+def print_neighbors_list(commit_df: History | CoChangeAnalysis, limit=10):
     print("Super-connectors' neighbors")
-    graph = create_graph_from_dataframe(commit_df)
-    for (_, filename) in list_super_connectors(commit_df)[:limit]:
+    analysis = cochange_analysis(commit_df)
+    for (_, filename) in analysis.super_connectors(limit):
         print(filename)
-        for n in graph.neighbors(filename):
+        for n in analysis.neighbors(filename):
             print(f"    {n}")
 
 
@@ -105,41 +119,148 @@ def create_weighted_graph_from(source: Iterable[tuple[str, str, int | float]]) -
     return graph
 
 
-def groupings(json_source, since_date=None) -> Iterable[tuple[str, str, float]]:
-    full_set = read_git_history_from_file(json_source)
-    chosen_set = full_set.query(f'"{since_date}" < date') if since_date else full_set
-    print(f"From {chosen_set.date.min()} through {chosen_set.date.max()}")
-    return significant_groups_from_df(chosen_set, explain=True)
-
-
-def significant_groups_from_df(dataframe: GitHistoryDataframe, explain=False) -> Iterable[tuple[str, str, float]]:
-    weighted_set = calculate_relative_strengths(dataframe)
-    maximum = max(weighted_set.values())
-    average = statistics.mean(weighted_set.values())
-    median = statistics.median(weighted_set.values())
-    stdev = statistics.stdev(weighted_set.values())
-    limit_of_interest = (maximum - average) / 5 + average
+def groupings(json_source, since_date=None, policy: MegaCommitPolicy = MegaCommitPolicy(),
+              jobs: int = 1, options: GroupingOptions = GroupingOptions()) -> Iterable[tuple[str, str, float]]:
+    """
+    Only the commits after since_date (an ISO date; local time if no
+    offset is given) are loaded.
+    """
+    after = datetime.fromisoformat(since_date) if since_date else None
+    chosen_set = load_history(json_source, after=after)
+    if not len(chosen_set):
+        print("No commits in range")
+        return []
+    earliest, latest = chosen_set.date_order[0], chosen_set.date_order[-1]
+    print(f"From {chosen_set.date_of(earliest)} through {chosen_set.date_of(latest)}")
+    return significant_groups_from_df(chosen_set, explain=True, policy=policy, jobs=jobs, options=options)
+
+
+def significant_groups_from_df(dataframe: History | CoChangeAnalysis, explain=False,
+                               policy: MegaCommitPolicy = MegaCommitPolicy(), jobs: int = 1,
+                               options: GroupingOptions = GroupingOptions()) -> Iterable[tuple[str, str, float]]:
+    analysis = cochange_analysis(dataframe, policy, jobs)
+    strengths = analysis.strengths
+    groups = significant_groups(analysis.history, strengths.row, strengths.col, strengths.data, explain, options)
+    if explain and analysis.policy.action != MegaCommitAction.keep:
+        print(analysis.mega_commit_report.describe(analysis.policy))
+    return groups
+
+
+def significant_groups_from_index(json_source: str, rebuild: bool = False,
+                                  options: GroupingOptions = GroupingOptions()) -> Iterable[tuple[str, str, float]]:
+    """
+    The groupings of the whole history, from its co-change index
+    (see gminer.cochange_index), which is brought up to date first.
+    """
+    from gminer.cochange_index import load_cochange_index
+    index, store, _, _ = load_cochange_index(json_source, rebuild)
+    if not len(store):
+        print("No commits in range")
+        return []
+    print(f"From {store.date_of(store.date_order[0])} through {store.date_of(store.date_order[-1])}")
+    file_ids = numpy.array([store.file_id(name) for name in index.filenames], dtype=numpy.int64)
+    return significant_groups(store, file_ids[index.firsts], file_ids[index.seconds],
+                              numpy.asarray(index.strengths), explain=True, options=options)
+
+
+def significant_groups(store: HistoryStore, firsts: numpy.ndarray, seconds: numpy.ndarray, strengths: numpy.ndarray,
+                       explain=False, options: GroupingOptions = GroupingOptions()) -> Iterable[set[str]]:
+    """
+    The groups of files joined by the pairs (of the store's file ids) the
+    options pick, numbered in the order the history meets them.
+    """
+    strengths = numpy.asarray(strengths, dtype=numpy.float64)
+    if not len(strengths):
+        return []
+    maximum, minimum, average = strengths.max(), strengths.min(), strengths.mean()
+    median = numpy.median(strengths)
+    stdev = strengths.std(ddof=1) if len(strengths) > 1 else 0.0
     if explain:
         print(f"Max = {maximum}")
-        print(f"Min = {min(weighted_set.values())}")
+        print(f"Min = {minimum}")
         print(f"Mean = {average}")
         print(f"Median = {median}")
         print(f"Stdev = {stdev}")
-        print(f"Limit of interest = {limit_of_interest}")
+    if options.threshold == EdgeThreshold.top_k:
+        chosen = strongest_pairs_of_each_file(firsts, seconds, strengths, options.top_k)
+        if explain:
+            print(f"Strongest {options.top_k} pairs of each file")
+    else:
+        if options.threshold == EdgeThreshold.quantile:
+            limit_of_interest = numpy.quantile(strengths, options.quantile)
+        else:
+            limit_of_interest = (maximum - average) / 5 + average
+        if explain:
+            print(f"Limit of interest = {limit_of_interest}")
+        chosen = numpy.flatnonzero(strengths > limit_of_interest)
+    edges = list(zip(firsts[chosen].tolist(), seconds[chosen].tolist()))
+    # The groups are numbered in the order the graph meets their files
+    met = numpy.array(order_of_first_cochange(store, edges), dtype=numpy.int64)
+    if options.method == GroupingMethod.louvain:
+        return louvain_groups(store, firsts[chosen][met], seconds[chosen][met], strengths[chosen][met],
+                              options.resolution)
+    names = store.filenames
+    weights = strengths[chosen].tolist()
     source = (
-        (first, second, weight)
-        for (first, second), weight in weighted_set.items()
-        if weight > limit_of_interest
+        (names[edges[index][0]], names[edges[index][1]], weights[index])
+        for index in met.tolist()
     )
     return nx.connected_components(create_weighted_graph_from(source))
 
 
-def tight_groupings(json_source: str, since_date: str = None):
+def strongest_pairs_of_each_file(firsts: numpy.ndarray, seconds: numpy.ndarray, strengths: numpy.ndarray,
+                                 limit: int) -> numpy.ndarray:
+    """
+    The pairs (as indices) that are among the `limit` strongest of either
+    of their files; ties go to the pair listed first.
+    """
+    ends = numpy.concatenate([firsts, seconds])
+    pairs = numpy.tile(numpy.arange(len(strengths)), 2)
+    ordered = numpy.lexsort((pairs, -numpy.tile(strengths, 2), ends))
+    ends = ends[ordered]
+    starts_of_file = numpy.flatnonzero(numpy.r_[True, ends[1:] != ends[:-1]])
+    place = numpy.arange(len(ends)) - numpy.repeat(starts_of_file, numpy.diff(numpy.r_[starts_of_file, len(ends)]))
+    return numpy.unique(pairs[ordered][place < limit])
+
+
+def louvain_groups(store: HistoryStore, firsts: numpy.ndarray, seconds: numpy.ndarray, strengths: numpy.ndarray,
+                   resolution: float = 1.0) -> list[set[str]]:
+    """
+    Louvain communities (see gminer.communities) of the graph of these
+    pairs, in the order the pairs meet their first member.
+    """
+    files, first_seen, ends = numpy.unique(numpy.column_stack([firsts, seconds]).ravel(), return_index=True,
+                                           return_inverse=True)
+    # number the nodes in the order the pairs meet them
+    met = numpy.argsort(first_seen, kind="stable")
+    node_of = numpy.empty(len(files), dtype=numpy.int64)
+    node_of[met] = numpy.arange(len(files))
+    files, nodes = files[met], node_of[ends.ravel()]
+    rows, columns = nodes[0::2], nodes[1::2]
+    adjacency = sparse.csr_array((numpy.concatenate([strengths, strengths]),
+                                  (numpy.concatenate([rows, columns]), numpy.concatenate([columns, rows]))),
+                                 shape=(len(files), len(files)))
+    membership = louvain_communities(adjacency, resolution)
+    first_node = numpy.full(membership.max() + 1 if len(membership) else 0, len(files))
+    numpy.minimum.at(first_node, membership, numpy.arange(len(files)))
+    names = store.filenames
+    groups = [set() for _ in first_node]
+    for node, community in enumerate(membership.tolist()):
+        groups[community].add(names[files[node]])
+    return [groups[community] for community in numpy.argsort(first_node, kind="stable").tolist()
+            if len(groups[community]) > 1]
+
+
+def tight_groupings(json_source: str, since_date: str = None, policy: MegaCommitPolicy = MegaCommitPolicy(),
+                    jobs: int = 1, use_index: bool = False, rebuild_index: bool = False,
+                    options: GroupingOptions = GroupingOptions()):
     def dir_reversed(x):
         seperator = os.sep
         return seperator.join(reversed(x.split(seperator)))
 
-    for number, grouping in enumerate(groupings(json_source, since_date)):
+    for number, grouping in enumerate(
+            significant_groups_from_index(json_source, rebuild_index, options) if use_index
+            else groupings(json_source, since_date, policy, jobs, options)):
         print(f"Group {number}:")
         for member in sorted(grouping, key=dir_reversed):
             print("    ", member)
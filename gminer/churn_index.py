@@ -0,0 +1,239 @@
+"""
+A persisted index of each file's commits and churn per week.
+
+most-committed used to count every change in the extract on every run.
+The churn index keeps, for every week and every file changed in it, the
+number of commits that touched the file and the lines inserted into and
+deleted from it. It is kept in a directory of .npy files next to the
+extract (for history.json, history.json.gminer-churn) and brought up to
+date the way the co-change index is: commits added in front of the ones
+it absorbed are folded in, anything else rebuilds it.
+
+A date window is summed from the weeks that lie wholly inside it, and
+only the commits in the partial weeks at either end are counted from the
+history, so the totals are exactly those of the commits in the window.
+Weeks are UTC weeks starting on Monday, as temporal_coupling has them.
+"""
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+
+import numpy
+
+from gminer.history_store import HistoryStore, StringColumn, load_history, replace_directory
+from gminer.temporal_coupling import SECONDS_PER_DAY, bucket_numbers
+from gminer.types import FileRanking, Period
+
+INDEX_SUFFIX = ".gminer-churn"
+INDEX_VERSION = 2
+INDEX_METADATA = "index.json"
+
+
+class FileChurn(NamedTuple):
+    filename: str
+    commits: int
+    insertions: int
+    deletions: int
+
+    @property
+    def churn(self) -> int:
+        return self.insertions + self.deletions
+
+
+class ChurnIndex:
+    """
+    One entry per (week, file) that had changes, sorted by week and then
+    by file id; file ids are the history's, so ties can be listed in order
+    of first appearance as HistoryStore.most_committed lists them.
+    """
+    ARRAYS = ["weeks", "file_ids", "commits", "insertions", "deletions"]
+
+    def __init__(self, *, filenames: StringColumn, weeks: numpy.ndarray, file_ids: numpy.ndarray,
+                 commits: numpy.ndarray, insertions: numpy.ndarray, deletions: numpy.ndarray,
+                 commit_count: int, digest: str):
+        self.filenames = filenames
+        self.weeks = weeks
+        self.file_ids = file_ids
+        self.commits = commits
+        self.insertions = insertions
+        self.deletions = deletions
+        self.commit_count = commit_count
+        self.digest = digest
+
+    @classmethod
+    def build(cls, history: HistoryStore) -> "ChurnIndex":
+        change_weeks = bucket_numbers(history.timestamps, Period.week)[history.change_commit_ids()]
+        return cls._from_entries(history, change_weeks, history.file_ids, numpy.ones(len(change_weeks), numpy.int64),
+                                 history.insertions, history.deletions, len(history))
+
+    def absorb(self, history: HistoryStore, added: int) -> "ChurnIndex":
+        """
+        The index with the first `added` commits of history (the whole
+        extract, ending with the commits absorbed so far) folded in.
+        """
+        if not added:
+            return self
+        new = ChurnIndex.build(history.select(numpy.arange(added)))
+        renumbered = numpy.array([history.file_id(name) for name in self.filenames], dtype=numpy.int64)
+        return ChurnIndex._from_entries(
+            history,
+            numpy.concatenate([self.weeks, new.weeks]),
+            numpy.concatenate([renumbered[self.file_ids], new.file_ids]),
+            numpy.concatenate([self.commits, new.commits]),
+            numpy.concatenate([self.insertions, new.insertions]),
+            numpy.concatenate([self.deletions, new.deletions]),
+            self.commit_count + added,
+        )
+
+    @classmethod
+    def _from_entries(cls, history: HistoryStore, weeks: numpy.ndarray, file_ids: numpy.ndarray,
+                      commits: numpy.ndarray, insertions: numpy.ndarray, deletions: numpy.ndarray,
+                      commit_count: int) -> "ChurnIndex":
+        files = max(len(history.filenames), 1)
+        keys, inverse = numpy.unique(weeks.astype(numpy.int64) * files + file_ids, return_inverse=True)
+
+        def summed(values: numpy.ndarray) -> numpy.ndarray:
+            return numpy.bincount(inverse, values, len(keys)).astype(numpy.int64)
+
+        return cls(filenames=history.filenames, weeks=keys // files, file_ids=(keys % files).astype(numpy.int32),
+                   commits=summed(commits), insertions=summed(insertions), deletions=summed(deletions),
+                   commit_count=commit_count, digest=history.digest_of_last(commit_count))
+
+    def week_totals(self, first_week: Optional[int] = None,
+                    last_week: Optional[int] = None) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        """
+        Commits, insertions and deletions by file id, summed over the weeks
+        first_week to last_week (inclusive; None for no bound).
+        """
+        start = 0 if first_week is None else numpy.searchsorted(self.weeks, first_week, side="left")
+        end = len(self.weeks) if last_week is None else numpy.searchsorted(self.weeks, last_week, side="right")
+        entries = slice(start, max(start, end))
+        file_ids, files = self.file_ids[entries], len(self.filenames)
+        return tuple(numpy.bincount(file_ids, values[entries], files).astype(numpy.int64)
+                     for values in (self.commits, self.insertions, self.deletions))
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        for name in self.ARRAYS:
+            numpy.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        numpy.save(os.path.join(directory, "filenames.data.npy"), self.filenames.data)
+        numpy.save(os.path.join(directory, "filenames.offsets.npy"), self.filenames.offsets)
+        with open(os.path.join(directory, INDEX_METADATA), "w") as out:
+            json.dump(dict(version=INDEX_VERSION, commits=self.commit_count, digest=self.digest), out)
+
+    @classmethod
+    def open(cls, directory: str) -> Optional["ChurnIndex"]:
+        """
+        The index saved in directory, memory-mapped; None if there isn't
+        one of this version, or it was replaced while it was being opened.
+        """
+        try:
+            with open(os.path.join(directory, INDEX_METADATA)) as source:
+                metadata = json.load(source)
+        except (OSError, ValueError):
+            return None
+        if metadata.get("version") != INDEX_VERSION:
+            return None
+
+        def mapped(filename: str) -> numpy.ndarray:
+            return numpy.load(os.path.join(directory, filename), mmap_mode="r")
+
+        try:
+            return cls(filenames=StringColumn(mapped("filenames.data.npy"), mapped("filenames.offsets.npy")),
+                       **{name: mapped(f"{name}.npy") for name in cls.ARRAYS},
+                       commit_count=metadata["commits"], digest=metadata["digest"])
+        except (OSError, ValueError):
+            return None  # swapped out by another process as it was opened (see replace_directory)
+
+
+class ChurnIndexUpdate(NamedTuple):
+    index: ChurnIndex
+    history: HistoryStore
+    added: int
+    rebuilt: bool
+
+
+def index_path(path: str) -> str:
+    return os.path.abspath(path).rstrip(os.sep) + INDEX_SUFFIX
+
+
+def load_churn_index(path: str, rebuild: bool = False) -> ChurnIndexUpdate:
+    """
+    The extract's churn index, brought up to date and saved, with the
+    history loaded to check it. An index of an extract since rewritten,
+    or extracted again with other filters, is built again: its file ids
+    would no longer be the history's.
+    """
+    history = load_history(path)
+    location = index_path(path)
+    index = None if rebuild else ChurnIndex.open(location)
+    added = len(history) - index.commit_count if index else -1
+    if index and added >= 0 and history.ends_with(index.commit_count, index.digest):
+        if not added:
+            return ChurnIndexUpdate(index, history, 0, False)
+        index = index.absorb(history, added)
+        rebuilt = False
+    else:
+        index = ChurnIndex.build(history)
+        added = len(history)
+        rebuilt = True
+    replace_directory(location, index.save)
+    return ChurnIndexUpdate(index, history, added, rebuilt)
+
+
+def file_totals(index: ChurnIndex, history: HistoryStore, after: Optional[datetime] = None,
+                before: Optional[datetime] = None) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """
+    Commits, insertions and deletions by file id over the commits dated
+    strictly between after and before (see HistoryStore.between).
+    """
+    files = len(index.filenames)
+    # the whole weeks inside the window: from the week after `after`'s to the week before `before`'s
+    first_week = None if after is None else _week_of(after) + 1
+    last_week = None if before is None else _week_of(before) - 1
+    if first_week is not None and last_week is not None and last_week < first_week:
+        return _totals_of(history.between(after, before), files)
+    totals = index.week_totals(first_week, last_week)
+    edges = []
+    if after is not None:
+        edges.append(history.between(after, _week_start(first_week)))
+    if before is not None:
+        # (timestamps are whole seconds, so this takes the commits from the start of before's week on)
+        edges.append(history.between(_week_start(last_week + 1) - timedelta(seconds=1), before))
+    for edge in edges:
+        totals = tuple(total + edge_total for total, edge_total in zip(totals, _totals_of(edge, files)))
+    return totals
+
+
+def most_committed_files(index: ChurnIndex, history: HistoryStore, goal: int, by: FileRanking = FileRanking.commits,
+                         after: Optional[datetime] = None, before: Optional[datetime] = None) -> list[FileChurn]:
+    """
+    The `goal` files with the most commits, or the most lines inserted and
+    deleted, in the window; ties in order of first appearance. Only the
+    files at or above the goal-th largest value are sorted.
+    """
+    commits, insertions, deletions = file_totals(index, history, after, before)
+    values = commits if by == FileRanking.commits else insertions + deletions
+    candidates = numpy.flatnonzero(commits)
+    if goal < len(candidates):
+        floor = numpy.partition(values[candidates], len(candidates) - goal)[len(candidates) - goal]
+        candidates = candidates[values[candidates] >= floor]
+    ranked = candidates[numpy.lexsort((candidates, -values[candidates]))][:goal]
+    names = index.filenames
+    return [FileChurn(names[file_id], int(commits[file_id]), int(insertions[file_id]), int(deletions[file_id]))
+            for file_id in ranked.tolist()]
+
+
+def _totals_of(history: HistoryStore, files: int) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    return (numpy.bincount(history.file_ids, minlength=files).astype(numpy.int64),
+            numpy.bincount(history.file_ids, history.insertions, files).astype(numpy.int64),
+            numpy.bincount(history.file_ids, history.deletions, files).astype(numpy.int64))
+
+
+def _week_of(moment: datetime) -> int:
+    return int(bucket_numbers(numpy.array([moment.timestamp()]), Period.week)[0])
+
+
+def _week_start(week: int) -> datetime:
+    return datetime.fromtimestamp((week * 7 - 3) * SECONDS_PER_DAY, timezone.utc)
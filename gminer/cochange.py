@@ -0,0 +1,455 @@
+"""
+Co-change counts and strengths as sparse matrix products.
+
+Commit i touching file f is a 1 in a commits x files incidence matrix X.
+Then XᵀX counts, for every pair of files, the commits they were both in,
+and XᵀWX, with W the diagonal of 1/len(files) per commit, adds up the
+relative strengths of associative_modularity.calculate_relative_strengths.
+scipy works through the commits of each file in order, so each strength is
+summed in the same order, and to the same float, as the pair-by-pair loop.
+
+A pair is keyed (a, b) with a before b in filename order, which is the
+order git lists a commit's files in, so the keys are the ones
+itertools.combinations gives over an extract's file lists.
+
+CoChangeAnalysis reads the history once and derives everything the
+associative_modularity functions report from the same matrices.
+
+A commit of k files makes k(k-1)/2 pairs, so a handful of reformats or
+license-header sweeps can cost more than the rest of the history put
+together, while adding almost nothing to any pair (1/k each). A
+MegaCommitPolicy deals with commits over a size limit before any pairs are
+made: skip them, pair only a sample of their files, or collapse them to
+their directories. Whatever is left out is only ever left out, so every
+strength computed is a lower bound of the exact one; the MegaCommitReport
+says by how much it can be low.
+
+With jobs > 1 the products are worked out by a pool of processes. Each
+takes a block of the product's rows (files), reading the matrices from
+shared memory; a row's sums are still made over its commits in order, so
+the blocks, stacked back together, are the serial result to the bit.
+"""
+import multiprocessing
+import os
+from datetime import datetime
+from multiprocessing import shared_memory
+from typing import Iterable, Iterator, NamedTuple, Optional, Sequence
+
+import networkx as nx
+import numpy
+from scipy import sparse
+
+from gminer.cochange_graph import CoChangeGraph, ranking_strengths
+from gminer.history_store import HistoryStore, StringColumn, concatenated_ranges
+from gminer.types import MegaCommitAction
+
+CHUNK_PAIRS = 4_000_000
+
+
+def incidence_matrix(history: HistoryStore, weighted: bool = False) -> sparse.csr_array:
+    """
+    The commits x files matrix; weighted, each commit's row holds 1/len(files).
+    """
+    sizes = history.sizes
+    if weighted:
+        data = numpy.repeat(1.0 / numpy.maximum(sizes, 1), sizes)
+    else:
+        data = numpy.ones(len(history.file_ids), dtype=numpy.int64)
+    return sparse.csr_array((data, numpy.asarray(history.file_ids), numpy.asarray(history.commit_offsets)),
+                            shape=(len(history), len(history.filenames)))
+
+
+def cochange_matrix(history: HistoryStore, weighted: bool = False) -> sparse.coo_array:
+    """
+    The files x files co-change matrix, holding each pair once: at
+    (a, b) with a's filename sorting before b's. Weighted, it holds the
+    relative strengths; otherwise the number of commits in common.
+    """
+    files_by_commit = incidence_matrix(history, weighted)
+    return _upper_pairs(incidence_matrix(history).T.tocsr() @ files_by_commit, filename_rank(history))
+
+
+def _upper_pairs(product: sparse.csr_array, rank: numpy.ndarray) -> sparse.coo_array:
+    product = product.tocsr()
+    product.sort_indices()
+    product = product.tocoo()
+    upper = rank[product.row] < rank[product.col]
+    return sparse.coo_array((product.data[upper], (product.row[upper], product.col[upper])),
+                            shape=product.shape)
+
+
+def cochange_products(commits_by_file: sparse.csr_array, files_by_commit: sparse.csr_array,
+                      weighted: sparse.csr_array, jobs: int = 1) -> tuple[sparse.csr_array, sparse.csr_array]:
+    """
+    XᵀX and XᵀWX, given Xᵀ, X and WX, computed by `jobs` processes.
+    """
+    if jobs <= 1 or commits_by_file.shape[0] < 2:
+        return commits_by_file @ files_by_commit, commits_by_file @ weighted
+    # blocks of rows with about the same number of products to add up
+    work = numpy.cumsum(commits_by_file @ numpy.diff(files_by_commit.indptr))
+    cuts = numpy.searchsorted(work, numpy.linspace(0, work[-1], 4 * jobs + 1)[1:-1], side="right")
+    bounds = numpy.unique(numpy.concatenate([[0], cuts, [commits_by_file.shape[0]]]))
+    arrays = {
+        "rows_indptr": commits_by_file.indptr, "rows_indices": commits_by_file.indices,
+        "indptr": files_by_commit.indptr, "indices": files_by_commit.indices, "weights": weighted.data,
+    }
+    with _SharedArrays(arrays) as shared, multiprocessing.Pool(
+            jobs, initializer=_start_product_worker, initargs=(shared.specs, files_by_commit.shape)) as pool:
+        blocks = pool.starmap(_multiply_rows, zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+    return _stack_blocks([counts for counts, _ in blocks]), _stack_blocks([strengths for _, strengths in blocks])
+
+
+def _stack_blocks(blocks: list[sparse.csr_array]) -> sparse.csr_array:
+    # a tree of pairwise merges, in block order
+    while len(blocks) > 1:
+        blocks = [sparse.vstack(blocks[index:index + 2], format="csr") for index in range(0, len(blocks), 2)]
+    return blocks[0]
+
+
+class _SharedArrays:
+    """
+    Copies of some arrays in shared memory, for the life of a `with` block;
+    specs holds what a worker needs to map them.
+    """
+
+    def __init__(self, arrays: dict[str, numpy.ndarray]):
+        self.blocks = []
+        self.specs = {}
+        for name, array in arrays.items():
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            self.blocks.append(block)
+            numpy.ndarray(array.shape, array.dtype, buffer=block.buf)[:] = array
+            self.specs[name] = (block.name, array.dtype.str, array.shape)
+
+    def __enter__(self) -> "_SharedArrays":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+
+_product_worker = {}
+
+
+def _start_product_worker(specs: dict[str, tuple[str, str, tuple[int, ...]]], shape: tuple[int, int]) -> None:
+    blocks = {name: shared_memory.SharedMemory(name=block_name) for name, (block_name, _, _) in specs.items()}
+    arrays = {name: numpy.ndarray(array_shape, dtype, buffer=blocks[name].buf)
+              for name, (_, dtype, array_shape) in specs.items()}
+    _product_worker["blocks"] = blocks
+    _product_worker["files_by_commit"] = sparse.csr_array(
+        (numpy.ones(len(arrays["indices"]), dtype=numpy.int64), arrays["indices"], arrays["indptr"]), shape=shape)
+    _product_worker["weighted"] = sparse.csr_array(
+        (arrays["weights"], arrays["indices"], arrays["indptr"]), shape=shape)
+    _product_worker["rows_indptr"] = arrays["rows_indptr"]
+    _product_worker["rows_indices"] = arrays["rows_indices"]
+
+
+def _multiply_rows(start: int, stop: int) -> tuple[sparse.csr_array, sparse.csr_array]:
+    indptr = _product_worker["rows_indptr"][start:stop + 1]
+    commits = _product_worker["rows_indices"][indptr[0]:indptr[-1]]
+    files_by_commit = _product_worker["files_by_commit"]
+    rows = sparse.csr_array((numpy.ones(len(commits), dtype=numpy.int64), commits, indptr - indptr[0]),
+                            shape=(stop - start, files_by_commit.shape[0]))
+    return rows @ files_by_commit, rows @ _product_worker["weighted"]
+
+
+def filename_rank(history: HistoryStore) -> numpy.ndarray:
+    """
+    Each file id's position in filename order.
+    """
+    names = numpy.array(history.filenames.tolist(), dtype=object)
+    rank = numpy.empty(len(names), dtype=numpy.int64)
+    rank[numpy.argsort(names, kind="stable")] = numpy.arange(len(names))
+    return rank
+
+
+def pair_mapping(matrix: sparse.coo_array, filenames: Sequence[str]) -> dict[tuple[str, str], int | float]:
+    names = list(filenames)
+    return {
+        (names[first], names[second]): value
+        for first, second, value in zip(matrix.row.tolist(), matrix.col.tolist(), matrix.data.tolist())
+    }
+
+
+def pair_counts(history: HistoryStore) -> dict[tuple[str, str], int]:
+    return pair_mapping(cochange_matrix(history), history.filenames)
+
+
+def pair_strengths(history: HistoryStore) -> dict[tuple[str, str], float]:
+    return pair_mapping(cochange_matrix(history, weighted=True), history.filenames)
+
+
+def iter_pair_chunks(history: HistoryStore, rank: numpy.ndarray,
+                     chunk_pairs: int = CHUNK_PAIRS) -> Iterator[tuple[numpy.ndarray, numpy.ndarray]]:
+    """
+    Every pair each commit makes, as (keys, commits) in commit order, about
+    chunk_pairs at a time. A key is first * files + second, with the file
+    sorting first by name first; commits holds the index of the commit
+    each pair came from.
+    """
+    file_ids = numpy.asarray(history.file_ids, dtype=numpy.int64)
+    offsets = numpy.asarray(history.commit_offsets)
+    commit_of_change = history.change_commit_ids()
+    ends = offsets[1:][commit_of_change]
+    partners = ends - numpy.arange(len(file_ids)) - 1
+    boundaries = numpy.cumsum(partners)
+    files = len(history.filenames)
+    start = 0
+    while start < len(file_ids):
+        reached = boundaries[start - 1] if start else 0
+        stop = max(int(numpy.searchsorted(boundaries, reached + chunk_pairs, side="right")), start + 1)
+        changes = numpy.arange(start, stop)
+        lengths = partners[changes]
+        total = int(lengths.sum())
+        if total:
+            firsts = numpy.repeat(changes, lengths)
+            seconds = firsts + 1 + numpy.arange(total) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+            first, second = file_ids[firsts], file_ids[seconds]
+            swap = rank[first] > rank[second]
+            first, second = numpy.where(swap, second, first), numpy.where(swap, first, second)
+            yield first * files + second, commit_of_change[firsts]
+        start = stop
+
+
+def order_of_first_cochange(history: HistoryStore, pairs: Iterable[tuple[int, int]],
+                            chunk_pairs: int = CHUNK_PAIRS) -> list[int]:
+    """
+    The pairs (of file ids), as indices into the list given, in the
+    order a commit-by-commit loop over combinations() would first meet
+    them, which is the order iter_pair_chunks makes them in. Only as much
+    of the history as it takes to meet them all is read.
+    """
+    pairs = numpy.asarray(list(pairs), dtype=numpy.int64).reshape(-1, 2)
+    rank = filename_rank(history)
+    files = len(history.filenames)
+    swap = rank[pairs[:, 0]] > rank[pairs[:, 1]]
+    keys = numpy.where(swap, pairs[:, 1], pairs[:, 0]) * files + numpy.where(swap, pairs[:, 0], pairs[:, 1])
+    by_key = numpy.argsort(keys, kind="stable")
+    sorted_keys = keys[by_key]
+    first_met = numpy.full(len(keys), numpy.iinfo(numpy.int64).max)
+    made = 0
+    for chunk_keys, _ in iter_pair_chunks(history, rank, chunk_pairs):
+        positions = numpy.searchsorted(sorted_keys, chunk_keys)
+        found = numpy.flatnonzero(positions < len(sorted_keys))
+        found = found[sorted_keys[positions[found]] == chunk_keys[found]]
+        # the earliest index in the stream wins, so scatter from the end
+        first_met[positions[found[::-1]]] = numpy.minimum(first_met[positions[found[::-1]]], made + found[::-1])
+        made += len(chunk_keys)
+        if (first_met < numpy.iinfo(numpy.int64).max).all():
+            break
+    order = numpy.empty(len(keys), dtype=numpy.int64)
+    order[by_key] = first_met
+    return numpy.argsort(order, kind="stable").tolist()
+
+
+MEGA_COMMIT_SIZE = 100
+SAMPLE_SIZE = 20
+
+
+class MegaCommitPolicy(NamedTuple):
+    """
+    What to do with commits of more than max_files files:
+        keep      pair all their files, as for any other commit
+        skip      make no pairs from them
+        sample    pair only sample_size of their files, picked at random
+                  (seeded by the commit's hash), each pair still at 1/k
+        collapse  pair their directories ("src/app/") instead of their files,
+                  as a commit of those directories; skipped if that is
+                  still more than max_files
+    """
+    action: MegaCommitAction = MegaCommitAction.keep
+    max_files: int = MEGA_COMMIT_SIZE
+    sample_size: int = SAMPLE_SIZE
+
+
+class MegaCommitReport(NamedTuple):
+    """
+    How much pairing work the policy saved, and what it cost.
+
+    skipped_strength is the total strength of the pairs left out, summed
+    exactly; skipped_by_file[f] is the part of it that involved file f.
+    The exact strength of a pair (a, b) is at least the computed one and
+    at most that plus min(skipped_by_file[a], skipped_by_file[b]).
+    """
+    commits: int
+    possible_pairs: int
+    generated_pairs: int
+    skipped_strength: float
+    skipped_by_file: numpy.ndarray
+
+    @property
+    def avoided_pairs(self) -> int:
+        return self.possible_pairs - self.generated_pairs
+
+    def error_bound(self, first: Optional[int], second: Optional[int]) -> float:
+        if first is None or second is None:
+            return 0.0
+        return float(min(self.skipped_by_file[first], self.skipped_by_file[second]))
+
+    def describe(self, policy: MegaCommitPolicy) -> str:
+        return (f"Mega-commits (over {policy.max_files} files, {policy.action}): {self.commits}, "
+                f"{self.avoided_pairs:,} of {self.possible_pairs:,} pairs avoided, "
+                f"strength left out {self.skipped_strength:.3f}")
+
+
+def apply_mega_commit_policy(history: HistoryStore, policy: MegaCommitPolicy
+                             ) -> tuple[HistoryStore, numpy.ndarray, MegaCommitReport]:
+    """
+    The history to make pairs from, the weight each of its commits gives
+    its pairs, and the report of what was left out.
+    """
+    sizes = history.sizes
+    weights = 1.0 / numpy.maximum(sizes, 1)
+    mega_commits = numpy.flatnonzero(sizes > policy.max_files)
+    skipped_by_file = numpy.zeros(len(history.filenames))
+    if policy.action == MegaCommitAction.keep or not len(mega_commits):
+        pairs = int((sizes[mega_commits] * (sizes[mega_commits] - 1) // 2).sum())
+        return history, weights, MegaCommitReport(len(mega_commits), pairs, pairs, 0.0, skipped_by_file)
+
+    filenames = history.filenames.tolist()
+    directory_ids: dict[str, int] = {}
+    new_sizes = sizes.copy()
+    pieces = []
+    possible_pairs = generated_pairs = 0
+    skipped_strength = 0.0
+    previous_end = 0
+    for index in mega_commits.tolist():
+        start, end = int(history.commit_offsets[index]), int(history.commit_offsets[index + 1])
+        pieces.append(history.file_ids[previous_end:start])
+        previous_end = end
+        files = numpy.asarray(history.file_ids[start:end])
+        size = len(files)
+        kept = numpy.zeros(0, dtype=numpy.int32)
+        if policy.action == MegaCommitAction.sample:
+            generator = numpy.random.default_rng(int(history.hashes[index][:16] or "0", 16))
+            chosen = numpy.sort(generator.choice(size, min(policy.sample_size, size), replace=False))
+            kept = files[chosen]
+        elif policy.action == MegaCommitAction.collapse:
+            directories = sorted({_directory_of(filenames[file_id]) for file_id in files.tolist()})
+            if len(directories) <= policy.max_files:
+                kept = numpy.array([directory_ids.setdefault(name, len(filenames) + len(directory_ids))
+                                    for name in directories], dtype=numpy.int32)
+                weights[index] = 1.0 / len(kept)
+        pieces.append(kept)
+        new_sizes[index] = len(kept)
+        commit_pairs = size * (size - 1) // 2
+        kept_pairs = len(kept) * (len(kept) - 1) // 2
+        possible_pairs += commit_pairs
+        generated_pairs += kept_pairs
+        # the file pairs of a collapsed commit are all left out
+        left_out = commit_pairs - (kept_pairs if policy.action == MegaCommitAction.sample else 0)
+        skipped_strength += left_out / size
+        skipped_by_file[files] += 1.0 / size
+    pieces.append(history.file_ids[previous_end:])
+
+    names = history.filenames
+    if directory_ids:
+        names = StringColumn.from_strings([*filenames, *directory_ids])
+        skipped_by_file = numpy.concatenate([skipped_by_file, numpy.zeros(len(directory_ids))])
+    pair_history = history.with_files(new_sizes, numpy.concatenate(pieces), names)
+    report = MegaCommitReport(len(mega_commits), possible_pairs, generated_pairs, skipped_strength,
+                              skipped_by_file)
+    return pair_history, weights, report
+
+
+def _directory_of(filename: str) -> str:
+    return (os.path.dirname(filename) or ".") + "/"
+
+
+class CoChangeAnalysis:
+    """
+    Pair counts, pair strengths, each file's neighbors and degree, and the
+    mega-commits, all from one read of the history.
+
+    The incidence matrix is built once; the counts and the strengths are
+    two products over it with the same sparsity, so their entries line up:
+    counts.data[i] and strengths.data[i] belong to the same pair.
+
+    The mega-commit policy is applied first (see MegaCommitPolicy), so
+    `history` is the one pairs were made from; `source` is the one given.
+    With jobs > 1 the products are shared out (see cochange_products).
+    """
+
+    def __init__(self, history: HistoryStore, policy: MegaCommitPolicy = MegaCommitPolicy(), jobs: int = 1):
+        self.source = history
+        self.policy = policy
+        history, weights, self.mega_commit_report = apply_mega_commit_policy(history, policy)
+        self.history = history
+        self.filenames = history.filenames.tolist()
+        self.rank = filename_rank(history)
+        files_by_commit = incidence_matrix(history)
+        self.commits_by_file = files_by_commit.T.tocsr()
+        weighted = sparse.csr_array((numpy.repeat(weights, history.sizes), files_by_commit.indices,
+                                     files_by_commit.indptr), shape=files_by_commit.shape)
+        counts, strengths = cochange_products(self.commits_by_file, files_by_commit, weighted, jobs)
+        self.counts = _upper_pairs(counts, self.rank)
+        self.strengths = _upper_pairs(strengths, self.rank)
+        self.cochange_graph = CoChangeGraph.from_pairs(self.filenames, self.counts.row, self.counts.col,
+                                                       self.strengths.data, self.counts.data, self.rank)
+        self.degrees = self.cochange_graph.degrees
+        self.mega_commits = numpy.flatnonzero(self.source.sizes > policy.max_files)
+
+    def pairs(self) -> Iterator[tuple[str, str]]:
+        names = self.filenames
+        return ((names[first], names[second])
+                for first, second in zip(self.counts.row.tolist(), self.counts.col.tolist()))
+
+    def pair_counts(self) -> dict[tuple[str, str], int]:
+        return dict(zip(self.pairs(), self.counts.data.tolist()))
+
+    def pair_strengths(self) -> dict[tuple[str, str], float]:
+        return dict(zip(self.pairs(), self.strengths.data.tolist()))
+
+    def strongest_pairs(self, limit: Optional[int] = None) -> list[tuple[float, tuple[str, str], int]]:
+        """
+        (strength, pair, count), strongest first, as sorted(..., reverse=True)
+        would order the tuples; only the first `limit` of them are built.
+        """
+        strengths, counts, rank, names = self.strengths, self.counts, self.rank, self.filenames
+        ranked = numpy.lexsort((counts.data, rank[strengths.col], rank[strengths.row],
+                                ranking_strengths(strengths.data)))[::-1]
+        return [(float(strengths.data[index]), (names[strengths.row[index]], names[strengths.col[index]]),
+                 int(counts.data[index]))
+                for index in ranked[:limit]]
+
+    def super_connectors(self, limit: Optional[int] = 20) -> list[tuple[int, str]]:
+        """
+        (number of neighbors, filename) for the files with the most
+        neighbors, as sorted(..., reverse=True) would order them.
+        """
+        return self.cochange_graph.super_connectors(limit)
+
+    def neighbors(self, filename: str) -> list[str]:
+        """
+        The files ever committed with this one, in the order a graph built
+        commit by commit from combinations() would list them.
+        """
+        file_id = self.history.file_id(filename)
+        if file_id is None:
+            return []
+        commits = self.commits_by_file.indices[self.commits_by_file.indptr[file_id]:
+                                               self.commits_by_file.indptr[file_id + 1]]
+        offsets = self.history.commit_offsets
+        # Their files, commit by commit; a neighbor is met at its first appearance
+        met = self.history.file_ids[concatenated_ranges(offsets, commits)]
+        met = met[met != file_id]
+        _, first_seen = numpy.unique(met, return_index=True)
+        return [self.filenames[file_id] for file_id in met[numpy.sort(first_seen)]]
+
+    def graph(self) -> nx.Graph:
+        return self.cochange_graph.to_networkx(weight=None)
+
+    def error_bounds(self, pairs: Sequence[tuple[str, str]]) -> list[float]:
+        """
+        How much the policy may have left out of each pair's strength.
+        """
+        file_id = self.history.file_id
+        return [self.mega_commit_report.error_bound(file_id(first), file_id(second)) for first, second in pairs]
+
+    def list_mega_commits(self) -> Iterator[tuple[int, int, str, datetime, str]]:
+        history = self.source
+        for index in self.mega_commits.tolist():
+            yield index, int(history.sizes[index]), history.hashes[index], history.date_of(index), \
+                history.messages[index]
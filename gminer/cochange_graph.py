@@ -0,0 +1,148 @@
+"""
+The co-change graph as compact CSR arrays.
+
+A networkx.Graph keeps a dict of dicts per file, several hundred bytes
+an edge, to answer what is mostly "how many neighbors" and "which ones".
+CoChangeGraph keeps each file's neighbors as a run of one array over the
+interned file ids, with the pair's strength and count alongside: about
+20 bytes an edge in each direction. to_networkx builds the Graph for the
+rare question that needs one.
+"""
+from typing import Optional, Sequence
+
+import networkx as nx
+import numpy
+from scipy import sparse
+
+# Strengths are sums of 1/len(commit), which come out differently in the
+# last bit depending on the order they were added; pairs are ranked on
+# them rounded to this many places, so such pairs tie and go by name.
+RANK_DECIMALS = 12
+
+
+def ranking_strengths(strengths: numpy.ndarray) -> numpy.ndarray:
+    return numpy.round(strengths, RANK_DECIMALS)
+
+
+class CoChangeGraph:
+    """
+    The neighbors of file f are neighbor_ids[offsets[f]:offsets[f + 1]],
+    in id order; strengths and counts line up with neighbor_ids.
+    """
+
+    def __init__(self, filenames: Sequence[str], offsets: numpy.ndarray, neighbor_ids: numpy.ndarray,
+                 strengths: numpy.ndarray, counts: numpy.ndarray, rank: Optional[numpy.ndarray] = None):
+        self.filenames = filenames
+        self.offsets = offsets
+        self.neighbor_ids = neighbor_ids
+        self.strengths = strengths
+        self.counts = counts
+        self._rank = rank
+        self._file_ids: Optional[dict[str, int]] = None
+
+    @classmethod
+    def from_pairs(cls, filenames: Sequence[str], firsts: numpy.ndarray, seconds: numpy.ndarray,
+                   strengths: numpy.ndarray, counts: numpy.ndarray,
+                   rank: Optional[numpy.ndarray] = None) -> "CoChangeGraph":
+        """
+        The graph of pairs (first, second) of file ids, each listed once.
+        """
+        files = len(filenames)
+        rows, columns = numpy.concatenate([firsts, seconds]), numpy.concatenate([seconds, firsts])
+
+        def both_ways(values: numpy.ndarray) -> sparse.csr_array:
+            matrix = sparse.csr_array((numpy.concatenate([values, values]), (rows, columns)), shape=(files, files))
+            matrix.sort_indices()
+            return matrix
+
+        by_strength, by_count = both_ways(strengths), both_ways(counts)
+        return cls(filenames, by_strength.indptr.astype(numpy.int64), by_strength.indices.astype(numpy.int32),
+                   by_strength.data.astype(numpy.float64), by_count.data.astype(numpy.int64), rank)
+
+    @property
+    def rank(self) -> numpy.ndarray:
+        """
+        Each file id's position in filename order, for breaking ties.
+        """
+        if self._rank is None:
+            names = numpy.array(list(self.filenames), dtype=object)
+            self._rank = numpy.empty(len(names), dtype=numpy.int64)
+            self._rank[numpy.argsort(names, kind="stable")] = numpy.arange(len(names))
+        return self._rank
+
+    def file_id(self, filename: str) -> Optional[int]:
+        if self._file_ids is None:
+            self._file_ids = {name: file_id for file_id, name in enumerate(self.filenames)}
+        return self._file_ids.get(filename)
+
+    @property
+    def degrees(self) -> numpy.ndarray:
+        return numpy.diff(self.offsets)
+
+    @property
+    def weighted_degrees(self) -> numpy.ndarray:
+        """
+        The sum of the strengths of each file's pairs.
+        """
+        return numpy.bincount(self._rows(), self.strengths, len(self.offsets) - 1)
+
+    def _rows(self) -> numpy.ndarray:
+        return numpy.repeat(numpy.arange(len(self.offsets) - 1), self.degrees)
+
+    @property
+    def nbytes(self) -> int:
+        return self.offsets.nbytes + self.neighbor_ids.nbytes + self.strengths.nbytes + self.counts.nbytes
+
+    def neighbors(self, filename: str) -> list[str]:
+        """
+        The files ever committed with this one, in id order.
+        """
+        file_id = self.file_id(filename)
+        if file_id is None:
+            return []
+        return [self.filenames[neighbor] for neighbor in
+                self.neighbor_ids[self.offsets[file_id]:self.offsets[file_id + 1]].tolist()]
+
+    def top_neighbors(self, filename: str, limit: Optional[int] = 10) -> list[tuple[float, str, int]]:
+        """
+        (strength, neighbor, count) for the file's strongest pairs, as
+        sorted(..., reverse=True) would order them.
+        """
+        file_id = self.file_id(filename)
+        if file_id is None:
+            return []
+        run = slice(self.offsets[file_id], self.offsets[file_id + 1])
+        neighbors, strengths, counts = self.neighbor_ids[run], self.strengths[run], self.counts[run]
+        ranked = numpy.lexsort((counts, self.rank[neighbors], ranking_strengths(strengths)))[::-1][:limit]
+        return [(float(strengths[index]), self.filenames[neighbors[index]], int(counts[index]))
+                for index in ranked.tolist()]
+
+    def super_connectors(self, limit: Optional[int] = 20, weighted: bool = False) -> list[tuple[int | float, str]]:
+        """
+        (number of neighbors, filename) for the files with the most
+        neighbors, as sorted(..., reverse=True) would order them;
+        weighted, (sum of strengths, filename) instead.
+        """
+        degrees = self.weighted_degrees if weighted else self.degrees
+        connected = numpy.flatnonzero(self.degrees)
+        ranked = connected[numpy.lexsort((self.rank[connected], degrees[connected]))[::-1]]
+        return [(degrees[file_id].item(), self.filenames[file_id]) for file_id in ranked[:limit].tolist()]
+
+    def to_networkx(self, weight: Optional[str] = "weight") -> nx.Graph:
+        """
+        The same graph as a networkx.Graph, each edge carrying the pair's
+        strength as `weight` and its `count`; weight=None leaves the
+        attributes off.
+        """
+        rows = self._rows()
+        upper = numpy.flatnonzero(rows < self.neighbor_ids)
+        names = self.filenames
+        graph = nx.Graph()
+        firsts, seconds = rows[upper].tolist(), self.neighbor_ids[upper].tolist()
+        if weight is None:
+            graph.add_edges_from((names[first], names[second]) for first, second in zip(firsts, seconds))
+        else:
+            graph.add_edges_from((names[first], names[second], {weight: strength, "count": count})
+                                 for first, second, strength, count
+                                 in zip(firsts, seconds, self.strengths[upper].tolist(), self.counts[upper].tolist()))
+        return graph
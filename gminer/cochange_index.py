@@ -0,0 +1,202 @@
+"""
+A persisted co-change index that keeps up with a growing extract.
+
+The index holds what strongest-pairs and tightest-groupings need about
+the whole history: the strength and count of every pair, each file's
+commit count, and the pairs already ranked strongest first. It is kept in
+a directory of .npy files next to the extract (for history.json,
+history.json.gminer-cochange) and records how many commits it absorbed
+and a digest of them: their hashes, the files each changed and the lines
+changed (HistoryStore.digest_of_last).
+
+update_extract puts new commits in front of the ones already extracted,
+so when the extract still ends with the commits the index absorbed, only
+the ones in front of them are folded in. Anything else rebuilds the index
+from scratch: a rewritten extract, and also one extracted again with
+other filters, whose commits have the same hashes but not the same files.
+
+Folded-in strengths are added to the stored sums rather than summed in
+extract order, so they can differ from a full recount in the last bit.
+Pairs are ranked on their strengths rounded to RANK_DECIMALS places, as
+everywhere else, so that last bit never changes the order they come in.
+"""
+import json
+import os
+from typing import NamedTuple, Optional
+
+import numpy
+
+from gminer.cochange import cochange_matrix
+from gminer.cochange_graph import CoChangeGraph, ranking_strengths
+from gminer.history_store import HistoryStore, StringColumn, load_history, replace_directory
+
+INDEX_SUFFIX = ".gminer-cochange"
+INDEX_VERSION = 3
+INDEX_METADATA = "index.json"
+
+
+class CoChangeIndex:
+    """
+    Pairs (first, second) are ids into filenames, with first's name sorting
+    before second's; `ranked` lists them strongest first, as
+    sorted(..., reverse=True) orders (strength, pair, count).
+    """
+    ARRAYS = ["firsts", "seconds", "strengths", "counts", "ranked", "file_commit_counts"]
+
+    def __init__(self, *, filenames: StringColumn, firsts: numpy.ndarray, seconds: numpy.ndarray,
+                 strengths: numpy.ndarray, counts: numpy.ndarray, file_commit_counts: numpy.ndarray,
+                 commits: int, digest: str, ranked: Optional[numpy.ndarray] = None):
+        self.filenames = filenames
+        self.firsts = firsts
+        self.seconds = seconds
+        self.strengths = strengths
+        self.counts = counts
+        self.file_commit_counts = file_commit_counts
+        self.commits = commits
+        self.digest = digest
+        self.ranked = ranked if ranked is not None else self._rank()
+
+    @classmethod
+    def build(cls, history: HistoryStore) -> "CoChangeIndex":
+        firsts, seconds, strengths, counts = _pairs_of(history)
+        return cls(filenames=history.filenames, firsts=firsts, seconds=seconds, strengths=strengths, counts=counts,
+                   file_commit_counts=history.file_commit_counts(), commits=len(history),
+                   digest=history.digest_of_last(len(history)))
+
+    def absorb(self, extract: HistoryStore, added: int) -> "CoChangeIndex":
+        """
+        The index with the first `added` commits of extract (the whole
+        extract, ending with the commits absorbed so far) folded in.
+        """
+        if not added:
+            return self
+        history = extract.select(numpy.arange(added))
+        names = self.filenames.tolist()
+        known = {name: file_id for file_id, name in enumerate(names)}
+        new_names = [name for name in history.filenames if name not in known]
+        for name in new_names:
+            known[name] = len(known)
+        file_ids = numpy.array([known[name] for name in history.filenames], dtype=numpy.int64)
+        files = len(known)
+
+        firsts, seconds, strengths, counts = _pairs_of(history)
+        keys, inverse = numpy.unique(numpy.concatenate([
+            self.firsts.astype(numpy.int64) * files + self.seconds,
+            file_ids[firsts] * files + file_ids[seconds],
+        ]), return_inverse=True)
+        file_commit_counts = numpy.concatenate([self.file_commit_counts, numpy.zeros(len(new_names), numpy.int64)])
+        numpy.add.at(file_commit_counts, file_ids, history.file_commit_counts())
+        return CoChangeIndex(
+            filenames=StringColumn.from_strings([*names, *new_names]) if new_names else self.filenames,
+            firsts=(keys // files).astype(numpy.int32),
+            seconds=(keys % files).astype(numpy.int32),
+            strengths=numpy.bincount(inverse, numpy.concatenate([self.strengths, strengths]), len(keys)),
+            counts=numpy.bincount(inverse, numpy.concatenate([self.counts, counts]), len(keys)).astype(numpy.int64),
+            file_commit_counts=file_commit_counts,
+            commits=self.commits + added,
+            digest=extract.digest_of_last(self.commits + added),
+        )
+
+    def _rank(self) -> numpy.ndarray:
+        names = numpy.array(self.filenames.tolist(), dtype=object)
+        rank = numpy.empty(len(names), dtype=numpy.int64)
+        rank[numpy.argsort(names, kind="stable")] = numpy.arange(len(names))
+        return numpy.lexsort((self.counts, rank[self.seconds], rank[self.firsts],
+                              ranking_strengths(self.strengths)))[::-1].copy()
+
+    def strongest_pairs(self, limit: Optional[int] = None) -> list[tuple[float, tuple[str, str], int]]:
+        names = self.filenames
+        return [(float(self.strengths[index]), (names[self.firsts[index]], names[self.seconds[index]]),
+                 int(self.counts[index]))
+                for index in self.ranked[:limit].tolist()]
+
+    def pair_strengths(self) -> dict[tuple[str, str], float]:
+        names = self.filenames.tolist()
+        return {(names[first], names[second]): strength for first, second, strength
+                in zip(self.firsts.tolist(), self.seconds.tolist(), self.strengths.tolist())}
+
+    def pair_counts(self) -> dict[tuple[str, str], int]:
+        names = self.filenames.tolist()
+        return {(names[first], names[second]): count for first, second, count
+                in zip(self.firsts.tolist(), self.seconds.tolist(), self.counts.tolist())}
+
+    def graph(self) -> CoChangeGraph:
+        return CoChangeGraph.from_pairs(self.filenames.tolist(), self.firsts, self.seconds, self.strengths, self.counts)
+
+    def commit_counts(self) -> dict[str, int]:
+        return dict(zip(self.filenames.tolist(), self.file_commit_counts.tolist()))
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        for name in self.ARRAYS:
+            numpy.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        numpy.save(os.path.join(directory, "filenames.data.npy"), self.filenames.data)
+        numpy.save(os.path.join(directory, "filenames.offsets.npy"), self.filenames.offsets)
+        with open(os.path.join(directory, INDEX_METADATA), "w") as out:
+            json.dump(dict(version=INDEX_VERSION, commits=self.commits, digest=self.digest), out)
+
+    @classmethod
+    def open(cls, directory: str) -> Optional["CoChangeIndex"]:
+        """
+        The index saved in directory, memory-mapped; None if there isn't
+        one of this version, or it was replaced while it was being opened.
+        """
+        try:
+            with open(os.path.join(directory, INDEX_METADATA)) as source:
+                metadata = json.load(source)
+        except (OSError, ValueError):
+            return None
+        if metadata.get("version") != INDEX_VERSION:
+            return None
+
+        def mapped(filename: str) -> numpy.ndarray:
+            return numpy.load(os.path.join(directory, filename), mmap_mode="r")
+
+        try:
+            return cls(filenames=StringColumn(mapped("filenames.data.npy"), mapped("filenames.offsets.npy")),
+                       **{name: mapped(f"{name}.npy") for name in cls.ARRAYS},
+                       commits=metadata["commits"], digest=metadata["digest"])
+        except (OSError, ValueError):
+            return None  # swapped out by another process as it was opened (see replace_directory)
+
+
+class IndexUpdate(NamedTuple):
+    index: CoChangeIndex
+    history: HistoryStore
+    added: int
+    rebuilt: bool
+
+
+def index_path(path: str) -> str:
+    return os.path.abspath(path).rstrip(os.sep) + INDEX_SUFFIX
+
+
+def load_cochange_index(path: str, rebuild: bool = False) -> IndexUpdate:
+    """
+    The extract's co-change index, brought up to date and saved: commits
+    added in front of the ones it absorbed are folded in, and if the
+    extract no longer ends with those, or rebuild is asked for, it's
+    built again. The history loaded to check it comes back too.
+    """
+    history = load_history(path)
+    location = index_path(path)
+    index = None if rebuild else CoChangeIndex.open(location)
+    added = len(history) - index.commits if index else -1
+    if index and added >= 0 and history.ends_with(index.commits, index.digest):
+        if not added:
+            return IndexUpdate(index, history, 0, False)
+        index = index.absorb(history, added)
+        rebuilt = False
+    else:
+        index = CoChangeIndex.build(history)
+        added = len(history)
+        rebuilt = True
+    replace_directory(location, index.save)
+    return IndexUpdate(index, history, added, rebuilt)
+
+
+def _pairs_of(history: HistoryStore) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    counts = cochange_matrix(history)
+    strengths = cochange_matrix(history, weighted=True)
+    return (counts.row.astype(numpy.int32), counts.col.astype(numpy.int32), strengths.data,
+            counts.data.astype(numpy.int64))
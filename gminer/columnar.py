@@ -0,0 +1,208 @@
+"""
+Columnar (Parquet) extracts.
+
+A columnar extract is a directory, conventionally named *.parquet,
+holding two tables:
+
+    commits.parquet       one row per commit: commit_id, hash, author,
+                          coauthors, date, timestamp, message and the totals
+    file_changes.parquet  one row per file in a commit: commit_id, file_id,
+                          filename, insertions, deletions, lines, change_type
+
+commit_id is the commit's position in the extract (newest first, as in
+the JSON extracts) and file_id numbers filenames in order of first
+appearance. The filename column is dictionary-encoded, so each path is
+stored once however often it was committed.
+
+Analyses can work on the file_changes table directly instead of looping
+over the lists of dicts in a GitHistoryDataframe's files column.
+"""
+import json
+import os
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Iterable, Iterator, Optional, Sequence
+
+import numpy
+import pandas
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError as error:
+    raise ImportError("Parquet extracts need the 'pyarrow' package installed") from error
+
+from gminer.types import GitHistoryDataframe
+from gminer.utility import HISTORY_COLUMNS, history_frame_from_records, with_parsed_dates
+
+COMMITS_TABLE = "commits.parquet"
+FILE_CHANGES_TABLE = "file_changes.parquet"
+BATCH_SIZE = 10_000
+
+TOTALS = ["insertions", "deletions", "lines", "files"]
+CHANGES = ["insertions", "deletions", "lines"]
+
+COMMITS_SCHEMA = pa.schema([
+    ("commit_id", pa.int32()),
+    ("hash", pa.string()),
+    ("author", pa.string()),
+    ("coauthors", pa.list_(pa.string())),
+    ("date", pa.string()),
+    ("timestamp", pa.timestamp("us", tz="UTC")),
+    ("message", pa.string()),
+    ("insertions", pa.int64()),
+    ("deletions", pa.int64()),
+    ("lines", pa.int64()),
+    ("files", pa.int32()),
+])
+
+FILE_CHANGES_SCHEMA = pa.schema([
+    ("commit_id", pa.int32()),
+    ("file_id", pa.int32()),
+    ("filename", pa.string()),
+    ("insertions", pa.int64()),
+    ("deletions", pa.int64()),
+    ("lines", pa.int64()),
+    ("change_type", pa.string()),
+])
+
+
+def table_paths(path: str) -> tuple[str, str]:
+    return os.path.join(path, COMMITS_TABLE), os.path.join(path, FILE_CHANGES_TABLE)
+
+
+def write_columnar_extract(records: Iterable[dict], path: str) -> int:
+    """
+    Write commit records (as produced by the extractor) a batch at a time.
+    @return: the number of commits written
+    """
+    os.makedirs(path, exist_ok=True)
+    commits_path, changes_path = table_paths(path)
+    file_ids: dict[str, int] = {}
+    count = 0
+    records = iter(records)
+    with (pq.ParquetWriter(commits_path, COMMITS_SCHEMA) as commits_out,
+          pq.ParquetWriter(changes_path, FILE_CHANGES_SCHEMA) as changes_out):
+        # Always write a row group, so that an empty extract still has its schema
+        batch = list(islice(records, BATCH_SIZE))
+        while True:
+            commits, changes = _batch_tables(batch, count, file_ids)
+            commits_out.write_table(commits)
+            changes_out.write_table(changes)
+            count += len(batch)
+            batch = list(islice(records, BATCH_SIZE))
+            if not batch:
+                break
+    return count
+
+
+def _batch_tables(batch: list[dict], first_id: int, file_ids: dict[str, int]) -> tuple["pa.Table", "pa.Table"]:
+    commit_columns = {name: [] for name in COMMITS_SCHEMA.names}
+    change_columns = {name: [] for name in FILE_CHANGES_SCHEMA.names}
+    for commit_id, record in enumerate(batch, start=first_id):
+        commit_columns["commit_id"].append(commit_id)
+        for name in ["hash", "author", "coauthors", "date", "message"]:
+            commit_columns[name].append(record[name])
+        commit_columns["timestamp"].append(datetime.fromisoformat(record["date"]).astimezone(timezone.utc))
+        for name in TOTALS:
+            commit_columns[name].append(record["totals"][name])
+        for change in record["files"]:
+            filename = change["filename"]
+            change_columns["commit_id"].append(commit_id)
+            change_columns["file_id"].append(file_ids.setdefault(filename, len(file_ids)))
+            change_columns["filename"].append(filename)
+            for name in CHANGES:
+                change_columns[name].append(change[name])
+            change_columns["change_type"].append(change.get("change_type"))
+    return (pa.table(commit_columns, schema=COMMITS_SCHEMA),
+            pa.table(change_columns, schema=FILE_CHANGES_SCHEMA))
+
+
+def read_commits(path: str, columns: Optional[Sequence[str]] = None) -> pandas.DataFrame:
+    commits_path, _ = table_paths(path)
+    return pq.read_table(commits_path, columns=columns).to_pandas()
+
+
+def read_file_changes(path: str, columns: Optional[Sequence[str]] = None) -> pandas.DataFrame:
+    """
+    The exploded file-change table; filename (when asked for) is a categorical.
+    """
+    _, changes_path = table_paths(path)
+    return pq.read_table(changes_path, columns=columns,
+                         read_dictionary=["filename", "change_type"]).to_pandas()
+
+
+def iter_columnar_records(path: str) -> Iterator[dict]:
+    """
+    Rebuild the extractor's records, a batch of commits at a time.
+    """
+    commits_path, changes_path = table_paths(path)
+    changes = _iter_change_rows(pq.ParquetFile(changes_path))
+    pending = next(changes, None)
+    for batch in pq.ParquetFile(commits_path).iter_batches(batch_size=BATCH_SIZE):
+        for commit in batch.to_pylist():
+            files = []
+            while pending is not None and pending["commit_id"] == commit["commit_id"]:
+                files.append(_file_entry(pending))
+                pending = next(changes, None)
+            yield dict(
+                hash=commit["hash"],
+                author=commit["author"],
+                coauthors=commit["coauthors"],
+                date=commit["date"],
+                message=commit["message"],
+                files=files,
+                totals={name: commit[name] for name in TOTALS}
+            )
+
+
+def _iter_change_rows(changes_file: "pq.ParquetFile") -> Iterator[dict]:
+    for batch in changes_file.iter_batches(batch_size=BATCH_SIZE):
+        yield from batch.to_pylist()
+
+
+def _file_entry(change: dict) -> dict:
+    entry = {"filename": change["filename"], **{name: change[name] for name in CHANGES}}
+    if change["change_type"] is not None:
+        entry["change_type"] = change["change_type"]
+    return entry
+
+
+def read_columnar_history(path: str) -> GitHistoryDataframe:
+    """
+    The GitHistoryDataframe of the extract, built column by column: each
+    table is read whole, and the file entries are cut into commits at the
+    offsets of their commit_ids, which are in commit order.
+    """
+    commits_path, changes_path = table_paths(path)
+    commits = pq.read_table(commits_path, columns=["hash", "author", "coauthors", "date", "message", *TOTALS])
+    changes = pq.read_table(changes_path, columns=["commit_id", "filename", *CHANGES, "change_type"])
+    filenames, insertions, deletions, lines, change_types = (
+        changes.column(name).to_pylist() for name in ["filename", *CHANGES, "change_type"])
+    entries = [{"filename": filename, "insertions": inserted, "deletions": deleted, "lines": changed}
+               for filename, inserted, deleted, changed in zip(filenames, insertions, deletions, lines)]
+    for entry, change_type in zip(entries, change_types):
+        if change_type is not None:
+            entry["change_type"] = change_type
+    ends = numpy.cumsum(numpy.bincount(changes.column("commit_id").to_numpy(), minlength=len(commits))).tolist()
+    starts = [0, *ends[:-1]]
+    totals = zip(*(commits.column(name).to_pylist() for name in TOTALS))
+    return with_parsed_dates(pandas.DataFrame({
+        "hash": commits.column("hash").to_pylist(),
+        "author": commits.column("author").to_pylist(),
+        "coauthors": commits.column("coauthors").to_pylist(),
+        "date": commits.column("date").to_pylist(),
+        "message": commits.column("message").to_pylist(),
+        "files": [entries[start:end] for start, end in zip(starts, ends)],
+        "totals": [dict(zip(TOTALS, values)) for values in totals],
+    }, columns=HISTORY_COLUMNS))
+
+
+def read_columnar_history_in_chunks(path: str, chunk_size: int) -> Iterator[GitHistoryDataframe]:
+    records = iter_columnar_records(path)
+    while batch := list(islice(records, chunk_size)):
+        yield history_frame_from_records(batch)
+
+
+def records_to_texts(path: str) -> Iterator[str]:
+    return (json.dumps(record) for record in iter_columnar_records(path))
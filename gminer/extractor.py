@@ -2,18 +2,37 @@
 Extract early git repo to JSON for analysis in early document database
 """
 import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+from collections import deque
+from contextlib import nullcontext
+from datetime import datetime
+from itertools import chain
+from typing import ContextManager, Iterable, Optional, Sequence, TextIO
 
 import typer
 from git import Repo, Commit
 
+from gminer.git_log import iter_commit_records, is_ancestor, path_arguments, rev_list
+from gminer.stats_cache import CommitStatsCache, fill_stats
+from gminer.types import ExtractEngine, ExtractFormat
+from gminer.utility import iter_record_texts, open_extract, compression_of, extract_format, format_for_name
 
-def emit_commit_records_as_json(repository: Repo):
-    for line_number, commit in enumerate(repository.iter_commits()):
-        original_files = commit.stats.files
-        normalized_files = [
-            {'filename': filename, **original_files[filename]}
-            for filename in original_files
-        ]
+
+def emit_commit_records_as_json(repository: Repo, commits: Optional[Iterable[Commit]] = None,
+                                cache: Optional[CommitStatsCache] = None):
+    """
+    The original GitPython extraction. Reading commit.stats runs a separate
+    git diff for each commit, so this is slow on long histories; it is
+    kept as a fallback for the git log engine.
+    """
+    if commits is None:
+        commits = repository.iter_commits()
+    for line_number, commit in enumerate(commits):
+        normalized_files, totals = commit_stats_via_gitpython(commit, cache)
         new_record = dict(
             hash=commit.hexsha,
             author=commit.author.name,
@@ -21,28 +40,359 @@ def emit_commit_records_as_json(repository: Repo):
             date=commit.committed_datetime.isoformat(),
             message=commit.message,
             files=normalized_files,
-            totals=commit.stats.total
+            totals=totals
         )
         yield new_record
 
 
-def dump_it(repository: Repo):
+def commit_stats_via_gitpython(commit: Commit, cache: Optional[CommitStatsCache] = None) -> tuple[list[dict], dict]:
+    if cache:
+        cached = cache.get_many([commit.hexsha])
+        if cached:
+            return cached[commit.hexsha]
+    stats = commit.stats
+    original_files = stats.files
+    normalized_files = [
+        {'filename': unquoted_path(filename), **original_files[filename]}
+        for filename in original_files
+    ]
+    if cache:
+        cache.put_many([(commit.hexsha, normalized_files, stats.total)])
+    return normalized_files, stats.total
+
+
+GIT_PATH_ESCAPES = {"a": "\a", "b": "\b", "t": "\t", "n": "\n", "v": "\v", "f": "\f", "r": "\r",
+                    '"': '"', "\\": "\\"}
+
+
+def unquoted_path(path: str) -> str:
+    """
+    The path as git log -z gives it. Without -z, as GitPython runs git
+    diff, git C-quotes paths holding tabs, quotes, backslashes or non-ASCII
+    characters ("caf\\303\\251.txt"), and GitPython passes them on so.
+    """
+    if len(path) < 2 or path[0] != '"' or path[-1] != '"':
+        return path
+    unquoted = bytearray()
+    position, end = 1, len(path) - 1
+    while position < end:
+        character = path[position]
+        if character != "\\":
+            unquoted += character.encode("utf-8")
+            position += 1
+        elif path[position + 1] in "01234567":
+            unquoted.append(int(path[position + 1:position + 4], 8))
+            position += 4
+        else:
+            unquoted += GIT_PATH_ESCAPES[path[position + 1]].encode("utf-8")
+            position += 2
+    return unquoted.decode("utf-8", errors="replace")
+
+
+def emit_commit_records_from_git_log(repository: Repo, revision_args: Sequence[str] = (),
+                                     commits: Optional[Iterable[str]] = None,
+                                     cache: Optional[CommitStatsCache] = None,
+                                     pathspecs: Sequence[str] = ()):
+    return records_from_git_log(repository.git_dir, revision_args, commits, cache, pathspecs)
+
+
+def records_from_git_log(git_dir: str, revision_args: Sequence[str] = (),
+                         commits: Optional[Iterable[str]] = None,
+                         cache: Optional[CommitStatsCache] = None,
+                         pathspecs: Sequence[str] = ()):
+    """
+    The cache holds the stats of whole commits, so it isn't used
+    when pathspecs limit the files.
+    """
+    if not cache or pathspecs:
+        return iter_commit_records(git_dir, revision_args, commits, pathspecs=pathspecs)
+    records = iter_commit_records(git_dir, revision_args, commits, with_stats=False)
+    return fill_stats(git_dir, records, cache)
+
+
+SHARD_SIZE = 2000
+
+_shard_worker = {}
+
+
+def emit_commit_records_in_parallel(repository: Repo, jobs: int, revision_args: Sequence[str] = ("HEAD",),
+                                    use_cache: bool = True, shard_size: int = SHARD_SIZE,
+                                    pathspecs: Sequence[str] = (), commits: Optional[Sequence[str]] = None):
+    """
+    The git log engine's records, in the same order, extracted by a pool
+    of worker processes; or the records of exactly the listed commits.
+
+    git rev-list (which computes no diffs, so it's quick) lists the commits
+    in log order; we cut that list into shards of consecutive commits, have
+    the workers extract them, and hand the shards back in order. Only a few
+    shards per worker are in flight at once, so memory use stays bounded.
+    """
+    hashes = list(commits) if commits is not None else rev_list(repository.git_dir, revision_args)
+    shards = (hashes[start:start + shard_size] for start in range(0, len(hashes), shard_size))
+    cache_dir = repository.common_dir if use_cache and not pathspecs else None
+    with multiprocessing.Pool(jobs, initializer=_start_shard_worker,
+                              initargs=(repository.git_dir, cache_dir, pathspecs)) as pool:
+        pending = deque()
+        for shard in shards:
+            pending.append(pool.apply_async(_extract_shard, (shard,)))
+            if len(pending) >= 2 * jobs:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+def _start_shard_worker(git_dir: str, cache_dir: Optional[str], pathspecs: Sequence[str]) -> None:
+    _shard_worker["git_dir"] = git_dir
+    _shard_worker["cache"] = CommitStatsCache(cache_dir) if cache_dir else None
+    _shard_worker["pathspecs"] = pathspecs
+
+
+def _extract_shard(shard: list[str]) -> list[dict]:
+    return list(records_from_git_log(_shard_worker["git_dir"], commits=shard, cache=_shard_worker["cache"],
+                                     pathspecs=_shard_worker["pathspecs"]))
+
+
+def emit_commit_records(repository: Repo, engine: ExtractEngine = ExtractEngine.log,
+                        revision_args: Sequence[str] = (), commits: Optional[Iterable[str]] = None,
+                        cache: Optional[CommitStatsCache] = None, pathspecs: Sequence[str] = ()):
+    """
+    Records for the history selected by revision_args (all of HEAD by default),
+    or for exactly the listed commit hashes, in the order given.
+
+    With a cache, git only computes the stats of commits that aren't in it.
+    Pathspecs (git log engine only) leave the files they don't match out
+    of the records; commits are never left out.
+    """
+    if engine == ExtractEngine.gitpython:
+        if pathspecs:
+            raise ValueError("Path filters need the git log engine")
+        if commits is not None:
+            selected = (repository.commit(hexsha) for hexsha in commits)
+        else:
+            selected = repository.iter_commits(list(revision_args) or None)
+        return emit_commit_records_as_json(repository, selected, cache)
+    return emit_commit_records_from_git_log(repository, revision_args, commits, cache, pathspecs)
+
+
+def stats_cache_for(repository: Repo, use_cache: bool) -> ContextManager[Optional[CommitStatsCache]]:
+    return CommitStatsCache(repository.common_dir) if use_cache else nullcontext()
+
+
+IGNORE_FILE = ".gminerignore"
+
+
+def read_ignore_file(path: str) -> list[str]:
+    """
+    Exclude patterns, one per line; blank lines and lines starting with # are skipped.
+    """
+    with open(path, encoding="utf-8") as source:
+        lines = (line.strip() for line in source)
+        return [line for line in lines if line and not line.startswith("#")]
+
+
+def path_filters(repository: Repo, include: Sequence[str] = (), exclude: Sequence[str] = (),
+                 ignore_file: Optional[str] = None, default_ignore_file: bool = True) -> list[str]:
+    """
+    The pathspecs for the include and exclude patterns, plus the exclude
+    patterns of the ignore file: the given one, or else (unless
+    default_ignore_file is False) the repository's .gminerignore if there
+    is one.
+    """
+    if ignore_file is None and default_ignore_file and repository.working_tree_dir:
+        default_ignore_file = os.path.join(repository.working_tree_dir, IGNORE_FILE)
+        if os.path.isfile(default_ignore_file):
+            ignore_file = default_ignore_file
+    if ignore_file:
+        exclude = [*exclude, *read_ignore_file(ignore_file)]
+    return path_arguments(include, exclude)
+
+
+def write_json_array(record_texts: Iterable[str], out: TextIO) -> int:
+    """
+    One record per line, so that the extract can be read back
+    (and updated) a record at a time.
+    """
+    count = 0
+    out.write("[\n")
+    for count, text in enumerate(record_texts, start=1):
+        if count > 1:
+            out.write(",\n")
+        out.write(text)
+    out.write("\n]\n")
+    return count
+
+
+def write_json_lines(record_texts: Iterable[str], out: TextIO) -> int:
+    count = 0
+    for count, text in enumerate(record_texts, start=1):
+        out.write(text)
+        out.write("\n")
+    return count
+
+
+def write_extract(record_texts: Iterable[str], out: TextIO, extract_format: ExtractFormat) -> int:
+    if extract_format == ExtractFormat.jsonl:
+        return write_json_lines(record_texts, out)
+    return write_json_array(record_texts, out)
+
+
+def dump_it(repository: Repo, engine: ExtractEngine = ExtractEngine.log, update: Optional[str] = None,
+            output: Optional[str] = None, extract_format: Optional[ExtractFormat] = None,
+            use_cache: bool = True, revision_args: Sequence[str] = ("HEAD",), jobs: int = 1,
+            pathspecs: Sequence[str] = ()):
+    """
+    Write the extract to stdout, or to the output file, compressed
+    if its name ends in .gz or .zst. Without an explicit format, an
+    output name ending in .jsonl gets JSON Lines, one ending in .parquet
+    gets a columnar extract, and anything else gets a JSON array.
+
+    Commit stats are kept in the repository's stats cache unless use_cache is False.
+    The revision_args (see git_log.revision_arguments) select the history to extract.
+    With more than one job, the commits to extract are split between that
+    many worker processes (git log engine only).
+    The pathspecs (see path_filters) limit the files recorded; an update
+    should be given the same ones as the extract was made with.
+    """
     commit: Commit
 
+    with stats_cache_for(repository, use_cache and not pathspecs) as cache:
+        if update:
+            added, dropped = update_extract(repository, update, engine, cache, revision_args, pathspecs, jobs)
+            print(f"{update}: {added} commits added, {dropped} no longer reachable", file=sys.stderr)
+            return
+        write_new_extract(repository, engine, cache, output, extract_format, revision_args, jobs, pathspecs)
+
+
+def write_new_extract(repository: Repo, engine: ExtractEngine, cache: Optional[CommitStatsCache],
+                      output: Optional[str], extract_format: Optional[ExtractFormat],
+                      revision_args: Sequence[str] = ("HEAD",), jobs: int = 1, pathspecs: Sequence[str] = ()):
+    records = _records(repository, engine, cache, jobs, pathspecs, revision_args)
+    extract_format = extract_format or format_for_name(output or "")
+    if extract_format == ExtractFormat.parquet:
+        if not output:
+            raise ValueError("A parquet extract is a directory; it needs an output path")
+        from gminer.columnar import write_columnar_extract
+        write_columnar_extract(records, output)
+        return
+
+    record_texts = (json.dumps(record) for record in records)
+    if output:
+        with open_extract(output, "wt") as out:
+            write_extract(record_texts, out, extract_format)
+        return
+
     # Workaround for Windows powershell encoding issues
-    import os, sys
     if os.name == "nt":
         sys.stdout.reconfigure(encoding='utf-8')
 
-    print("[")
-    for line_number, record in enumerate(emit_commit_records_as_json(repository)):
-        if line_number > 0:
-            print(",")
-        print(json.dumps(record), end='')
-    print("\n]")
+    write_extract(record_texts, sys.stdout, extract_format)
+
+
+def _records(repository: Repo, engine: ExtractEngine, cache: Optional[CommitStatsCache], jobs: int,
+             pathspecs: Sequence[str], revision_args: Sequence[str] = ("HEAD",),
+             commits: Optional[Sequence[str]] = None) -> Iterable[dict]:
+    if jobs > 1 and engine == ExtractEngine.log:
+        return emit_commit_records_in_parallel(repository, jobs, revision_args, use_cache=cache is not None,
+                                               pathspecs=pathspecs, commits=commits)
+    return emit_commit_records(repository, engine, revision_args, commits=commits, cache=cache, pathspecs=pathspecs)
+
+
+def update_extract(repository: Repo, extract_path: str, engine: ExtractEngine = ExtractEngine.log,
+                   cache: Optional[CommitStatsCache] = None,
+                   revision_args: Sequence[str] = ("HEAD",), pathspecs: Sequence[str] = (),
+                   jobs: int = 1) -> tuple[int, int]:
+    """
+    Bring an existing extract up to date with HEAD, extracting only
+    the commits it doesn't have yet. The result is the extract a fresh
+    extraction would give, in the same order.
+
+    The newest recorded commit is normally still an ancestor of HEAD, so
+    we only walk HEAD ^newest and, if all of those are dated after it,
+    put their records in front of the ones we already have. A merged
+    branch can bring in older commits, which git log lists among the
+    recorded ones; then, and if history was rewritten (e.g. by a
+    force-push), we list what is reachable now in git log's order, drop
+    the records that aren't, and extract whatever is missing.
+
+    The revision_args may add limits such as --since or --first-parent,
+    but must end with HEAD.
+
+    @return: (commits added, commits dropped)
+    """
+    recorded = iter_record_texts(extract_path)
+    newest = next(recorded, None)
+    if newest is None:
+        merged = (json.dumps(record) for record in _records(repository, engine, cache, jobs, pathspecs, revision_args))
+        return _replace_extract(extract_path, merged), 0
+
+    newest_record = json.loads(newest)
+    newest_hash = newest_record['hash']
+    fresh = {}
+    if is_ancestor(repository.git_dir, newest_hash):
+        new_records = list(_records(repository, engine, cache, jobs, pathspecs, [*revision_args, f"^{newest_hash}"]))
+        newest_date = datetime.fromisoformat(newest_record['date'])
+        fresh = {record['hash']: json.dumps(record) for record in new_records}
+        if all(datetime.fromisoformat(record['date']) >= newest_date for record in new_records):
+            _replace_extract(extract_path, chain(fresh.values(), [newest], recorded))
+            return len(fresh), 0
+
+    reachable = rev_list(repository.git_dir, revision_args)
+    still_reachable = set(reachable)
+    kept = {}
+    dropped = 0
+    for text in chain([newest], recorded):
+        hexsha = json.loads(text)['hash']
+        if hexsha in still_reachable:
+            kept[hexsha] = text
+        else:
+            dropped += 1
+    missing = [hexsha for hexsha in reachable if hexsha not in kept and hexsha not in fresh]
+    if missing:
+        fresh.update((record['hash'], json.dumps(record))
+                     for record in _records(repository, engine, cache, jobs, pathspecs, commits=missing))
+    _replace_extract(extract_path, (kept.get(hexsha) or fresh[hexsha] for hexsha in reachable))
+    return len(fresh), dropped
+
+
+def _replace_extract(extract_path: str, record_texts: Iterable[str]) -> int:
+    """
+    Write to a temporary file beside the extract and swap it in,
+    so an interrupted update leaves the old extract intact.
+    The extract keeps its format and compression.
+    """
+    kept_format = extract_format(extract_path)
+    directory = os.path.dirname(os.path.abspath(extract_path))
+    if kept_format == ExtractFormat.parquet:
+        return _replace_columnar_extract(extract_path, directory, record_texts)
+    handle, temporary_path = tempfile.mkstemp(dir=directory, suffix=".partial")
+    os.close(handle)
+    try:
+        with open_extract(temporary_path, "wt", compression_of(extract_path)) as out:
+            count = write_extract(record_texts, out, kept_format)
+        shutil.copymode(extract_path, temporary_path)
+        os.replace(temporary_path, extract_path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+    return count
+
+
+def _replace_columnar_extract(extract_path: str, directory: str, record_texts: Iterable[str]) -> int:
+    from gminer.columnar import write_columnar_extract
+    temporary_path = tempfile.mkdtemp(dir=directory, suffix=".partial")
+    try:
+        count = write_columnar_extract((json.loads(text) for text in record_texts), temporary_path)
+    except BaseException:
+        shutil.rmtree(temporary_path)
+        raise
+    previous_path = temporary_path.removesuffix(".partial") + ".previous"
+    os.rename(extract_path, previous_path)
+    os.rename(temporary_path, extract_path)
+    shutil.rmtree(previous_path)
+    return count
 
 
-def main(repo_path: str):
+def main(repo_path: str, engine: ExtractEngine = ExtractEngine.log):
     """
     We need to set this up for 'typer' to do the command line parsing
     for us.
@@ -50,7 +400,7 @@ def main(repo_path: str):
     Should we package this with its libraries as early utility we can share?
     Will use typer and git modules
     """
-    dump_it(Repo(repo_path))
+    dump_it(Repo(repo_path), engine)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,655 @@
+"""
+A compact, array-based model of an extract's history.
+
+A GitHistoryDataframe keeps every file change as a dict, repeating the
+same path strings in every commit that touched them. A HistoryStore
+interns filenames and authors into integer ids and keeps the history in
+flat NumPy arrays, laid out like a CSR sparse matrix:
+
+    commit_offsets  int64[commits + 1]  the changes of commit i are the
+                                        rows offsets[i]:offsets[i + 1]
+    file_ids        int32[changes]      index into filenames
+    insertions      int64[changes]
+    deletions       int64[changes]
+    change_types    int8[changes]       index into change_type_names, -1 if unknown
+    timestamps      int64[commits]      seconds since the epoch (UTC)
+    utc_offsets     int32[commits]      the committer's UTC offset in seconds
+    author_ids      int32[commits]      index into authors
+    date_order      int64[commits]      the commits sorted by timestamp, an
+                                        index for selecting a date window
+
+Strings that aren't interned (hashes, messages) are packed into a single
+UTF-8 buffer each. Commits are kept in extract order (newest first), and
+ids are handed out in order of first appearance, so ties in counts come
+out in the same order as Counter.most_common gives them.
+"""
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, Iterator, Optional, Sequence
+
+import numpy
+import pandas
+
+from gminer.types import ExtractFormat, GitHistoryDataframe
+from gminer.utility import extract_format, history_frame_from_records, iter_history_records
+
+
+class StringColumn:
+    """
+    A sequence of strings packed into one UTF-8 buffer, with offsets:
+    string i is data[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, data: numpy.ndarray, offsets: numpy.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings: Iterable[str]) -> "StringColumn":
+        encoded = [text.encode("utf-8") for text in strings]
+        offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+        numpy.cumsum([len(text) for text in encoded], out=offsets[1:])
+        data = numpy.frombuffer(b"".join(encoded), dtype=numpy.uint8)
+        return cls(data, offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.data[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        text = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield text[start:end].decode("utf-8")
+
+    def tolist(self) -> list[str]:
+        return list(self)
+
+    def take(self, indices: Sequence[int]) -> "StringColumn":
+        return StringColumn.from_strings(self[index] for index in indices)
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + self.offsets.nbytes
+
+
+class _Interner:
+    def __init__(self):
+        self.ids: dict[str, int] = {}
+
+    def __call__(self, text: str) -> int:
+        return self.ids.setdefault(text, len(self.ids))
+
+    def column(self) -> StringColumn:
+        return StringColumn.from_strings(self.ids)
+
+
+class HistoryStore:
+    ARRAYS = ["author_ids", "coauthor_offsets", "coauthor_ids", "timestamps", "utc_offsets",
+              "commit_offsets", "file_ids", "insertions", "deletions", "change_types", "date_order"]
+    COLUMNS = ["hashes", "messages", "authors", "filenames", "change_type_names"]
+
+    def __init__(self, *, hashes: StringColumn, messages: StringColumn, authors: StringColumn,
+                 filenames: StringColumn, change_type_names: StringColumn,
+                 author_ids: numpy.ndarray, coauthor_offsets: numpy.ndarray, coauthor_ids: numpy.ndarray,
+                 timestamps: numpy.ndarray, utc_offsets: numpy.ndarray,
+                 commit_offsets: numpy.ndarray, file_ids: numpy.ndarray,
+                 insertions: numpy.ndarray, deletions: numpy.ndarray, change_types: numpy.ndarray,
+                 date_order: Optional[numpy.ndarray] = None):
+        self.hashes = hashes
+        self.messages = messages
+        self.authors = authors
+        self.filenames = filenames
+        self.change_type_names = change_type_names
+        self.author_ids = author_ids
+        self.coauthor_offsets = coauthor_offsets
+        self.coauthor_ids = coauthor_ids
+        self.timestamps = timestamps
+        self.utc_offsets = utc_offsets
+        self.commit_offsets = commit_offsets
+        self.file_ids = file_ids
+        self.insertions = insertions
+        self.deletions = deletions
+        self.change_types = change_types
+        self.date_order = date_order if date_order is not None else numpy.argsort(timestamps, kind="stable")
+        self._file_id_lookup: Optional[dict[str, int]] = None
+        self._datetimes: Optional[pandas.DatetimeIndex] = None
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> "HistoryStore":
+        """
+        Build the store from extract records, one commit at a time.
+        """
+        authors, filenames, change_type_names = _Interner(), _Interner(), _Interner()
+        hashes, messages = [], []
+        author_ids, coauthor_counts, coauthor_ids = [], [], []
+        timestamps, utc_offsets = [], []
+        commit_sizes, file_ids, insertions, deletions, change_types = [], [], [], [], []
+        for record in records:
+            hashes.append(record["hash"])
+            messages.append(record["message"])
+            author_ids.append(authors(record["author"]))
+            coauthor_counts.append(len(record["coauthors"]))
+            coauthor_ids.extend(authors(name) for name in record["coauthors"])
+            timestamp, utc_offset = _parse_date(record["date"])
+            timestamps.append(timestamp)
+            utc_offsets.append(utc_offset)
+            commit_sizes.append(len(record["files"]))
+            for entry in record["files"]:
+                file_ids.append(filenames(entry["filename"]))
+                insertions.append(entry["insertions"])
+                deletions.append(entry["deletions"])
+                change_type = entry.get("change_type")
+                change_types.append(change_type_names(change_type) if change_type is not None else -1)
+        return cls(
+            hashes=StringColumn.from_strings(hashes),
+            messages=StringColumn.from_strings(messages),
+            authors=authors.column(),
+            filenames=filenames.column(),
+            change_type_names=change_type_names.column(),
+            author_ids=numpy.array(author_ids, dtype=numpy.int32),
+            coauthor_offsets=_offsets(coauthor_counts),
+            coauthor_ids=numpy.array(coauthor_ids, dtype=numpy.int32),
+            timestamps=numpy.array(timestamps, dtype=numpy.int64),
+            utc_offsets=numpy.array(utc_offsets, dtype=numpy.int32),
+            commit_offsets=_offsets(commit_sizes),
+            file_ids=numpy.array(file_ids, dtype=numpy.int32),
+            insertions=numpy.array(insertions, dtype=numpy.int64),
+            deletions=numpy.array(deletions, dtype=numpy.int64),
+            change_types=numpy.array(change_types, dtype=numpy.int8),
+        )
+
+    @classmethod
+    def from_dataframe(cls, history: GitHistoryDataframe) -> "HistoryStore":
+        dates = history.date
+        if pandas.api.types.is_datetime64_any_dtype(dates):
+            dates = (timestamp.isoformat() for timestamp in dates)
+        records = (
+            dict(hash=hexsha, author=author, coauthors=coauthors, date=date, message=message, files=files)
+            for hexsha, author, coauthors, date, message, files
+            in zip(history.hash, history.author, history.coauthors, dates, history.message, history.files)
+        )
+        return cls.from_records(records)
+
+    @classmethod
+    def from_extract(cls, path: str) -> "HistoryStore":
+        """
+        Load any extract. A columnar extract's file changes are read as
+        whole columns rather than record by record.
+        """
+        if extract_format(path) == ExtractFormat.parquet:
+            return cls._from_columnar(path)
+        return cls.from_records(iter_history_records(path))
+
+    @classmethod
+    def _from_columnar(cls, path: str) -> "HistoryStore":
+        from gminer.columnar import read_commits, read_file_changes
+        commits = read_commits(path, columns=["hash", "author", "coauthors", "date", "message"])
+        changes = read_file_changes(
+            path, columns=["commit_id", "file_id", "filename", "insertions", "deletions", "change_type"])
+        authors = _Interner()
+        author_ids, coauthor_counts, coauthor_ids = [], [], []
+        for author, coauthors in zip(commits["author"], commits["coauthors"]):
+            author_ids.append(authors(author))
+            coauthor_counts.append(len(coauthors))
+            coauthor_ids.extend(authors(name) for name in coauthors)
+        dates = [_parse_date(date) for date in commits["date"]]
+        # file_id already numbers filenames in order of first appearance
+        file_ids = changes["file_id"].to_numpy(dtype=numpy.int32)
+        _, first_rows = numpy.unique(file_ids, return_index=True)
+        filenames = changes["filename"].to_numpy()[first_rows]
+        change_type_codes, change_type_names = pandas.factorize(changes["change_type"])
+        commit_sizes = numpy.bincount(changes["commit_id"].to_numpy(), minlength=len(commits))
+        return cls(
+            hashes=StringColumn.from_strings(commits["hash"]),
+            messages=StringColumn.from_strings(commits["message"]),
+            authors=authors.column(),
+            filenames=StringColumn.from_strings(str(name) for name in filenames),
+            change_type_names=StringColumn.from_strings(str(name) for name in change_type_names),
+            author_ids=numpy.array(author_ids, dtype=numpy.int32),
+            coauthor_offsets=_offsets(coauthor_counts),
+            coauthor_ids=numpy.array(coauthor_ids, dtype=numpy.int32),
+            timestamps=numpy.array([timestamp for timestamp, _ in dates], dtype=numpy.int64),
+            utc_offsets=numpy.array([utc_offset for _, utc_offset in dates], dtype=numpy.int32),
+            commit_offsets=_offsets(commit_sizes),
+            file_ids=file_ids,
+            insertions=changes["insertions"].to_numpy(dtype=numpy.int64),
+            deletions=changes["deletions"].to_numpy(dtype=numpy.int64),
+            change_types=change_type_codes.astype(numpy.int8),
+        )
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def sizes(self) -> numpy.ndarray:
+        """
+        The number of files in each commit.
+        """
+        return numpy.diff(self.commit_offsets)
+
+    @property
+    def nbytes(self) -> int:
+        return (sum(getattr(self, name).nbytes for name in self.ARRAYS) +
+                sum(getattr(self, name).nbytes for name in self.COLUMNS))
+
+    def save(self, directory: str) -> None:
+        """
+        Write each array as a .npy file, so that open() can map them.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in self.ARRAYS:
+            numpy.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            numpy.save(os.path.join(directory, f"{name}.data.npy"), column.data)
+            numpy.save(os.path.join(directory, f"{name}.offsets.npy"), column.offsets)
+
+    @classmethod
+    def open(cls, directory: str) -> "HistoryStore":
+        """
+        A store whose arrays are memory-mapped from a directory written by save().
+        Nothing is read until it's used, and processes that open the same
+        files share their pages.
+        """
+        def mapped(filename: str) -> numpy.ndarray:
+            return numpy.load(os.path.join(directory, filename), mmap_mode="r")
+
+        return cls(
+            **{name: mapped(f"{name}.npy") for name in cls.ARRAYS},
+            **{name: StringColumn(mapped(f"{name}.data.npy"), mapped(f"{name}.offsets.npy"))
+               for name in cls.COLUMNS}
+        )
+
+    def change_commit_ids(self) -> numpy.ndarray:
+        """
+        The commit (index) each file change belongs to.
+        """
+        return numpy.repeat(numpy.arange(len(self), dtype=numpy.int32), self.sizes)
+
+    def files_of(self, index: int) -> numpy.ndarray:
+        return self.file_ids[self.commit_offsets[index]:self.commit_offsets[index + 1]]
+
+    def filenames_of(self, index: int) -> list[str]:
+        return [self.filenames[file_id] for file_id in self.files_of(index)]
+
+    def iter_filenames(self) -> Iterator[list[str]]:
+        """
+        The filenames of each commit, as the files column's filename entries.
+        """
+        names = self.filenames.tolist()
+        offsets = self.commit_offsets.tolist()
+        file_ids = self.file_ids.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield [names[file_id] for file_id in file_ids[start:end]]
+
+    def file_id(self, filename: str) -> Optional[int]:
+        if self._file_id_lookup is None:
+            self._file_id_lookup = {name: file_id for file_id, name in enumerate(self.filenames)}
+        return self._file_id_lookup.get(filename)
+
+    def file_commit_counts(self) -> numpy.ndarray:
+        """
+        The number of commits that touched each file, by file id.
+        """
+        return numpy.bincount(self.file_ids, minlength=len(self.filenames))
+
+    def most_committed(self, goal: int) -> list[tuple[str, int]]:
+        """
+        Files by the number of commits that touched them, most first;
+        ties are listed in order of first appearance, as Counter.most_common does.
+        """
+        counts = self.file_commit_counts()
+        ranked = numpy.argsort(-counts, kind="stable")[:goal]
+        return [(self.filenames[file_id], int(counts[file_id])) for file_id in ranked]
+
+    def datetimes(self) -> pandas.DatetimeIndex:
+        """
+        The commit dates in UTC, parsed once and kept.
+        """
+        if self._datetimes is None:
+            self._datetimes = pandas.to_datetime(self.timestamps, unit="s", utc=True)
+        return self._datetimes
+
+    def date_of(self, index: int) -> datetime:
+        """
+        The commit's date in its committer's time zone.
+        """
+        return datetime.fromisoformat(_format_date(int(self.timestamps[index]), int(self.utc_offsets[index])))
+
+    def between(self, after: Optional[datetime] = None, before: Optional[datetime] = None) -> "HistoryStore":
+        """
+        The commits dated strictly after `after` and strictly before `before`,
+        in extract order. Naive datetimes are taken as local time, as in
+        per_date_stats.conditional_range. The window is found by binary search
+        over date_order, so only the commits inside it are copied.
+        """
+        if after is None and before is None:
+            return self
+        sorted_timestamps = self.timestamps[self.date_order]
+        start, end = 0, len(sorted_timestamps)
+        if after is not None:
+            start = numpy.searchsorted(sorted_timestamps, after.astimezone().timestamp(), side="right")
+        if before is not None:
+            end = numpy.searchsorted(sorted_timestamps, before.astimezone().timestamp(), side="left")
+        return self.select(numpy.sort(self.date_order[start:max(start, end)]))
+
+    def ends_with(self, commits: int, digest: Optional[str]) -> bool:
+        """
+        Whether the last `commits` commits have this digest (see
+        digest_of_last), as they do when an index absorbed them and the
+        extract has only been extended since.
+        """
+        return commits <= len(self) and self.digest_of_last(commits) == digest
+
+    def digest_of_last(self, commits: int) -> str:
+        """
+        A digest of the last `commits` commits: their hashes, the names of
+        the files each changed, and the lines inserted and deleted. Two
+        extracts of the same commits made with different filters differ in
+        it, though their hashes are the same. File ids are numbered afresh
+        in order of first appearance among these commits, so the digest
+        doesn't depend on the rest of the history.
+        """
+        first = len(self) - commits
+        start, end = int(self.commit_offsets[first]), int(self.commit_offsets[len(self)])
+        file_ids = self.file_ids[start:end]
+        distinct, first_changes, renumbered = numpy.unique(file_ids, return_index=True, return_inverse=True)
+        appearance = numpy.argsort(first_changes, kind="stable")
+        order = numpy.empty(len(distinct), dtype=numpy.int64)
+        order[appearance] = numpy.arange(len(distinct))
+        digest = hashlib.blake2b()
+        digest.update(self.hashes.data[self.hashes.offsets[first]:self.hashes.offsets[len(self)]].tobytes())
+        digest.update("\0".join(self.filenames[file_id] for file_id in distinct[appearance].tolist()).encode())
+        for values in (self.commit_offsets[first:] - start, order[renumbered], self.insertions[start:end],
+                       self.deletions[start:end]):
+            digest.update(numpy.ascontiguousarray(values, dtype=numpy.int64).tobytes())
+        return digest.hexdigest()
+
+    def select(self, commits: Sequence[int] | numpy.ndarray) -> "HistoryStore":
+        """
+        A store of just the given commits (indices, or a boolean mask), in
+        the order given. Ids stay the same, so the name tables are shared.
+        """
+        commits = numpy.asarray(commits)
+        if commits.dtype == bool:
+            commits = numpy.flatnonzero(commits)
+        changes = concatenated_ranges(self.commit_offsets, commits)
+        coauthors = concatenated_ranges(self.coauthor_offsets, commits)
+        return HistoryStore(
+            hashes=self.hashes.take(commits),
+            messages=self.messages.take(commits),
+            authors=self.authors,
+            filenames=self.filenames,
+            change_type_names=self.change_type_names,
+            author_ids=self.author_ids[commits],
+            coauthor_offsets=_offsets(numpy.diff(self.coauthor_offsets)[commits]),
+            coauthor_ids=self.coauthor_ids[coauthors],
+            timestamps=self.timestamps[commits],
+            utc_offsets=self.utc_offsets[commits],
+            commit_offsets=_offsets(self.sizes[commits]),
+            file_ids=self.file_ids[changes],
+            insertions=self.insertions[changes],
+            deletions=self.deletions[changes],
+            change_types=self.change_types[changes],
+        )
+
+    def with_files(self, sizes: numpy.ndarray, file_ids: numpy.ndarray,
+                   filenames: Optional[StringColumn] = None) -> "HistoryStore":
+        """
+        The same commits with other lists of files (e.g. some files dropped,
+        or replaced by their directories, whose names can be added to the
+        filename table). The new changes have no line counts or change types.
+        """
+        return HistoryStore(
+            hashes=self.hashes,
+            messages=self.messages,
+            authors=self.authors,
+            filenames=filenames if filenames is not None else self.filenames,
+            change_type_names=self.change_type_names,
+            author_ids=self.author_ids,
+            coauthor_offsets=self.coauthor_offsets,
+            coauthor_ids=self.coauthor_ids,
+            timestamps=self.timestamps,
+            utc_offsets=self.utc_offsets,
+            commit_offsets=_offsets(sizes),
+            file_ids=numpy.asarray(file_ids, dtype=numpy.int32),
+            insertions=numpy.zeros(len(file_ids), dtype=numpy.int64),
+            deletions=numpy.zeros(len(file_ids), dtype=numpy.int64),
+            change_types=numpy.full(len(file_ids), -1, dtype=numpy.int8),
+            date_order=self.date_order,
+        )
+
+    def iter_records(self) -> Iterator[dict]:
+        """
+        The extract's records, rebuilt; totals are summed from the file entries.
+        """
+        authors = self.authors.tolist()
+        filenames = self.filenames.tolist()
+        change_type_names = self.change_type_names.tolist()
+        commit_offsets = self.commit_offsets.tolist()
+        coauthor_offsets = self.coauthor_offsets.tolist()
+        for index, (hexsha, message) in enumerate(zip(self.hashes, self.messages)):
+            files = []
+            for change in range(commit_offsets[index], commit_offsets[index + 1]):
+                insertions, deletions = int(self.insertions[change]), int(self.deletions[change])
+                entry = {"filename": filenames[self.file_ids[change]], "insertions": insertions,
+                         "deletions": deletions, "lines": insertions + deletions}
+                if self.change_types[change] >= 0:
+                    entry["change_type"] = change_type_names[self.change_types[change]]
+                files.append(entry)
+            yield dict(
+                hash=hexsha,
+                author=authors[self.author_ids[index]],
+                coauthors=[authors[author_id] for author_id
+                           in self.coauthor_ids[coauthor_offsets[index]:coauthor_offsets[index + 1]]],
+                date=_format_date(int(self.timestamps[index]), int(self.utc_offsets[index])),
+                message=message,
+                files=files,
+                totals={
+                    "insertions": sum(entry["insertions"] for entry in files),
+                    "deletions": sum(entry["deletions"] for entry in files),
+                    "lines": sum(entry["lines"] for entry in files),
+                    "files": len(files),
+                }
+            )
+
+    def to_dataframe(self) -> GitHistoryDataframe:
+        """
+        The GitHistoryDataframe read_git_history_from_file would give,
+        for code that hasn't moved to the store yet.
+        """
+        return history_frame_from_records(self.iter_records())
+
+
+SIDECAR_SUFFIX = ".gminer-store"
+SIDECAR_VERSION = 2
+SIDECAR_METADATA = "extract.json"
+
+
+def load_history(path: str, use_sidecar: bool = True, after: Optional[datetime] = None,
+                 before: Optional[datetime] = None) -> HistoryStore:
+    """
+    The extract's HistoryStore, from its sidecar when that is up to date,
+    limited to the commits between after and before (see HistoryStore.between).
+
+    The sidecar is a directory of .npy files next to the extract (for
+    history.json, history.json.gminer-store). The first load parses the
+    extract and writes it; later loads map it instead of parsing anything.
+    It's used while the extract's size and modification time are the ones
+    recorded. If only the time differs (e.g. the extract was copied), the
+    content hash decides. If it can't be written, e.g. beside a read-only
+    extract, the store is simply built each time.
+
+    From a sidecar, the date window is applied before anything else is
+    read, so a short window over a long history only pages in its commits.
+    """
+    return _load_whole_history(path, use_sidecar).between(after, before)
+
+
+def _load_whole_history(path: str, use_sidecar: bool) -> HistoryStore:
+    if not use_sidecar:
+        return HistoryStore.from_extract(path)
+    sidecar = sidecar_path(path)
+    fingerprint = _extract_fingerprint(path)
+    recorded = _read_sidecar_metadata(sidecar)
+    if recorded and recorded["size"] == fingerprint["size"]:
+        current = recorded["mtime_ns"] == fingerprint["mtime_ns"]
+        if not current and recorded["digest"] == _extract_digest(path):
+            _write_sidecar_metadata(sidecar, {**recorded, "mtime_ns": fingerprint["mtime_ns"]})
+            current = True
+        if current:
+            store = _open_sidecar(sidecar, recorded["digest"])
+            # a sidecar swapped out while it was opened has just been written again: don't swap it once more
+            return store if store is not None else HistoryStore.from_extract(path)
+    store = HistoryStore.from_extract(path)
+    _write_sidecar(store, sidecar, {**fingerprint, "digest": _extract_digest(path)})
+    return store
+
+
+def sidecar_path(path: str) -> str:
+    return os.path.abspath(path).rstrip(os.sep) + SIDECAR_SUFFIX
+
+
+def _extract_files(path: str) -> list[str]:
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path))
+    return [path]
+
+
+def _extract_fingerprint(path: str) -> dict:
+    stats = [os.stat(filename) for filename in _extract_files(path)]
+    return {
+        "version": SIDECAR_VERSION,
+        "size": sum(stat.st_size for stat in stats),
+        "mtime_ns": max((stat.st_mtime_ns for stat in stats), default=0),
+    }
+
+
+def _extract_digest(path: str) -> str:
+    digest = hashlib.blake2b()
+    for filename in _extract_files(path):
+        with open(filename, "rb") as source:
+            while chunk := source.read(1 << 20):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_sidecar_metadata(sidecar: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(sidecar, SIDECAR_METADATA)) as source:
+            metadata = json.load(source)
+    except (OSError, ValueError):
+        return None
+    return metadata if metadata.get("version") == SIDECAR_VERSION else None
+
+
+def _open_sidecar(sidecar: str, digest: str) -> Optional[HistoryStore]:
+    """
+    The store mapped from the sidecar, unless another process swapped in
+    a new sidecar while its files were being mapped one by one: then a
+    file goes missing, or the sidecar's digest isn't the one checked
+    before, and the mapped arrays may not belong together.
+    """
+    try:
+        store = HistoryStore.open(sidecar)
+    except (OSError, ValueError):
+        return None
+    metadata = _read_sidecar_metadata(sidecar)
+    return store if metadata and metadata["digest"] == digest else None
+
+
+def _write_sidecar_metadata(sidecar: str, metadata: dict) -> None:
+    try:
+        temporary_path = _partial_path(os.path.join(sidecar, SIDECAR_METADATA))
+        # os.open rather than mkstemp, whose file only its owner can read
+        handle = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        with os.fdopen(handle, "w") as out:
+            json.dump(metadata, out)
+        os.replace(temporary_path, os.path.join(sidecar, SIDECAR_METADATA))
+    except OSError:
+        pass
+
+
+def _write_sidecar(store: HistoryStore, sidecar: str, metadata: dict) -> None:
+    def write(directory: str) -> None:
+        store.save(directory)
+        with open(os.path.join(directory, SIDECAR_METADATA), "w") as out:
+            json.dump(metadata, out)
+
+    replace_directory(sidecar, write)
+
+
+def replace_directory(path: str, write: Callable[[str], None]) -> bool:
+    """
+    Have write() fill a temporary directory and swap it in at path, so that
+    other processes only ever see a complete one. Failing to is not an
+    error (the directory is only a cache); the result says whether it worked.
+
+    The old directory is renamed aside before the new one takes its place,
+    and only then deleted, so path is never a directory half removed. A
+    process still mapping the old files one by one finds the rest missing
+    (see _open_sidecar); maps it already has stay valid.
+    """
+    # os.mkdir rather than mkdtemp, whose directory only its owner can read
+    temporary_path = _partial_path(path)
+    try:
+        os.mkdir(temporary_path)
+    except OSError:
+        return False
+    old_path = None
+    try:
+        write(temporary_path)
+        if os.path.exists(path):
+            old_path = _partial_path(path + ".old")
+            os.rename(path, old_path)
+        os.rename(temporary_path, path)
+        return True
+    except OSError:
+        # e.g. another process put its directory in place first
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        return False
+    finally:
+        if old_path:
+            shutil.rmtree(old_path, ignore_errors=True)
+
+
+def _partial_path(path: str) -> str:
+    """
+    A name beside path that no other process or thread will pick.
+    """
+    return f"{path}.{os.getpid()}-{os.urandom(4).hex()}.partial"
+
+
+def _parse_date(date: str) -> tuple[int, int]:
+    moment = datetime.fromisoformat(date)
+    utc_offset = moment.utcoffset()
+    return int(moment.timestamp()), int(utc_offset.total_seconds()) if utc_offset is not None else 0
+
+
+def _format_date(timestamp: int, utc_offset: int) -> str:
+    return datetime.fromtimestamp(timestamp, timezone(timedelta(seconds=utc_offset))).isoformat()
+
+
+def _offsets(counts: Sequence[int] | numpy.ndarray) -> numpy.ndarray:
+    offsets = numpy.zeros(len(counts) + 1, dtype=numpy.int64)
+    numpy.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def concatenated_ranges(offsets: numpy.ndarray, rows: numpy.ndarray) -> numpy.ndarray:
+    """
+    The positions covered by offsets[row]:offsets[row + 1] for each row, concatenated.
+    """
+    starts, ends = offsets[rows], offsets[rows + 1]
+    lengths = ends - starts
+    if not lengths.sum():
+        return numpy.zeros(0, dtype=numpy.int64)
+    position_in_row = numpy.arange(lengths.sum()) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+    return numpy.repeat(starts, lengths) + position_in_row
@@ -1,21 +1,29 @@
 #!python3
+"""
+The miner command line.
+
+Scripts run miner thousands of times, so loading this module has to stay
+cheap: git, pandas, NumPy and the analysis modules are imported inside the
+commands that use them, never at the top. gminer.types, which every
+command's options need, imports nothing heavy either.
+tests/test_cli_startup.py holds `miner --help` to an import-time budget.
+"""
 import logging
 import os
 import re
 from collections import Counter
 from datetime import datetime, timedelta
 from os.path import isdir, isfile
-from statistics import mean
+from typing import TYPE_CHECKING
 
-import git
-import git.repo.fun
-import pandas as pd
 import typer
 from typing_extensions import Annotated
 
 import gminer.types
-from gminer.utility import read_git_history_from_file
-from .associative_modularity import strongest_pairs_by_ranking
+
+if TYPE_CHECKING:
+    import git
+    import pandas as pd
 
 app = typer.Typer()
 logger = logging.getLogger(__name__)
@@ -23,9 +31,10 @@ logger = logging.getLogger(__name__)
 
 @app.command("release-freq")
 def release_frequency(path_to_repo: str, tag_regex: str) -> None:
+    import git
     repo = git.Repo(path_to_repo)
-    df: pd.DataFrame = release_tag_intervals(repo, tag_regex)
-    timings: pd.Series = df.interval
+    df = release_tag_intervals(repo, tag_regex)
+    timings = df.interval
     print(f"Max {timings.max()}\nMin {timings.min()}\nMean: {timings.mean()}")
 
     # draw a picture
@@ -38,9 +47,11 @@ def release_frequency(path_to_repo: str, tag_regex: str) -> None:
     figure.write_image("sample.png", format="png")
 
 
-def release_tag_intervals(repo: git.Repo, pattern: str) -> pd.DataFrame:
-    source = ((tag_ref.name, tag_ref.commit.authored_datetime.replace(minute=0, second=0, microsecond=0))
-              for tag_ref in repo.tags)
+def release_tag_intervals(repo: "git.Repo", pattern: str) -> "pd.DataFrame":
+    import pandas as pd
+    from .ref_index import load_ref_index
+    source = ((tag.name, tag.authored.replace(minute=0, second=0, microsecond=0))
+              for tag in load_ref_index(repo.common_dir).tags if tag.commit)
     raw_df = pd.DataFrame(data=source, columns=["name", "timestamp"])
     if raw_df.empty:
         return raw_df
@@ -55,16 +66,14 @@ def release_tag_intervals(repo: git.Repo, pattern: str) -> pd.DataFrame:
     return filtered_df
 
 
-def releases_by_week_numbers(repo: git.Repo, year, pattern: str):
+def releases_by_week_numbers(repo: "git.Repo", year, pattern: str):
+    import pandas as pd
+    from .ref_index import load_ref_index
     release_pattern = re.compile(pattern)
-    year_of = lambda x: x.commit.authored_datetime.isocalendar().year
-    week_of = lambda x: x.commit.authored_datetime.isocalendar().week
-    date_of = lambda x: x.commit.authored_datetime
-
-    source = ((tag_ref.name, year_of(tag_ref), week_of(tag_ref), date_of(tag_ref))
-              for tag_ref in repo.tags
-              if tag_ref.commit.authored_datetime.year >= year and release_pattern.search(tag_ref.name))
-    counts = Counter((year, week) for (_, year, week, _) in source)
+    weeks = (tag.authored.isocalendar()
+             for tag in load_ref_index(repo.common_dir).tags
+             if tag.commit and tag.authored.year >= year and release_pattern.search(tag.name))
+    counts = Counter((week.year, week.week) for week in weeks)
     out_data = (
         (datetime.fromisocalendar(key[0], key[1], 1), releases)
         for (key, releases) in counts.items()
@@ -75,92 +84,416 @@ def releases_by_week_numbers(repo: git.Repo, year, pattern: str):
 @app.command("most-committed")
 def cli_most_committed(
         json_file: str,
-        max_to_list: Annotated[int, typer.Option("--size", "-s")] = 5
+        max_to_list: Annotated[int, typer.Option("--size", "-s")] = 5,
+        by: Annotated[gminer.types.FileRanking, typer.Option(
+            help="Rank by the number of commits or by lines inserted and deleted")] = "commits",
+        after: Annotated[datetime, typer.Option("--since")] = None,
+        before: Annotated[datetime, typer.Option("--until")] = None,
 ):
     """
     List the files that have been committed the most often
+
+    The counts come from a per-week churn index kept next to the extract
+    (history.json.gminer-churn), updated as the extract grows.
     """
     from .most_commited import count_files_in_commits
-    count_files_in_commits(json_file, max_to_list)
+    count_files_in_commits(json_file, max_to_list, by, after, before)
 
 
 @app.command("extract-to-json")
-def cli_extract_to_json(repo_path: str):
+def cli_extract_to_json(
+        repo_path: str,
+        engine: Annotated[gminer.types.ExtractEngine, typer.Option(
+            help="'log' streams one git log process; 'gitpython' reads commit.stats per commit")
+        ] = gminer.types.ExtractEngine.log,
+        update: Annotated[str, typer.Option(
+            help="Add only the new commits to this existing extract, rewriting it in place")
+        ] = None,
+        output: Annotated[str, typer.Option(
+            "--output", "-o", help="Write here instead of stdout; .gz and .zst names are compressed")
+        ] = None,
+        extract_format: Annotated[gminer.types.ExtractFormat, typer.Option(
+            "--format", help="json, jsonl (one record per line) or parquet [default: from the output name]")
+        ] = None,
+        use_cache: Annotated[bool, typer.Option(
+            "--cache/--no-cache", help="Keep commit stats in .git/gminer-cache so they're only computed once; "
+                                       "extracts limited by path filters don't use it")
+        ] = True,
+        since: Annotated[str, typer.Option(
+            help="Only commits more recent than this date, e.g. 2024-01-01 or '3 months ago'")
+        ] = None,
+        until: Annotated[str, typer.Option(help="Only commits older than this date")] = None,
+        rev_range: Annotated[str, typer.Option(
+            "--rev-range", help="Revisions to walk, e.g. v1.0..main")
+        ] = "HEAD",
+        max_count: Annotated[int, typer.Option("--max-count", "-n", help="Stop after this many commits")] = None,
+        first_parent: Annotated[bool, typer.Option(
+            "--first-parent", help="Follow only the first parent of merges (trunk-only history)")
+        ] = False,
+        jobs: Annotated[int, typer.Option(
+            "--jobs", "-j", min=1, help="Extract in this many worker processes (git log engine)")
+        ] = 1,
+        include: Annotated[list[str], typer.Option(
+            "--include", "-i", help="Only record files matching this glob, e.g. 'src/' (repeatable)")
+        ] = None,
+        exclude: Annotated[list[str], typer.Option(
+            "--exclude", "-x", help="Leave out files matching this glob, e.g. '*.lock' (repeatable)")
+        ] = None,
+        ignore_file: Annotated[str, typer.Option(
+            help="Exclude patterns, one per line [default: .gminerignore in the repository, if any, "
+                 "with the git log engine]")
+        ] = None,
+        no_ignore_file: Annotated[bool, typer.Option(
+            "--no-ignore-file", help="Don't read the repository's .gminerignore")
+        ] = False
+):
     """
     Extract the contents of early git repo to early json file
+
+    The date, range and count limits are handed to git, so it stops walking
+    history at the boundary. So are the path filters: files they leave out
+    are never diffed, and commits that only touched such files are kept
+    with an empty list of files. The stats cache holds whole commits, so a
+    filtered extract doesn't use it.
     """
-    from .extractor import dump_it
-    source: git.Repo = git.Repo(repo_path)
-    dump_it(source)
+    from .extractor import dump_it, path_filters
+    from .git_log import revision_arguments
+    if update and (rev_range != "HEAD" or max_count is not None):
+        raise typer.BadParameter("--update always extends an extract up to HEAD; "
+                                 "it can't be combined with --rev-range or --max-count")
+    if jobs > 1 and engine != gminer.types.ExtractEngine.log:
+        raise typer.BadParameter("--jobs needs the git log engine")
+    import git
+    source = git.Repo(repo_path)
+    revision_args = revision_arguments(since, until, rev_range, max_count, first_parent)
+    # the gitpython engine can't filter, so it only fails on filters asked for, not on .gminerignore
+    pathspecs = path_filters(source, include or [], exclude or [], ignore_file,
+                             default_ignore_file=not no_ignore_file and engine == gminer.types.ExtractEngine.log)
+    if pathspecs and engine != gminer.types.ExtractEngine.log:
+        raise typer.BadParameter("--include, --exclude and --ignore-file need the git log engine")
+    dump_it(source, engine, update, output, extract_format, use_cache, revision_args, jobs, pathspecs)
+
+
+def time_zone(name: str) -> str:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise typer.BadParameter(f"{name} isn't a time zone name like UTC or Europe/Berlin")
+    return name
+
+
+TimeZoneOption = Annotated[str, typer.Option(
+    "--timezone", "--tz", callback=time_zone, help="The time zone whose days, weeks and months to count in")]
 
 
 @app.command("commits-per-day")
 def daily_commits(
         json_file: str,
         after: Annotated[datetime, typer.Option("--after", "--early")] = None,
-        before: Annotated[datetime, typer.Option("--before", "--late")] = None
+        before: Annotated[datetime, typer.Option("--before", "--late")] = None,
+        timezone: TimeZoneOption = "UTC",
 ):
     """
     List the total number of commits per day
     """
+    from statistics import mean
+    from .history_store import load_history
     from .per_date_stats import count_commits_per_day
-    p = read_git_history_from_file(json_file)
-    counts = count_commits_per_day(p, after=after, before=before)
+    counts = count_commits_per_day(load_history(json_file, after=after, before=before), timezone=timezone)
     if not counts:
         print("No commits in range")
         return
-    print("Commits per day (UTC days)")
+    print(f"Commits per day ({timezone} days)")
     for key, value in counts.items():
         print(f"    {key}: {value}")
     raw_values = counts.values()
     print(f"Max: {max(raw_values)}, Mean: {mean(raw_values)}, Min: {min(raw_values)}")
 
 
+@app.command("commits-per-week")
+def weekly_commits(
+        json_file: str,
+        after: Annotated[datetime, typer.Option("--after", "--early")] = None,
+        before: Annotated[datetime, typer.Option("--before", "--late")] = None,
+        timezone: TimeZoneOption = "UTC",
+):
+    """
+    List the total number of commits per ISO week, oldest first
+    """
+    from .history_store import load_history
+    from .per_date_stats import stats_per_period
+    commits = stats_per_period(load_history(json_file, after=after, before=before), gminer.types.Period.week,
+                               [gminer.types.Metric.commits], timezone)[gminer.types.Metric.commits]
+    if commits.empty:
+        print("No commits in range")
+        return
+    print(f"Commits per ISO week ({timezone} weeks, starting Monday)")
+    for start, value in commits.items():
+        year, week, _ = start.isocalendar()
+        print(f"    {year}-W{week:02d} ({start.date()}): {value}")
+    print(f"Max: {commits.max()}, Mean: {commits.mean()}, Min: {commits.min()}")
+
+
+@app.command("churn-per-period")
+def churn_per_period(
+        json_file: str,
+        period: Annotated[gminer.types.Period, typer.Option(help="Bucket the commits by day, ISO week or month")]
+        = "week",
+        after: Annotated[datetime, typer.Option("--since")] = None,
+        before: Annotated[datetime, typer.Option("--until")] = None,
+        timezone: TimeZoneOption = "UTC",
+):
+    """
+    Commits, files touched, lines inserted and deleted, and distinct
+    authors per day, week or month, oldest first.
+    """
+    from .history_store import load_history
+    from .per_date_stats import stats_per_period
+    stats = stats_per_period(load_history(json_file, after=after, before=before), period, timezone=timezone)
+    if stats.empty:
+        print("No commits in range")
+        return
+    print(f"Churn per {period} ({timezone})")
+    print(f"{period.capitalize():10} {'Commits':>8} {'Files':>8} {'Inserted':>10} {'Deleted':>10} {'Authors':>8}")
+    for start, commits, files, insertions, deletions, authors in stats.itertuples():
+        print(f"{start.date()!s:10} {commits:8d} {files:8d} {insertions:10d} {deletions:10d} {authors:8d}")
+
+
+MegaCommitsOption = Annotated[gminer.types.MegaCommitAction, typer.Option(
+    "--mega-commits", help="What to do with commits of more than --mega-commit-size files before pairing")]
+MegaCommitSizeOption = Annotated[int, typer.Option(
+    "--mega-commit-size", help="Commits of more files than this are mega-commits")]
+SampleSizeOption = Annotated[int, typer.Option(
+    "--sample-size", help="With --mega-commits sample, how many of a mega-commit's files to pair")]
+AnalysisJobsOption = Annotated[int, typer.Option(
+    "--jobs", "-j", min=1, help="Worker processes for the co-change products")]
+IndexOption = Annotated[bool, typer.Option(
+    "--index", help="Use the extract's co-change index of the whole history, folding in new commits")]
+RebuildIndexOption = Annotated[bool, typer.Option(
+    "--rebuild-index", help="Build the co-change index again from the whole extract (implies --index)")]
+
+
+def mega_commit_policy(action: gminer.types.MegaCommitAction, max_files: int, sample_size: int):
+    from .cochange import MegaCommitPolicy
+    if max_files < 2 or sample_size < 2:
+        raise typer.BadParameter("--mega-commit-size and --sample-size must be at least 2")
+    return MegaCommitPolicy(action, max_files, sample_size)
+
+
 @app.command("strongest-pairs")
-def strongest_ranked_pairs(json_file: str):
+def strongest_ranked_pairs(
+        json_file: str,
+        mega_commits: MegaCommitsOption = gminer.types.MegaCommitAction.keep,
+        mega_commit_size: MegaCommitSizeOption = 100,
+        sample_size: SampleSizeOption = 20,
+        sketch: Annotated[int, typer.Option(
+            help="Keep at most this many pairs in memory (a heavy-hitter sketch); 0 keeps them all")] = 0,
+        exact: Annotated[bool, typer.Option(
+            help="With --sketch, recount the candidate pairs exactly in a second pass")] = True,
+        jobs: AnalysisJobsOption = 1,
+        index: IndexOption = False,
+        rebuild_index: RebuildIndexOption = False,
+):
     """
     Strongest-related pairs based on commits
 
     Lists the strength of the relationship, the count of co-commits, and the file names.
+    With a --mega-commits policy other than keep, each strength is a lower
+    bound, shown with how much higher the exact one could be.
     """
     print("Strongest-pairs")
-    strong_pairs = strongest_pairs_by_ranking(read_git_history_from_file(json_file))
+    from .associative_modularity import cochange_analysis, strongest_pairs_by_ranking
+    from .history_store import load_history
+    policy = mega_commit_policy(mega_commits, mega_commit_size, sample_size)
+    if index or rebuild_index:
+        from .cochange_index import load_cochange_index
+        if sketch or mega_commits != gminer.types.MegaCommitAction.keep:
+            raise typer.BadParameter("--index holds every pair; it can't be combined with --sketch or --mega-commits")
+        update = load_cochange_index(json_file, rebuild_index)
+        print(f"Index of {update.index.commits} commits ({'rebuilt' if update.rebuilt else f'{update.added} new'})")
+        print("Strength Count  Pair")
+        for value, (left, right), count in update.index.strongest_pairs(50):
+            print(f"{value:8.3f}:{count:5d} {left}\n               {right}\n")
+        return
+    if sketch:
+        from .pair_sketch import strongest_pairs_sketched
+        if sketch < 50:
+            raise typer.BadParameter("--sketch must hold at least the 50 pairs listed")
+        sketched = strongest_pairs_sketched(load_history(json_file), 50, sketch, exact, policy)
+        print(sketched.describe())
+        print("Strength Count  Pair")
+        for value, (left, right), count in sketched.pairs:
+            print(f"{value:8.3f}:{count:5d} {left}\n               {right}\n")
+        return
+    analysis = cochange_analysis(load_history(json_file), policy, jobs)
+    strong_pairs = strongest_pairs_by_ranking(analysis, limit=50)
+    report = analysis.mega_commit_report
+    bounds = analysis.error_bounds([pair for _, pair, _ in strong_pairs])
+    if policy.action != gminer.types.MegaCommitAction.keep:
+        print(report.describe(policy))
     print("Strength Count  Pair")
-    for value, (left, right), count in strong_pairs[:50]:
-        print(f"{value:8.3f}:{count:5d} {left}\n               {right}\n")
+    for (value, (left, right), count), bound in zip(strong_pairs, bounds):
+        margin = f" (+{bound:.3f} at most)" if bound else ""
+        print(f"{value:8.3f}:{count:5d} {left}{margin}\n               {right}\n")
+
+
+@app.command("super-connectors")
+def cli_super_connectors(
+        json_file: str,
+        size: Annotated[int, typer.Option("--size", "-s", help="How many files to list")] = 20,
+        neighbors: Annotated[int, typer.Option(help="Also list each file's strongest neighbors")] = 0,
+        weighted: Annotated[bool, typer.Option(help="Rank by the sum of pair strengths, not the neighbor count")
+                            ] = False,
+        index: IndexOption = False,
+):
+    """
+    Files committed together with the most other files.
+    """
+    if index:
+        from .cochange_index import load_cochange_index
+        graph = load_cochange_index(json_file).index.graph()
+    else:
+        from .associative_modularity import cochange_analysis
+        from .history_store import load_history
+        graph = cochange_analysis(load_history(json_file)).cochange_graph
+    print("Super-connectors")
+    for connections, filename in graph.super_connectors(size, weighted):
+        print(f"{connections:8.3f} {filename}" if weighted else f"{connections:8d} {filename}")
+        for strength, neighbor, count in graph.top_neighbors(filename, neighbors):
+            print(f"         {strength:8.3f}:{count:5d} {neighbor}")
 
 
 @app.command("tightest-groupings")
 def tightest_groupings(
         json_file: str,
-        after: Annotated[datetime, typer.Option("--since")] = None
+        after: Annotated[datetime, typer.Option("--since")] = None,
+        mega_commits: MegaCommitsOption = gminer.types.MegaCommitAction.keep,
+        mega_commit_size: MegaCommitSizeOption = 100,
+        sample_size: SampleSizeOption = 20,
+        jobs: AnalysisJobsOption = 1,
+        index: IndexOption = False,
+        rebuild_index: RebuildIndexOption = False,
+        threshold: Annotated[gminer.types.EdgeThreshold, typer.Option(
+            help="Which pairs join files: above the spread limit, above --quantile, or each file's --top-k")
+        ] = gminer.types.EdgeThreshold.spread,
+        quantile: Annotated[float, typer.Option(min=0.0, max=1.0)] = 0.99,
+        top_k: Annotated[int, typer.Option(min=1)] = 3,
+        method: Annotated[gminer.types.GroupingMethod, typer.Option(
+            help="Group by connected components, or split them into Louvain communities")
+        ] = gminer.types.GroupingMethod.components,
+        resolution: Annotated[float, typer.Option(help="Louvain resolution; higher makes smaller groups")] = 1.0,
 ):
     """
     List the tightest groupings of source files.
 
     Groupings are defined by the frequency in which files were committed together.
-    By default, the last 12 months are examined.
+    By default, the last 12 months are examined; with --index, the whole history.
     """
-    from .associative_modularity import tight_groupings
+    from .associative_modularity import GroupingOptions, tight_groupings
+    policy = mega_commit_policy(mega_commits, mega_commit_size, sample_size)
+    options = GroupingOptions(threshold, quantile, top_k, method, resolution)
+    use_index = index or rebuild_index
+    if use_index and (after or mega_commits != gminer.types.MegaCommitAction.keep):
+        raise typer.BadParameter("--index covers the whole history; "
+                                 "it can't be combined with --since or --mega-commits")
     since = after.date() if after else (datetime.now().date() - timedelta(weeks=52))
-    tight_groupings(json_file, since.isoformat())
+    tight_groupings(json_file, since.isoformat(), policy, jobs, use_index, rebuild_index, options)
+
+
+@app.command("coupling-trend")
+def cli_coupling_trend(
+        json_file: str,
+        first: str,
+        second: str,
+        period: Annotated[gminer.types.Period, typer.Option(help="Bucket the commits by day, week or month")] = "week",
+        window: Annotated[int, typer.Option(min=1, help="Trailing window, in periods")] = 13,
+        step: Annotated[int, typer.Option(min=1, help="Periods between windows")] = 1,
+        after: Annotated[datetime, typer.Option("--since")] = None,
+        before: Annotated[datetime, typer.Option("--until")] = None,
+):
+    """
+    How strongly two files have been coupled over time.
+
+    Prints the pair's strength and co-commit count over a trailing window
+    (by default 13 weeks, about 90 days), stepped one period at a time.
+    """
+    from .temporal_coupling import coupling_trend
+    trend = coupling_trend(json_file, first, second, period, window, step, after, before)
+    if not trend:
+        print("No commits in range")
+        return
+    print(f"Coupling of {first}\n        and {second}")
+    print(f"{f'Window ({window} {period}s)':23} Strength Count")
+    for start, end, strength, count in trend:
+        print(f"{start} .. {end} {strength:8.3f}:{count:5d}")
 
 
-def analyze_and_report(source: str, destination: str):
-    repo: git.Repo
-    extract: gminer.types.GitHistoryDataframe
+@app.command("report")
+def cli_report(
+        source: str,
+        destination: str,
+        size: Annotated[int, typer.Option("--size", "-s", help="How many files and pairs to list")] = 50,
+        repo_path: Annotated[str, typer.Option(
+            "--repo", help="The extract's repository, for the release intervals")] = None,
+        release_pattern: Annotated[str, typer.Option(help="Tags matching this are releases")] = r"v?\d",
+        mega_commits: MegaCommitsOption = gminer.types.MegaCommitAction.keep,
+        mega_commit_size: MegaCommitSizeOption = 100,
+        sample_size: SampleSizeOption = 20,
+        workers: Annotated[int, typer.Option(min=1, help="Threads running the analyses side by side")] = 4,
+        jobs: AnalysisJobsOption = 1,
+):
+    """
+    Run every analysis of SOURCE (an extract or a repository) into DEST.
+
+    The history is loaded once and the analyses share it, and the co-change
+    analysis, running side by side where they can. Each writes a CSV or
+    JSON file; report.json lists them.
+    """
+    from .report import ReportOptions
+    options = ReportOptions(size, mega_commit_policy(mega_commits, mega_commit_size, sample_size),
+                            release_pattern=release_pattern, workers=workers, jobs=jobs)
+    manifest = analyze_and_report(source, destination, options, repo_path)
+    print(f"Report of {manifest['commits']} commits in {destination}")
+    for task, filenames in manifest["outputs"].items():
+        print(f"  {task:20} {manifest['seconds'][task]:8.3f}s  {', '.join(filenames)}")
+    for task in manifest["skipped"]:
+        print(f"  {task:20} skipped: no repository (use --repo)")
+
+
+def analyze_and_report(source: str, destination: str, options=None, repo_path: str = None) -> dict:
+    """
+    Everything we can say about SOURCE, written into destination: from a
+    repository, its history is read straight from git and its tags are
+    reported too; from an extract, the tags only if repo_path is given.
+    """
+    import git
+    from .history_store import HistoryStore, load_history
+    from .report import ReportOptions, write_report
 
     if not isdir(source) and not isfile(source):
         raise ValueError(source, "not a dir or a repo extract file")
     if not isdir(destination):
         os.makedirs(destination)
-    else:
-        ...  # Empty or version existing files
 
-    if isdir(source) and git.repo.fun.is_git_dir(source):
-        ...  # do all the things we can do with a repo
+    repo = git.Repo(repo_path) if repo_path else None
+    if isdir(source) and _is_repository(source):
+        from .extractor import emit_commit_records, stats_cache_for
+        repo = git.Repo(source)
+        with stats_cache_for(repo, True) as cache:
+            history = HistoryStore.from_records(emit_commit_records(repo, cache=cache))
     else:
-        ...  # do all the
+        history = load_history(source)
+    return write_report(history, destination, options or ReportOptions(), repo, source)
+
+
+def _is_repository(path: str) -> bool:
+    import git
+    try:
+        git.Repo(path).close()
+    except (git.InvalidGitRepositoryError, git.NoSuchPathError):
+        return False
+    return True
 
 
 if __name__ == "__main__":
@@ -1,19 +1,24 @@
-from collections import Counter
+from datetime import datetime
+from typing import Optional
 
 import typer
 
-from gminer.types import FEKey
-from gminer.utility import read_git_history_from_file
+from gminer.churn_index import load_churn_index, most_committed_files
+from gminer.types import FileRanking
 
 
-def count_files_in_commits(json_file: str, goal: int) -> None:
-    p = read_git_history_from_file(json_file)
-    counter = Counter()
-    for files in p.files:
-        counter.update(x[FEKey.filename] for x in files)
-    print(f"TOP {goal} most committed files:")
-    for filename, commits in counter.most_common(goal):
-        print(f"  {commits}: {filename}")
+def count_files_in_commits(json_file: str, goal: int, by: FileRanking = FileRanking.commits,
+                           after: Optional[datetime] = None, before: Optional[datetime] = None) -> None:
+    index, history, _, _ = load_churn_index(json_file)
+    most_common = most_committed_files(index, history, goal, by, after, before)
+    if by == FileRanking.commits:
+        print(f"TOP {goal} most committed files:")
+        for file in most_common:
+            print(f"  {file.commits}: {file.filename}")
+    else:
+        print(f"TOP {goal} files by churn (lines inserted + deleted):")
+        for file in most_common:
+            print(f"  {file.churn}: {file.filename} (+{file.insertions} -{file.deletions}, {file.commits} commits)")
 
 
 if __name__ == '__main__':
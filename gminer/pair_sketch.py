@@ -0,0 +1,114 @@
+"""
+The strongest pairs of files, in bounded memory.
+
+CoChangeAnalysis holds every pair the history ever made, which is fine
+until a repository makes tens of millions of them. strongest_pairs_sketched
+streams the pairs instead, a chunk of commits at a time, into a summary of
+at most `capacity` pairs (the Misra-Gries / Space-Saving heavy-hitter
+summary): when it overflows, the (capacity + 1)-th largest strength is
+subtracted from every pair and those left at zero or below are dropped.
+Whatever was subtracted in total is the error bound; for any pair
+
+    summary strength <= exact strength <= summary strength + error
+
+so no pair outside the summary can be stronger than `error`.
+
+The optional second pass streams the history again and adds up the exact
+strengths and counts of the candidates only: the pairs whose upper bound
+reaches the limit-th largest lower bound. When that lower bound is above
+the error, the candidates are sure to hold the true top pairs, and the
+result is the same as strongest_pairs_by_ranking's.
+"""
+from typing import NamedTuple
+
+import numpy
+
+from gminer.cochange import CHUNK_PAIRS, MegaCommitPolicy, apply_mega_commit_policy, filename_rank, iter_pair_chunks
+from gminer.cochange_graph import ranking_strengths
+from gminer.history_store import HistoryStore
+
+SKETCH_CAPACITY = 1_000_000
+
+
+class SketchedPairs(NamedTuple):
+    """
+    pairs       (strength, pair, count), strongest first; after the exact
+                pass the values are exact, otherwise lower bounds
+    error       how much stronger than its summary value a pair may be
+    exact       whether the second pass recounted the pairs
+    certain     whether, after the exact pass, no pair left out could
+                belong among them
+    capacity    the summary's size in pairs
+    total_pairs the pairs streamed (one per commit they were in)
+    """
+    pairs: list[tuple[float, tuple[str, str], int]]
+    error: float
+    exact: bool
+    certain: bool
+    capacity: int
+    total_pairs: int
+
+    def describe(self) -> str:
+        if self.certain:
+            outcome = "exact, and sure to be the strongest"
+        elif self.exact:
+            outcome = f"exact, but pairs left out of the sketch may be as strong as {self.error:.3f}"
+        else:
+            outcome = f"lower bounds, each at most {self.error:.3f} below the exact strength"
+        return f"Sketch of {self.capacity:,} pairs over {self.total_pairs:,} co-changes: strengths are {outcome}"
+
+
+def strongest_pairs_sketched(history: HistoryStore, limit: int = 50, capacity: int = SKETCH_CAPACITY,
+                             exact: bool = True, policy: MegaCommitPolicy = MegaCommitPolicy(),
+                             chunk_pairs: int = CHUNK_PAIRS) -> SketchedPairs:
+    """
+    The `limit` strongest pairs, keeping at most `capacity` pairs (plus
+    one chunk) in memory at any time.
+    """
+    if capacity < limit:
+        raise ValueError(f"a sketch of {capacity} pairs can't hold the top {limit}")
+    history, weights, _ = apply_mega_commit_policy(history, policy)
+    rank = filename_rank(history)
+    keys = numpy.zeros(0, dtype=numpy.int64)
+    strengths = numpy.zeros(0)
+    counts = numpy.zeros(0, dtype=numpy.int64)
+    error = 0.0
+    total_pairs = 0
+    for chunk_keys, chunk_commits in iter_pair_chunks(history, rank, chunk_pairs):
+        chunk_weights = weights[chunk_commits]
+        total_pairs += len(chunk_keys)
+        keys, inverse = numpy.unique(numpy.concatenate([keys, chunk_keys]), return_inverse=True)
+        strengths = numpy.bincount(inverse, numpy.concatenate([strengths, chunk_weights]), len(keys))
+        counts = numpy.bincount(inverse, numpy.concatenate([counts, numpy.ones(len(chunk_keys), numpy.int64)]),
+                                len(keys)).astype(numpy.int64)
+        if len(keys) > capacity:
+            threshold = numpy.partition(strengths, len(keys) - capacity - 1)[len(keys) - capacity - 1]
+            strengths = strengths - threshold
+            kept = strengths > 0
+            keys, strengths, counts = keys[kept], strengths[kept], counts[kept]
+            error += threshold
+
+    top = numpy.sort(strengths)[::-1][:limit]
+    floor = top[-1] if len(top) == limit else 0.0
+    certain = exact and (error == 0 or floor > error)
+    if exact:
+        # pairs that tie with the floor once rounded may still rank above it
+        candidates = keys[ranking_strengths(strengths + error) >= ranking_strengths(floor)] if len(keys) else keys
+        strengths, counts = numpy.zeros(len(candidates)), numpy.zeros(len(candidates), dtype=numpy.int64)
+        for chunk_keys, chunk_commits in iter_pair_chunks(history, rank, chunk_pairs):
+            chunk_weights = weights[chunk_commits]
+            positions = numpy.searchsorted(candidates, chunk_keys)
+            found = positions < len(candidates)
+            found[found] = candidates[positions[found]] == chunk_keys[found]
+            # one at a time, in commit order: the same sums as the pair-by-pair loop
+            numpy.add.at(strengths, positions[found], chunk_weights[found])
+            numpy.add.at(counts, positions[found], 1)
+        keys = candidates
+
+    files = len(history.filenames)
+    firsts, seconds = keys // files, keys % files
+    ranked = numpy.lexsort((counts, rank[seconds], rank[firsts], ranking_strengths(strengths)))[::-1][:limit]
+    names = history.filenames
+    pairs = [(float(strengths[index]), (names[int(firsts[index])], names[int(seconds[index])]), int(counts[index]))
+             for index in ranked]
+    return SketchedPairs(pairs, float(error), exact, bool(certain), capacity, total_pairs)
@@ -1,29 +1,81 @@
+"""
+Commit statistics bucketed by day, ISO week or month.
+
+Every statistic here comes from one table with a row per commit: its
+date, from the store's parsed datetime column, and what it measured
+(files touched, lines inserted and deleted, author). The dates are
+converted to the requested time zone and floored to the start of their
+day, week (Monday) or month, and a single groupby sums or counts each
+metric per bucket.
+"""
 from collections import Counter
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Sequence
 
+import numpy
 import pandas
 from pytz import utc
 
-from gminer.types import GitHistoryDataframe
+from gminer.history_store import HistoryStore
+from gminer.types import GitHistoryDataframe, Metric, Period
 from gminer.utility import read_git_history_from_file
 
 
-def count_commits_per_day(history_df: GitHistoryDataframe, *, after: datetime = None,
-                          before: datetime = None) -> Counter:
+def commit_metrics(history: HistoryStore) -> pandas.DataFrame:
     """
-    I suspect that this can be done entirely in Pandas, but
-    not knowing how, I fell back on Counter() to count the
-    number of commits per day.
+    One row per commit, in extract order, indexed by its date in UTC.
+    Authors are the commit's author ids; co-authors aren't counted.
     """
-    between_dates = conditional_range(after, before)
-
-    counts = Counter(
-        d.date()
-        for d in pandas.to_datetime(history_df.date, utc=True)
-        if between_dates(d)
-    )
-    return counts
+    commit_ids = history.change_commit_ids()
+    return pandas.DataFrame({
+        Metric.commits: numpy.ones(len(history), dtype=numpy.int64),
+        Metric.files: history.sizes.astype(numpy.int64),
+        Metric.insertions: numpy.bincount(commit_ids, history.insertions, len(history)).astype(numpy.int64),
+        Metric.deletions: numpy.bincount(commit_ids, history.deletions, len(history)).astype(numpy.int64),
+        Metric.authors: history.author_ids,
+    }, index=history.datetimes())
+
+
+def period_starts(dates: pandas.DatetimeIndex, period: Period, timezone: str = "UTC") -> pandas.DatetimeIndex:
+    """
+    The (naive, local) start of the day, ISO week or month each date falls
+    in, on the clock of the time zone.
+    """
+    days = dates.tz_convert(timezone).tz_localize(None).normalize()
+    if period == Period.week:
+        return days - pandas.to_timedelta(days.weekday, unit="D")
+    if period == Period.month:
+        return days.to_period("M").to_timestamp()
+    return days
+
+
+def stats_per_period(history: HistoryStore, period: Period = Period.day,
+                     metrics: Sequence[Metric] = tuple(Metric), timezone: str = "UTC",
+                     chronological: bool = True) -> pandas.DataFrame:
+    """
+    Each metric per period, indexed by the periods' starts: the number of
+    commits, files touched, lines inserted and deleted (all summed over
+    the commits), and distinct authors. Only periods with commits are
+    listed, oldest first, or with chronological=False in the order the
+    extract first reaches them (newest first).
+    """
+    table = commit_metrics(history)
+    buckets = table.groupby(period_starts(table.index, period, timezone), sort=chronological)
+    aggregations = {metric: (metric, "nunique" if metric == Metric.authors else "sum") for metric in metrics}
+    stats = buckets.agg(**{str(metric): aggregation for metric, aggregation in aggregations.items()})
+    stats.index.name = str(period)
+    return stats.astype(numpy.int64)
+
+
+def count_commits_per_day(history_df: GitHistoryDataframe | HistoryStore, *, after: datetime = None,
+                          before: datetime = None, timezone: str = "UTC") -> Counter:
+    """
+    Commits per day, by date, in order of first appearance (newest first).
+    """
+    history = history_df if isinstance(history_df, HistoryStore) else HistoryStore.from_dataframe(history_df)
+    commits = stats_per_period(history.between(after, before), Period.day, [Metric.commits], timezone,
+                               chronological=False)[Metric.commits]
+    return Counter(dict(zip(commits.index.date.tolist(), commits.tolist())))
 
 
 if __name__ == '__main__':
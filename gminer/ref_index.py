@@ -0,0 +1,186 @@
+"""
+Every branch and tag of a repository, read with one git for-each-ref.
+
+Going through GitPython's repo.tags reads each tag's objects one at a
+time (tag_ref.commit.authored_datetime), which on a repository with tens
+of thousands of tags is tens of thousands of object reads. A single
+for-each-ref lists every ref with its target and, for annotated tags,
+the commit it peels to, along with that commit's author and committer
+dates.
+
+The result is cached in the repository's git directory
+(.git/gminer-cache/refs.json) under a fingerprint of its refs: the size
+and modification time of packed-refs and of every loose ref. Until a ref
+is added, moved or deleted, loading the index is a directory walk and a
+JSON read, and within a process it isn't even that.
+"""
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from gminer.git_log import git
+from gminer.types import RefKind
+
+CACHE_DIRECTORY = "gminer-cache"
+CACHE_FILE = "refs.json"
+CACHE_VERSION = 1
+
+REF_PREFIXES = {"refs/heads/": RefKind.branch, "refs/remotes/": RefKind.remote, "refs/tags/": RefKind.tag}
+REF_FIELDS = ["refname", "objecttype", "objectname", "*objecttype", "*objectname",
+              "authordate:iso-strict", "committerdate:iso-strict", "*authordate:iso-strict",
+              "*committerdate:iso-strict"]
+
+
+class Ref(NamedTuple):
+    """
+    name        as GitPython names it: v1.0, main, origin/main
+    object_type what the ref points at: commit, or tag for an annotated tag
+    target      the sha the ref points at
+    commit      the commit it peels to; None if it isn't a commit
+    authored    the commit's author and committer dates, in their own
+    committed   time zones
+    """
+    name: str
+    refname: str
+    kind: RefKind
+    object_type: str
+    target: str
+    commit: Optional[str]
+    authored: Optional[datetime]
+    committed: Optional[datetime]
+
+
+class RefIndex:
+    def __init__(self, refs: list[Ref]):
+        self.refs = refs
+
+    def __len__(self) -> int:
+        return len(self.refs)
+
+    def of_kind(self, kind: RefKind) -> list[Ref]:
+        return [ref for ref in self.refs if ref.kind == kind]
+
+    @property
+    def tags(self) -> list[Ref]:
+        return self.of_kind(RefKind.tag)
+
+    @property
+    def branches(self) -> list[Ref]:
+        return self.of_kind(RefKind.branch)
+
+    def by_date(self, kind: RefKind = RefKind.tag) -> list[Ref]:
+        """
+        The refs of this kind that reach a commit, oldest authored first;
+        refs authored at the same moment stay in name order.
+        """
+        return sorted((ref for ref in self.of_kind(kind) if ref.commit), key=lambda ref: ref.authored)
+
+
+_loaded: dict[str, tuple[str, RefIndex]] = {}
+
+
+def load_ref_index(git_dir: str, use_cache: bool = True) -> RefIndex:
+    """
+    The refs of the repository whose git directory (repo.common_dir) is
+    git_dir, from the cache while its refs haven't changed.
+    """
+    if not use_cache:
+        return RefIndex(read_refs(git_dir))
+    state = refs_state(git_dir)
+    loaded = _loaded.get(git_dir)
+    if loaded and loaded[0] == state:
+        return loaded[1]
+    cache_path = os.path.join(git_dir, CACHE_DIRECTORY, CACHE_FILE)
+    refs = _read_cache(cache_path, state)
+    if refs is None:
+        refs = read_refs(git_dir)
+        _write_cache(cache_path, state, refs)
+    index = RefIndex(refs)
+    _loaded[git_dir] = (state, index)
+    return index
+
+
+def read_refs(git_dir: str) -> list[Ref]:
+    """
+    Branches, remote branches and tags, in refname order.
+    """
+    output = git(git_dir, "for-each-ref", "--format=" + "%00".join(f"%({field})" for field in REF_FIELDS),
+                 *REF_PREFIXES)
+    refs = []
+    for line in output.splitlines():
+        refname, object_type, target, peeled_type, peeled, authored, committed, *peeled_dates = line.split("\0")
+        if object_type == "tag":
+            if peeled_type == "tag":
+                # a tag of a tag: rare enough to peel one at a time
+                peeled, authored, committed = _peel(git_dir, refname)
+            else:
+                peeled = peeled if peeled_type == "commit" else None
+                authored, committed = peeled_dates
+        else:
+            peeled = target if object_type == "commit" else None
+        prefix = next(prefix for prefix in REF_PREFIXES if refname.startswith(prefix))
+        refs.append(Ref(refname[len(prefix):], refname, REF_PREFIXES[prefix], object_type, target, peeled,
+                        _date(authored) if peeled else None, _date(committed) if peeled else None))
+    return refs
+
+
+def refs_state(git_dir: str) -> str:
+    """
+    A fingerprint of the refs: git rewrites a ref (or packed-refs) by
+    renaming a new file into place, so any change shows in these stats.
+    """
+    paths = [os.path.join(git_dir, "packed-refs")]
+    for top in ("refs", "reftable"):
+        for root, directories, files in os.walk(os.path.join(git_dir, top)):
+            directories.sort()
+            paths.extend(os.path.join(root, name) for name in sorted(files))
+    entries = []
+    for path in paths:
+        try:
+            status = os.stat(path)
+        except OSError:
+            continue
+        entries.append(f"{os.path.relpath(path, git_dir)}\0{status.st_size}\0{status.st_mtime_ns}")
+    return hashlib.sha1("\n".join(entries).encode()).hexdigest()
+
+
+def _peel(git_dir: str, refname: str) -> tuple[Optional[str], str, str]:
+    try:
+        output = git(git_dir, "show", "-s", "--format=%H%x00%aI%x00%cI", f"{refname}^{{commit}}")
+    except subprocess.CalledProcessError:
+        return None, "", ""
+    commit, authored, committed = output.strip().split("\0")
+    return commit, authored, committed
+
+
+def _date(text: str) -> datetime:
+    return datetime.fromisoformat(text)
+
+
+def _read_cache(path: str, state: str) -> Optional[list[Ref]]:
+    try:
+        with open(path) as source:
+            cached = json.load(source)
+    except (OSError, ValueError):
+        return None
+    if cached.get("version") != CACHE_VERSION or cached.get("state") != state:
+        return None
+    return [Ref(name, refname, RefKind(kind), object_type, target, commit,
+                _date(authored) if authored else None, _date(committed) if committed else None)
+            for name, refname, kind, object_type, target, commit, authored, committed in cached["refs"]]
+
+
+def _write_cache(path: str, state: str, refs: list[Ref]) -> None:
+    rows = [[*ref[:6], ref.authored and ref.authored.isoformat(), ref.committed and ref.committed.isoformat()]
+            for ref in refs]
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(path), suffix=".partial", delete=False) as out:
+            json.dump(dict(version=CACHE_VERSION, state=state, refs=rows), out)
+        os.replace(out.name, path)
+    except OSError:
+        pass  # e.g. a read-only repository: the index is simply read again next time
@@ -0,0 +1,230 @@
+"""
+Every analysis of one history, written to a directory in one run.
+
+The history is loaded once. The analyses are tasks in a small dependency
+graph: each names the results it needs, and a task starts as soon as
+those are ready, so the ones that don't depend on each other run side by
+side in a thread pool. Threads rather than processes, because the tasks
+share the history and the co-change analysis as they are in memory, and
+the NumPy and SciPy work that dominates them releases the GIL.
+
+    history ─┬─ commits_per_day, most_committed, mega_commits
+             └─ cochange ─┬─ strongest_pairs
+                          ├─ tightest_groupings
+                          └─ super_connectors
+    releases (with a repository)
+
+Each task writes its own CSV or JSON file into the destination, and
+report.json lists what was written, how long each task took, and which
+tasks were skipped.
+"""
+import csv
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, NamedTuple, Optional
+
+import pandas
+
+from gminer.associative_modularity import GroupingOptions, significant_groups
+from gminer.churn_index import ChurnIndex, most_committed_files
+from gminer.cochange import CoChangeAnalysis, MegaCommitPolicy
+from gminer.history_store import HistoryStore
+from gminer.per_date_stats import stats_per_period
+from gminer.types import FileRanking, Period
+
+REPORT_MANIFEST = "report.json"
+
+
+class ReportOptions(NamedTuple):
+    """
+    size            how many files, pairs and super-connectors to list
+    policy          the mega-commit policy for the co-change analysis
+    grouping        how tightest_groupings forms its groups
+    release_pattern the tag names that count as releases
+    workers         threads running the tasks
+    jobs            processes for the co-change products
+    """
+    size: int = 50
+    policy: MegaCommitPolicy = MegaCommitPolicy()
+    grouping: GroupingOptions = GroupingOptions()
+    release_pattern: str = r"v?\d"
+    workers: int = 4
+    jobs: int = 1
+
+
+class Task(NamedTuple):
+    name: str
+    needs: tuple[str, ...]
+    run: Callable[..., Any]  # called with the results of `needs`, in order
+
+
+class TaskTiming(NamedTuple):
+    name: str
+    seconds: float
+
+
+def run_tasks(tasks: list[Task], workers: int = 4) -> tuple[dict[str, Any], list[TaskTiming]]:
+    """
+    The result of every task, running each once all it needs is done, and
+    how long each one took, in the order they finished. The first task to
+    fail stops the run: nothing more is started, and its error is raised.
+    """
+    by_name = {task.name: task for task in tasks}
+    for task in tasks:
+        unknown = [need for need in task.needs if need not in by_name]
+        if unknown:
+            raise ValueError(f"task {task.name} needs unknown tasks {', '.join(unknown)}")
+    results: dict[str, Any] = {}
+    finished: list[tuple[float, TaskTiming]] = []
+    waiting = list(tasks)
+    running: dict[Future, str] = {}
+
+    def timed(task: Task, inputs: list) -> tuple[Any, float, float]:
+        started = time.perf_counter()
+        result = task.run(*inputs)
+        return result, started, time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        while waiting or running:
+            ready = [task for task in waiting if all(need in results for need in task.needs)]
+            for task in ready:
+                waiting.remove(task)
+                running[executor.submit(timed, task, [results[need] for need in task.needs])] = task.name
+            if not running:
+                raise ValueError(f"tasks {', '.join(task.name for task in waiting)} depend on each other")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name], started, ended = future.result()
+                except BaseException:
+                    for pending in running:
+                        pending.cancel()
+                    raise
+                finished.append((ended, TaskTiming(name, ended - started)))
+    return results, [timing for _, timing in sorted(finished, key=lambda entry: entry[0])]
+
+
+def report_tasks(history: HistoryStore, destination: str, options: ReportOptions = ReportOptions(),
+                 repo=None) -> tuple[list[Task], list[str]]:
+    """
+    The report's tasks over this history, writing into destination, and
+    the names of those left out (releases, without a repository).
+    """
+    def output(filename: str) -> str:
+        return os.path.join(destination, filename)
+
+    def commits_per_day(store: HistoryStore) -> str:
+        stats = stats_per_period(store, Period.day)
+        stats.index = stats.index.date
+        stats.to_csv(output("commits_per_day.csv"), index_label="day")
+        return "commits_per_day.csv"
+
+    def most_committed(store: HistoryStore) -> list[str]:
+        index = ChurnIndex.build(store)
+        written = []
+        for ranking, filename in [(FileRanking.commits, "most_committed.csv"), (FileRanking.churn, "most_churn.csv")]:
+            files = most_committed_files(index, store, options.size, ranking)
+            _write_csv(output(filename), ["filename", "commits", "insertions", "deletions", "churn"],
+                       ([file.filename, file.commits, file.insertions, file.deletions, file.churn]
+                        for file in files))
+            written.append(filename)
+        return written
+
+    def mega_commits(store: HistoryStore) -> str:
+        sizes = store.sizes
+        _write_csv(output("mega_commits.csv"), ["hash", "date", "files", "message"],
+                   ([store.hashes[index], store.date_of(index).isoformat(), int(sizes[index]),
+                     store.messages[index].split("\n", 1)[0]]
+                    for index in (sizes > options.policy.max_files).nonzero()[0].tolist()))
+        return "mega_commits.csv"
+
+    def cochange(store: HistoryStore) -> CoChangeAnalysis:
+        return CoChangeAnalysis(store, options.policy, options.jobs)
+
+    def strongest_pairs(analysis: CoChangeAnalysis) -> str:
+        pairs = analysis.strongest_pairs(options.size)
+        bounds = analysis.error_bounds([pair for _, pair, _ in pairs])
+        _write_csv(output("strongest_pairs.csv"), ["strength", "count", "first", "second", "error_bound"],
+                   ([strength, count, first, second, bound]
+                    for (strength, (first, second), count), bound in zip(pairs, bounds)))
+        return "strongest_pairs.csv"
+
+    def tightest_groupings(analysis: CoChangeAnalysis) -> str:
+        strengths = analysis.strengths
+        groups = significant_groups(analysis.history, strengths.row, strengths.col, strengths.data,
+                                    options=options.grouping)
+        _write_json(output("tightest_groupings.json"), [sorted(group) for group in groups])
+        return "tightest_groupings.json"
+
+    def super_connectors(analysis: CoChangeAnalysis) -> str:
+        graph = analysis.cochange_graph
+        strengths = dict(zip(graph.filenames, graph.weighted_degrees.tolist()))
+        _write_csv(output("super_connectors.csv"), ["filename", "neighbors", "total_strength"],
+                   ([filename, neighbors, strengths[filename]]
+                    for neighbors, filename in graph.super_connectors(options.size)))
+        return "super_connectors.csv"
+
+    def releases() -> str:
+        from gminer.miner import release_tag_intervals
+        intervals = release_tag_intervals(repo, options.release_pattern)
+        rows = [] if intervals.empty else intervals[["name", "timestamp", "days_since"]].itertuples(index=False)
+        _write_csv(output("release_intervals.csv"), ["tag", "timestamp", "days_since"],
+                   ([name, timestamp.isoformat(), None if pandas.isna(days) else int(days)]
+                    for name, timestamp, days in rows))
+        return "release_intervals.csv"
+
+    tasks = [
+        Task("history", (), lambda: history),
+        Task("commits_per_day", ("history",), commits_per_day),
+        Task("most_committed", ("history",), most_committed),
+        Task("mega_commits", ("history",), mega_commits),
+        Task("cochange", ("history",), cochange),
+        Task("strongest_pairs", ("cochange",), strongest_pairs),
+        Task("tightest_groupings", ("cochange",), tightest_groupings),
+        Task("super_connectors", ("cochange",), super_connectors),
+    ]
+    if repo is None:
+        return tasks, ["releases"]
+    return tasks + [Task("releases", (), releases)], []
+
+
+def write_report(history: HistoryStore, destination: str, options: ReportOptions = ReportOptions(),
+                 repo=None, source: Optional[str] = None) -> dict:
+    """
+    Run every analysis of the history into destination, and write and
+    return the manifest.
+    """
+    os.makedirs(destination, exist_ok=True)
+    tasks, skipped = report_tasks(history, destination, options, repo)
+    results, timings = run_tasks(tasks, options.workers)
+    outputs = {}
+    for task in tasks:
+        written = results[task.name]
+        if isinstance(written, str):
+            outputs[task.name] = [written]
+        elif isinstance(written, list):
+            outputs[task.name] = written
+    manifest = dict(
+        source=source,
+        commits=len(history),
+        outputs=outputs,
+        seconds={timing.name: round(timing.seconds, 3) for timing in timings},
+        skipped=skipped,
+    )
+    _write_json(os.path.join(destination, REPORT_MANIFEST), manifest)
+    return manifest
+
+
+def _write_csv(path: str, header: list[str], rows) -> None:
+    with open(path, "w", newline="", encoding="utf-8") as out:
+        writer = csv.writer(out)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def _write_json(path: str, value) -> None:
+    with open(path, "w", encoding="utf-8") as out:
+        json.dump(value, out, indent=2)
@@ -0,0 +1,136 @@
+"""
+An on-disk cache of per-commit numstat results, keyed by commit sha.
+
+Commits never change, so their stats only need computing once per
+repository. The cache is a SQLite database under the repository's git
+directory (.git/gminer-cache/stats.sqlite), shared by the extractor and
+the dash app. It runs in WAL mode, so any number of processes can read
+it while another one is writing.
+
+Stats are stored in the extract's form: the list of file entries
+(filename, insertions, deletions, lines, change_type) and the totals.
+"""
+import json
+import os
+import sqlite3
+from itertools import islice
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+from gminer.git_log import iter_commit_records
+
+CACHE_DIRECTORY = "gminer-cache"
+CACHE_FILE = "stats.sqlite"
+# Keep well below SQLite's limit on the number of bound parameters
+LOOKUP_BATCH = 500
+BUSY_TIMEOUT_SECONDS = 30
+
+
+class CommitStats(NamedTuple):
+    """
+    Shaped like GitPython's Stats: files maps filename to its counts.
+    """
+    total: dict
+    files: dict
+
+    @classmethod
+    def from_record(cls, files: list[dict], totals: dict) -> "CommitStats":
+        return cls(
+            total=totals,
+            files={entry["filename"]: {k: v for k, v in entry.items() if k != "filename"} for entry in files}
+        )
+
+
+class CommitStatsCache:
+    def __init__(self, git_dir: str):
+        self.path = os.path.join(git_dir, CACHE_DIRECTORY, CACHE_FILE)
+        self.connection: Optional[sqlite3.Connection] = None
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_SECONDS)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS stats"
+                " (sha TEXT PRIMARY KEY, files TEXT NOT NULL, totals TEXT NOT NULL) WITHOUT ROWID")
+            self.connection.commit()
+        except (OSError, sqlite3.Error):
+            # e.g. a read-only repository: carry on without a cache
+            self.close()
+
+    def close(self) -> None:
+        if self.connection:
+            self.connection.close()
+        self.connection = None
+
+    def __enter__(self) -> "CommitStatsCache":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def get_many(self, shas: Iterable[str]) -> dict[str, tuple[list[dict], dict]]:
+        """
+        (files, totals) for each of the shas that are in the cache.
+        """
+        found = {}
+        if not self.connection:
+            return found
+        shas = iter(shas)
+        while batch := list(islice(shas, LOOKUP_BATCH)):
+            placeholders = ",".join("?" * len(batch))
+            rows = self.connection.execute(
+                f"SELECT sha, files, totals FROM stats WHERE sha IN ({placeholders})", batch)
+            for sha, files, totals in rows:
+                found[sha] = (json.loads(files), json.loads(totals))
+        return found
+
+    def put_many(self, entries: Iterable[tuple[str, list[dict], dict]]) -> None:
+        if not self.connection:
+            return
+        rows = [(sha, json.dumps(files), json.dumps(totals)) for sha, files, totals in entries]
+        try:
+            with self.connection:
+                self.connection.executemany("INSERT OR IGNORE INTO stats VALUES (?, ?, ?)", rows)
+        except sqlite3.Error:
+            pass  # a cache that can't be written is still a cache that can be read
+
+
+def lookup_stats(repo_path: str, cache: CommitStatsCache, shas: list[str]) -> dict[str, tuple[list[dict], dict]]:
+    """
+    (files, totals) for each sha: from the cache where we can, and from a
+    single git log over the missing shas otherwise. Newly computed stats
+    are added to the cache.
+    """
+    stats = cache.get_many(shas)
+    missing = [sha for sha in shas if sha not in stats]
+    if missing:
+        computed = {
+            record["hash"]: (record["files"], record["totals"])
+            for record in iter_commit_records(repo_path, commits=missing)
+        }
+        cache.put_many((sha, files, totals) for sha, (files, totals) in computed.items())
+        stats.update(computed)
+    return stats
+
+
+def fill_stats(repo_path: str, records: Iterable[dict], cache: CommitStatsCache,
+               batch_size: int = 1000) -> Iterator[dict]:
+    """
+    Fill in the files and totals of records that were read without stats,
+    a batch at a time.
+    """
+    records = iter(records)
+    while batch := list(islice(records, batch_size)):
+        stats = lookup_stats(repo_path, cache, [record["hash"] for record in batch])
+        for record in batch:
+            record["files"], record["totals"] = stats[record["hash"]]
+            yield record
+
+
+def cached_commit_stats(git_dir: str, shas: Iterable[str]) -> dict[str, CommitStats]:
+    """
+    Stats for many commits at once, running git only for the ones not cached yet.
+    """
+    shas = list(shas)
+    with CommitStatsCache(git_dir) as cache:
+        stats = lookup_stats(git_dir, cache, shas)
+    return {sha: CommitStats.from_record(*stats[sha]) for sha in shas}
@@ -0,0 +1,169 @@
+"""
+How the coupling of files changes over time.
+
+TemporalCoupling reads the history once, sharing each commit's pair
+strengths (1/len(files)) and counts out into UTC days, weeks (starting
+on Monday) or calendar months. It keeps one sorted series of buckets per
+pair, so the strength of a pair over any run of buckets is a difference
+of two prefix sums, and a rolling window never looks at a commit again.
+
+coupling_trend is the trailing-window series for one pair of files, as
+the coupling-trend command prints it. It only buckets the commits that
+touched both files, so a query reads the two files' changes rather than
+every pair in the history.
+"""
+from datetime import date, datetime, timedelta
+from typing import NamedTuple, Optional
+
+import numpy
+
+from gminer.cochange import CHUNK_PAIRS, filename_rank, iter_pair_chunks
+from gminer.history_store import HistoryStore, load_history
+from gminer.types import Period
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class TrendPoint(NamedTuple):
+    start: date  # the window's first day
+    end: date  # and its last
+    strength: float
+    count: int
+
+
+def bucket_numbers(timestamps: numpy.ndarray, period: Period) -> numpy.ndarray:
+    """
+    Days, weeks (Monday to Sunday) or months since the epoch, in UTC.
+    """
+    days = numpy.asarray(timestamps) // SECONDS_PER_DAY
+    if period == Period.day:
+        return days
+    if period == Period.week:
+        # 1970-01-01 was a Thursday
+        return (days + 3) // 7
+    return days.astype("datetime64[D]").astype("datetime64[M]").astype(numpy.int64)
+
+
+def bucket_start(number: int, period: Period) -> date:
+    number = int(number)
+    if period == Period.day:
+        return numpy.datetime64(number, "D").item()
+    if period == Period.week:
+        return numpy.datetime64(number * 7 - 3, "D").item()
+    return numpy.datetime64(number, "M").astype("datetime64[D]").item()
+
+
+class TemporalCoupling:
+    """
+    For each pair (first, second), keyed first * files + second with
+    first's name sorting before second's, the strength and count it got
+    in each bucket it had commits in: entries are sorted by key, then by
+    bucket, and offsets[i]:offsets[i + 1] are the entries of keys[i].
+    """
+
+    def __init__(self, history: HistoryStore, period: Period = Period.week, chunk_pairs: int = CHUNK_PAIRS,
+                 pair: Optional[tuple[str, str]] = None):
+        """
+        With a pair of filenames, only that pair is bucketed, from the
+        commits that touched both; every other pair's series is empty.
+        """
+        self.history = history
+        self.period = period
+        commit_buckets = bucket_numbers(history.timestamps, period)
+        self.first_bucket = int(commit_buckets.min()) if len(history) else 0
+        self.buckets = int(commit_buckets.max()) - self.first_bucket + 1 if len(history) else 0
+        commit_buckets = commit_buckets - self.first_bucket
+        weights = 1.0 / numpy.maximum(history.sizes, 1)
+        entries = numpy.zeros(0, dtype=numpy.int64)
+        strengths = numpy.zeros(0)
+        counts = numpy.zeros(0, dtype=numpy.int64)
+        chunks = [self._pair_chunk(*pair)] if pair else iter_pair_chunks(history, filename_rank(history), chunk_pairs)
+        for keys, commits in chunks:
+            chunk_entries = keys * self.buckets + commit_buckets[commits]
+            entries, inverse = numpy.unique(numpy.concatenate([entries, chunk_entries]), return_inverse=True)
+            strengths = numpy.bincount(inverse, numpy.concatenate([strengths, weights[commits]]), len(entries))
+            counts = numpy.bincount(inverse, numpy.concatenate([counts, numpy.ones(len(keys), numpy.int64)]),
+                                    len(entries)).astype(numpy.int64)
+        pair_keys = entries // self.buckets if self.buckets else entries
+        self.keys, starts = numpy.unique(pair_keys, return_index=True)
+        self.offsets = numpy.append(starts, len(entries))
+        self.entry_buckets = entries - pair_keys * self.buckets
+        self.strengths = strengths
+        self.counts = counts
+
+    def label(self, bucket: int) -> date:
+        return bucket_start(self.first_bucket + bucket, self.period)
+
+    def series(self, first: str, second: str) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        The pair's strength and count in every bucket, from the first
+        commit's to the last one's.
+        """
+        strengths, counts = numpy.zeros(self.buckets), numpy.zeros(self.buckets, dtype=numpy.int64)
+        found = self._entries(first, second)
+        if found is not None:
+            strengths[self.entry_buckets[found]] = self.strengths[found]
+            counts[self.entry_buckets[found]] = self.counts[found]
+        return strengths, counts
+
+    def rolling(self, first: str, second: str, window: int, step: int = 1) -> list[TrendPoint]:
+        """
+        The pair's strength and count over the trailing `window` buckets,
+        every `step` buckets back from the last one, oldest first. The
+        earliest windows may reach back before the history began.
+        """
+        strengths, counts = self.series(first, second)
+        strength_sums = numpy.concatenate([[0.0], numpy.cumsum(strengths)])
+        count_sums = numpy.concatenate([[0], numpy.cumsum(counts)])
+        ends = numpy.arange(self.buckets - 1, -1, -step)[::-1] + 1
+        starts = ends - window
+        clipped = numpy.maximum(starts, 0)
+        # a window that had nothing in it is 0.0, not a prefix sum's rounding error
+        window_counts = count_sums[ends] - count_sums[clipped]
+        window_strengths = numpy.where(window_counts > 0, strength_sums[ends] - strength_sums[clipped], 0.0)
+        return [TrendPoint(self.label(start), self.label(end) - timedelta(days=1), float(strength), int(count))
+                for start, end, strength, count in zip(starts.tolist(), ends.tolist(), window_strengths.tolist(),
+                                                       window_counts.tolist())]
+
+    def _pair_chunk(self, first: str, second: str) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        The pair's key, once for each commit that touched both files, as
+        iter_pair_chunks would give them.
+        """
+        key = self._key(first, second)
+        if key is None:
+            return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+        files = len(self.history.filenames)
+        commit_of_change = self.history.change_commit_ids()
+        commits = numpy.intersect1d(commit_of_change[self.history.file_ids == key // files],
+                                    commit_of_change[self.history.file_ids == key % files])
+        return numpy.full(len(commits), key, dtype=numpy.int64), commits
+
+    def _key(self, first: str, second: str) -> Optional[int]:
+        first_id, second_id = self.history.file_id(first), self.history.file_id(second)
+        if first_id is None or second_id is None or first_id == second_id:
+            return None
+        if first > second:
+            first_id, second_id = second_id, first_id
+        return first_id * len(self.history.filenames) + second_id
+
+    def _entries(self, first: str, second: str) -> Optional[slice]:
+        key = self._key(first, second)
+        if key is None:
+            return None
+        position = int(numpy.searchsorted(self.keys, key))
+        if position == len(self.keys) or self.keys[position] != key:
+            return None
+        return slice(self.offsets[position], self.offsets[position + 1])
+
+
+def coupling_trend(json_source: str, first: str, second: str, period: Period = Period.week, window: int = 13,
+                   step: int = 1, after: Optional[datetime] = None,
+                   before: Optional[datetime] = None) -> list[TrendPoint]:
+    """
+    The strength of the coupling between two files over a trailing window
+    of `window` days, weeks or months, stepped `step` at a time (by default the
+    trailing 13 weeks, about 90 days, week by week).
+    """
+    history = load_history(json_source, after=after, before=before)
+    return TemporalCoupling(history, period, pair=(first, second)).rolling(first, second, window, step)
@@ -1,20 +1,22 @@
 from enum import StrEnum
-from typing import Protocol, Dict, Iterable
+from typing import TYPE_CHECKING, Protocol, Dict, Iterable
 
-import pandas as pd
+if TYPE_CHECKING:
+    # only for the annotations, so that importing the enums stays cheap
+    import pandas as pd
 
 
 class GitHistoryDataframe(Protocol):
     columns: Iterable[str]
-    hash: pd.Series  # of string
-    author: pd.Series  # of string
-    coauthors: pd.Series  # of lists of strings
-    date: pd.Series  # of datetime
-    message: pd.Series  # of string
-    files: pd.Series  # of dictionaries
-    totals: pd.Series  # of dictionaries
-
-    def query(self, query: str) -> pd.DataFrame:
+    hash: "pd.Series"  # of string
+    author: "pd.Series"  # of string
+    coauthors: "pd.Series"  # of lists of strings
+    date: "pd.Series"  # of datetime
+    message: "pd.Series"  # of string
+    files: "pd.Series"  # of dictionaries
+    totals: "pd.Series"  # of dictionaries
+
+    def query(self, query: str) -> "pd.DataFrame":
         ...
 
 
@@ -24,3 +26,57 @@ FilesEntry = Dict[str, ChangeSummary]
 
 class FEKey(StrEnum):
     filename = "filename"
+
+
+class ExtractEngine(StrEnum):
+    log = "log"
+    gitpython = "gitpython"
+
+
+class ExtractFormat(StrEnum):
+    json = "json"
+    jsonl = "jsonl"
+    parquet = "parquet"
+
+
+class MegaCommitAction(StrEnum):
+    keep = "keep"
+    skip = "skip"
+    sample = "sample"
+    collapse = "collapse"
+
+
+class Period(StrEnum):
+    day = "day"
+    week = "week"
+    month = "month"
+
+
+class Metric(StrEnum):
+    commits = "commits"
+    files = "files"
+    insertions = "insertions"
+    deletions = "deletions"
+    authors = "authors"
+
+
+class FileRanking(StrEnum):
+    commits = "commits"
+    churn = "churn"
+
+
+class RefKind(StrEnum):
+    branch = "branch"
+    remote = "remote"
+    tag = "tag"
+
+
+class EdgeThreshold(StrEnum):
+    spread = "spread"
+    quantile = "quantile"
+    top_k = "top-k"
+
+
+class GroupingMethod(StrEnum):
+    components = "components"
+    louvain = "louvain"
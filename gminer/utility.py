@@ -1,9 +1,166 @@
-from typing import cast
+import gzip
+import io
+import json
+import os
+from datetime import datetime
+from itertools import chain, islice
+from typing import cast, Iterable, Iterator, Optional, TextIO
 
 import pandas
 
-from gminer.types import GitHistoryDataframe
+from gminer.types import GitHistoryDataframe, ExtractFormat
 
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".zst": "zstd"}
+JSON_LINES_SUFFIXES = (".jsonl", ".ndjson")
+PARQUET_SUFFIX = ".parquet"
+HISTORY_COLUMNS = ["hash", "author", "coauthors", "date", "message", "files", "totals"]
 
-def read_git_history_from_file(json_file: str) -> GitHistoryDataframe:
-    return cast(GitHistoryDataframe, pandas.read_json(json_file))
+
+def read_git_history_from_file(json_file: str, after: Optional[datetime] = None,
+                               before: Optional[datetime] = None) -> GitHistoryDataframe:
+    """
+    Load any extract; the reader is picked by the extract's format,
+    so a *.parquet extract is loaded from its columnar tables.
+
+    With after and/or before, only the commits strictly between them are
+    loaded. They are picked out of the extract's HistoryStore sidecar by
+    date, and only those commits are turned into rows.
+    """
+    if after is not None or before is not None:
+        from gminer.history_store import load_history
+        return load_history(json_file, after=after, before=before).to_dataframe()
+    match extract_format(json_file):
+        case ExtractFormat.parquet:
+            from gminer.columnar import read_columnar_history
+            return read_columnar_history(json_file)
+        case ExtractFormat.jsonl:
+            return cast(GitHistoryDataframe, pandas.read_json(json_file, lines=True))
+        case _:
+            return cast(GitHistoryDataframe, pandas.read_json(json_file))
+
+
+def read_git_history_in_chunks(json_file: str, chunk_size: int = 10_000) -> Iterator[GitHistoryDataframe]:
+    """
+    The history as a series of dataframes of at most chunk_size commits,
+    so that a large extract can be processed in constant memory.
+
+    Each batch goes through pandas.read_json, so the columns are converted
+    the same way as read_git_history_from_file converts them.
+    """
+    if extract_format(json_file) == ExtractFormat.parquet:
+        from gminer.columnar import read_columnar_history_in_chunks
+        yield from read_columnar_history_in_chunks(json_file, chunk_size)
+        return
+    record_texts = iter_record_texts(json_file)
+    while batch := list(islice(record_texts, chunk_size)):
+        yield cast(GitHistoryDataframe, pandas.read_json(io.StringIO("\n".join(batch)), lines=True))
+
+
+def history_frame_from_records(records: Iterable[dict]) -> GitHistoryDataframe:
+    """
+    The same dataframe pandas.read_json builds from an extract,
+    including its attempt to turn the dates into datetimes.
+    """
+    return with_parsed_dates(pandas.DataFrame.from_records(list(records), columns=HISTORY_COLUMNS))
+
+
+def with_parsed_dates(frame: pandas.DataFrame) -> GitHistoryDataframe:
+    """
+    The frame with its dates turned into datetimes where pandas.read_json would.
+    """
+    try:
+        frame["date"] = pandas.to_datetime(frame["date"])
+    except (ValueError, TypeError, OverflowError):
+        pass  # e.g. mixed UTC offsets; read_json leaves those as strings too
+    return cast(GitHistoryDataframe, frame)
+
+
+def compression_of(path: str) -> Optional[str]:
+    for suffix, compression in COMPRESSION_SUFFIXES.items():
+        if path.endswith(suffix):
+            return compression
+    return None
+
+
+def format_for_name(path: str) -> ExtractFormat:
+    """
+    The format implied by a file name, e.g. history.jsonl.gz is JSON Lines.
+    """
+    if path.endswith(PARQUET_SUFFIX):
+        return ExtractFormat.parquet
+    name = path
+    for suffix in COMPRESSION_SUFFIXES:
+        name = name.removesuffix(suffix)
+    return ExtractFormat.jsonl if name.endswith(JSON_LINES_SUFFIXES) else ExtractFormat.json
+
+
+def open_extract(path: str, mode: str = "rt", compression: Optional[str] = None) -> TextIO:
+    """
+    Open an extract as text, (de)compressing it according to its suffix
+    unless a compression is given.
+    """
+    compression = compression or compression_of(path)
+    if compression == "gzip":
+        return cast(TextIO, gzip.open(path, mode, encoding="utf-8"))
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError(path, "zstd compression needs the 'zstandard' package installed")
+        return cast(TextIO, zstandard.open(path, mode, encoding="utf-8"))
+    return open(path, mode, encoding="utf-8")
+
+
+def extract_format(path: str) -> ExtractFormat:
+    """
+    An array extract starts with "[", a JSON Lines extract with a record.
+    A columnar extract is a directory of Parquet tables.
+    """
+    if path.endswith(PARQUET_SUFFIX) or os.path.isdir(path):
+        return ExtractFormat.parquet
+    with open_extract(path) as source:
+        while character := source.read(1):
+            if not character.isspace():
+                return ExtractFormat.json if character == "[" else ExtractFormat.jsonl
+    return format_for_name(path)
+
+
+def iter_record_texts(json_file: str) -> Iterator[str]:
+    """
+    The JSON text of each commit record in an extract, in file order,
+    without parsing it.
+
+    JSON Lines extracts hold a record per line. The extractor also writes
+    its arrays one record per line, so those can be read one line at a time
+    too; any other array layout is parsed as a whole. Columnar extracts
+    are turned back into records.
+    """
+    if extract_format(json_file) == ExtractFormat.parquet:
+        from gminer.columnar import records_to_texts
+        yield from records_to_texts(json_file)
+        return
+    with open_extract(json_file) as source:
+        opening, first_record = source.readline(), source.readline()
+        if not (opening + first_record).strip():
+            return
+        if opening.lstrip().startswith("{"):
+            lines = chain([opening, first_record], source)
+        elif opening.strip() == "[" and _is_record_line(first_record):
+            lines = chain([first_record], source)
+        else:
+            whole = json.loads(opening + first_record + source.read())
+            yield from (json.dumps(record) for record in whole)
+            return
+        for line in lines:
+            text = line.strip().rstrip(",")
+            if text.startswith("{"):
+                yield text
+
+
+def _is_record_line(line: str) -> bool:
+    text = line.strip().rstrip(",")
+    return text == "]" or (text.startswith("{") and text.endswith("}"))
+
+
+def iter_history_records(json_file: str) -> Iterator[dict]:
+    return (json.loads(text) for text in iter_record_texts(json_file))
@@ -0,0 +1,104 @@
+import json
+import os
+import subprocess
+import tempfile
+
+GIT_ENVIRONMENT = {
+    "GIT_AUTHOR_NAME": "Pat Author",
+    "GIT_AUTHOR_EMAIL": "pat@example.com",
+    "GIT_COMMITTER_NAME": "Pat Author",
+    "GIT_COMMITTER_EMAIL": "pat@example.com",
+    "GIT_CONFIG_GLOBAL": os.devnull,
+    "GIT_CONFIG_NOSYSTEM": "1",
+}
+
+
+class SampleRepo:
+    """
+    A small scratch repository with a known history:
+    plain edits, a binary file, a co-authored commit, a merge, an empty commit,
+    and commit dates a day apart starting at 2023-01-02 (a Monday).
+    """
+
+    def __init__(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = self._directory.name
+        self.day = 0
+        self.git("init", "-q", "-b", "main")
+
+    def cleanup(self):
+        self._directory.cleanup()
+
+    def git(self, *args) -> str:
+        timestamp = f"2023-01-{2 + self.day:02d}T12:00:00+02:00"
+        environment = {**os.environ, **GIT_ENVIRONMENT,
+                       "GIT_AUTHOR_DATE": timestamp, "GIT_COMMITTER_DATE": timestamp}
+        completed = subprocess.run(["git", "-C", self.path, *args], env=environment,
+                                   check=True, capture_output=True, text=True)
+        return completed.stdout
+
+    def write(self, filename: str, content: str | bytes):
+        full_path = os.path.join(self.path, filename)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        mode = "wb" if isinstance(content, bytes) else "w"
+        with open(full_path, mode) as f:
+            f.write(content)
+
+    def commit(self, message: str, **files: str | bytes) -> str:
+        for filename, content in files.items():
+            self.write(filename.replace("__", "/"), content)
+        self.git("add", "-A")
+        self.git("commit", "-q", "--allow-empty", "-m", message)
+        self.day += 1
+        return self.head()
+
+    def head(self) -> str:
+        return self.git("rev-parse", "HEAD").strip()
+
+    @classmethod
+    def standard(cls) -> "SampleRepo":
+        repo = cls()
+        repo.commit("first", **{"a.txt": "a\n", "src__core.py": "x = 1\ny = 2\n"})
+        repo.commit("second\n\nbody line\n\nCo-authored-by: Lee Helper <lee@example.com>",
+                    **{"a.txt": "a\nb\n", "image.bin": b"\0\1\2"})
+        repo.git("checkout", "-q", "-b", "side")
+        repo.commit("side work", **{"src__side.py": "s = 1\n", "src__core.py": "x = 1\n"})
+        repo.git("checkout", "-q", "main")
+        repo.commit("main work", **{"docs__readme.md": "hello\n", "a.txt": "a\nb\nc\n"})
+        repo.git("merge", "-q", "--no-edit", "side")
+        repo.day += 1
+        repo.commit("empty")
+        repo.commit("last", **{"src__core.py": "x = 2\n", "src__side.py": "s = 2\n", "a.txt": "c\n"})
+        return repo
+
+
+class ScratchExtract:
+    """
+    An extract file in a scratch directory, written from records or
+    extracted from the standard sample repository.
+    """
+
+    def __init__(self, name: str = "history.json"):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._directory.name, name)
+
+    def cleanup(self):
+        self._directory.cleanup()
+
+    def write(self, records: list[dict]):
+        with open(self.path, "w") as out:
+            json.dump(records, out)
+
+    def extract_standard(self, *options: str):
+        """
+        Extracts SampleRepo.standard() with the given extract-to-json
+        options; its commits have the same hashes every time.
+        """
+        from typer.testing import CliRunner
+        from gminer.miner import app
+        repo = SampleRepo.standard()
+        try:
+            result = CliRunner().invoke(app, ["extract-to-json", repo.path, "-o", self.path, *options])
+        finally:
+            repo.cleanup()
+        assert result.exit_code == 0, result.output
@@ -0,0 +1,102 @@
+import os
+import random
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import numpy
+
+from gminer.churn_index import ChurnIndex, file_totals, index_path, load_churn_index, most_committed_files
+from gminer.types import FileRanking
+from tests.sample_repo import ScratchExtract
+from tests.test_per_date_stats import random_history
+
+
+class ChurnIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.records = list(random_history(commits=300).iter_records())
+        self.extract = ScratchExtract()
+        self.path = self.extract.path
+        self.write = self.extract.write
+
+    def tearDown(self):
+        self.extract.cleanup()
+
+    def assertCountsTheWindow(self, index: ChurnIndex, history, after, before):
+        window = history.between(after, before)
+        files = len(history.filenames)
+        commits, insertions, deletions = file_totals(index, history, after, before)
+        self.assertEqual(numpy.bincount(window.file_ids, minlength=files).tolist(), commits.tolist())
+        self.assertEqual(numpy.bincount(window.file_ids, window.insertions, files).tolist(), insertions.tolist())
+        self.assertEqual(numpy.bincount(window.file_ids, window.deletions, files).tolist(), deletions.tolist())
+
+    def test_windows_match_counting_their_commits(self):
+        self.write(self.records)
+        index, history, _, _ = load_churn_index(self.path)
+        generator = random.Random(7)
+        start = datetime(2023, 12, 15, tzinfo=timezone.utc)
+        windows = [(None, None), (start + timedelta(days=30), None), (None, start + timedelta(days=30)),
+                   (start + timedelta(days=9, hours=5), start + timedelta(days=10))]
+        for _ in range(40):
+            after = start + timedelta(seconds=generator.randint(0, 100 * 86400))
+            windows.append((after, after + timedelta(seconds=generator.randint(0, 40 * 86400))))
+        for after, before in windows:
+            with self.subTest(after=after, before=before):
+                self.assertCountsTheWindow(index, history, after, before)
+
+    def test_top_files_as_most_committed_ranks_them(self):
+        self.write(self.records)
+        index, history, _, _ = load_churn_index(self.path)
+        self.assertEqual(history.most_committed(5),
+                         [(file.filename, file.commits) for file in most_committed_files(index, history, 5)])
+        churn = most_committed_files(index, history, 3, FileRanking.churn)
+        every_file = most_committed_files(index, history, len(history.filenames), FileRanking.churn)
+        self.assertEqual(sorted(every_file, key=lambda file: -file.churn)[:3], churn)
+
+    def test_new_commits_are_folded_in(self):
+        self.write(self.records[100:])
+        first = load_churn_index(self.path)
+        self.assertEqual((200, True), (first.added, first.rebuilt))
+        self.write(self.records)
+        second = load_churn_index(self.path)
+        self.assertEqual((100, False), (second.added, second.rebuilt))
+        rebuilt = ChurnIndex.build(second.history)
+        for name in ChurnIndex.ARRAYS:
+            self.assertEqual(getattr(rebuilt, name).tolist(), getattr(second.index, name).tolist(), name)
+
+    def test_up_to_date_index_is_mapped_and_rewrites_rebuild_it(self):
+        self.write(self.records)
+        load_churn_index(self.path)
+        again = load_churn_index(self.path)
+        self.assertEqual((0, False), (again.added, again.rebuilt))
+        self.assertIsInstance(again.index.commits, numpy.memmap)
+        self.assertTrue(os.path.isdir(index_path(self.path)))
+        self.write(self.records[:250])
+        rewritten = load_churn_index(self.path)
+        self.assertEqual((250, True), (rewritten.added, rewritten.rebuilt))
+        self.assertCountsTheWindow(rewritten.index, rewritten.history, None, None)
+
+    def test_extract_with_other_filters_is_indexed_again(self):
+        self.extract.extract_standard()
+        load_churn_index(self.path)
+        self.extract.extract_standard('-x', 'src/')
+        update = load_churn_index(self.path)
+        self.assertTrue(update.rebuilt)
+        listed = most_committed_files(update.index, update.history, 10,
+                                      after=datetime(2023, 1, 3, tzinfo=timezone.utc))
+        self.assertEqual([], [file.filename for file in listed if file.filename.startswith('src/')])
+        self.assertCountsTheWindow(update.index, update.history, None, None)
+        self.assertCountsTheWindow(update.index, update.history, datetime(2023, 1, 3, tzinfo=timezone.utc), None)
+
+    def test_command_options(self):
+        from typer.testing import CliRunner
+        from gminer.miner import app
+        self.write(self.records)
+        result = CliRunner().invoke(app, ['most-committed', self.path, '--by', 'churn', '--since', '2024-01-10',
+                                          '--until', '2024-02-01', '-s', '3'])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertEqual('TOP 3 files by churn (lines inserted + deleted):', result.output.splitlines()[0])
+        self.assertEqual(4, len(result.output.splitlines()))
+
+
+if __name__ == '__main__':
+    unittest.main()
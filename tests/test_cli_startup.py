@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import gminer
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(gminer.__file__)))
+# `miner --help` took over a second while the module imported pandas, git
+# and the analyses; without them it takes a fifth of that
+HELP_IMPORT_BUDGET_SECONDS = 0.5
+HEAVY_MODULES = {"pandas", "numpy", "scipy", "networkx", "git", "pyarrow", "plotly"}
+
+
+def imports_of(*arguments: str) -> dict[str, int]:
+    """
+    The modules `miner ARGUMENTS` imports, with the cumulative microseconds
+    each top-level import took (as python -X importtime reports them;
+    nested imports are reported as 0).
+    """
+    environment = {**os.environ, "PYTHONPATH": REPOSITORY}
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "from gminer.miner import app; app()", *arguments],
+        env=environment, cwd=REPOSITORY, capture_output=True, text=True)
+    imported = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        top_level = len(name) - len(name.lstrip()) == 1
+        imported[name.strip()] = int(cumulative) if top_level else 0
+    return imported
+
+
+class CliStartupTestCase(unittest.TestCase):
+    def test_help_imports_nothing_heavy(self):
+        imported = imports_of("--help")
+        self.assertIn("gminer.miner", imported)
+        self.assertEqual(set(), {name for name in imported if name.split(".")[0] in HEAVY_MODULES})
+
+    def test_help_within_import_budget(self):
+        # the best of three, so that a busy machine doesn't fail it
+        seconds = min(sum(imports_of("--help").values()) for _ in range(3)) / 1_000_000
+        self.assertLess(seconds, HELP_IMPORT_BUDGET_SECONDS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,243 @@
+import random
+import statistics
+import unittest
+from collections import Counter, defaultdict
+from itertools import combinations
+
+import numpy
+
+from gminer.associative_modularity import (GroupingOptions, calculate_relative_strengths, count_combinations,
+                                           list_mega_commits, list_super_connectors, significant_groups_from_df,
+                                           strongest_pairs_by_ranking)
+from gminer.cochange import CoChangeAnalysis, MegaCommitPolicy, cochange_matrix, pair_counts, pair_strengths
+from gminer.cochange_graph import RANK_DECIMALS
+from gminer.types import EdgeThreshold, GroupingMethod, MegaCommitAction
+from gminer.history_store import HistoryStore
+
+
+def random_history(commits: int = 300, seed: int = 3) -> HistoryStore:
+    generator = random.Random(seed)
+    files = [f"pkg{number % 7}/module{number}.py" for number in range(300)]
+    records = []
+    for number in range(commits):
+        chosen = sorted(generator.sample(files, generator.choice([0, 1, 2, 2, 3, 5, 12])))
+        records.append(dict(hash=f"{number:040x}", author="Pat", coauthors=[],
+                            date=f"2023-01-01T00:{number // 60 % 60:02d}:{number % 60:02d}+00:00", message="",
+                            files=[dict(filename=name, insertions=1, deletions=0, lines=1) for name in chosen]))
+    return HistoryStore.from_records(records)
+
+
+def strengths_pair_by_pair(history: HistoryStore) -> dict:
+    result = defaultdict(float)
+    for filenames in history.iter_filenames():
+        strength = (1.0 / len(filenames)) if filenames else 0
+        for pair in combinations(filenames, 2):
+            result[pair] += strength
+    return result
+
+
+class CoChangeTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.history = random_history()
+
+    def test_counts_match_combinations(self):
+        expected = Counter(pair for names in self.history.iter_filenames() for pair in combinations(names, 2))
+        self.assertEqual(expected, Counter(pair_counts(self.history)))
+        self.assertEqual(expected, count_combinations(self.history))
+
+    def test_strengths_are_summed_to_the_same_floats(self):
+        expected = strengths_pair_by_pair(self.history)
+        actual = pair_strengths(self.history)
+        self.assertEqual(expected, actual)
+        self.assertEqual(expected, calculate_relative_strengths(self.history))
+
+    def test_each_pair_is_held_once(self):
+        matrix = cochange_matrix(self.history)
+        self.assertEqual(len(pair_counts(self.history)), matrix.nnz)
+        self.assertFalse((matrix.row == matrix.col).any())
+
+    def test_ranking_matches_sorting_the_tuples(self):
+        strengths = strengths_pair_by_pair(self.history)
+        counts = Counter(pair for names in self.history.iter_filenames() for pair in combinations(names, 2))
+        # strengths that differ only past RANK_DECIMALS places are tied
+        ranked = sorted(((numpy.round(value, RANK_DECIMALS), pair, counts[pair], value)
+                         for pair, value in strengths.items()), reverse=True)
+        expected = [(value, pair, count) for _, pair, count, value in ranked]
+        self.assertEqual(expected, strongest_pairs_by_ranking(self.history))
+        self.assertEqual(expected[:10], strongest_pairs_by_ranking(self.history, limit=10))
+
+    def test_groups_come_out_in_the_same_order(self):
+        import networkx as nx
+        strengths = strengths_pair_by_pair(self.history)
+        average = statistics.mean(strengths.values())
+        limit = (max(strengths.values()) - average) / 5 + average
+        graph = nx.Graph()
+        graph.add_weighted_edges_from((a, b, w) for (a, b), w in strengths.items() if w > limit)
+        expected = [sorted(group) for group in nx.connected_components(graph)]
+        actual = [sorted(group) for group in significant_groups_from_df(self.history)]
+        self.assertGreater(len(expected), 1)
+        self.assertEqual(expected, actual)
+
+    def test_pool_gives_the_serial_matrices(self):
+        serial = CoChangeAnalysis(self.history)
+        for jobs in [2, 3]:
+            with self.subTest(jobs=jobs):
+                pooled = CoChangeAnalysis(self.history, jobs=jobs)
+                for name in ['counts', 'strengths']:
+                    expected, actual = getattr(serial, name), getattr(pooled, name)
+                    self.assertEqual(expected.data.dtype, actual.data.dtype)
+                    for part in ['row', 'col', 'data']:
+                        self.assertEqual(getattr(expected, part).tolist(), getattr(actual, part).tolist())
+                self.assertEqual(strongest_pairs_by_ranking(serial), strongest_pairs_by_ranking(pooled))
+
+    def test_thresholds_pick_the_pairs(self):
+        strengths = strengths_pair_by_pair(self.history)
+        values = numpy.array(list(strengths.values()))
+        limit = numpy.quantile(values, 0.9)
+        expected = nx_components((a, b) for (a, b), value in strengths.items() if value > limit)
+        options = GroupingOptions(EdgeThreshold.quantile, quantile=0.9)
+        self.assertEqual(expected, [sorted(group) for group in significant_groups_from_df(self.history,
+                                                                                          options=options)])
+        best = defaultdict(list)
+        for pair, value in strengths.items():
+            for name in pair:
+                best[name].append((-value, list(strengths).index(pair), pair))
+        chosen = {pair for ranked in best.values() for _, _, pair in sorted(ranked)[:2]}
+        expected = nx_components(pair for pair in strengths if pair in chosen)
+        options = GroupingOptions(EdgeThreshold.top_k, top_k=2)
+        self.assertEqual(expected, [sorted(group) for group in significant_groups_from_df(self.history,
+                                                                                          options=options)])
+
+    def test_louvain_splits_the_components(self):
+        options = GroupingOptions(EdgeThreshold.quantile, quantile=0.5)
+        components = [set(group) for group in significant_groups_from_df(self.history, options=options)]
+        communities = significant_groups_from_df(self.history, options=options._replace(
+            method=GroupingMethod.louvain))
+        self.assertGreater(len(communities), len(components))
+        for community in communities:
+            self.assertGreater(len(community), 1)
+            self.assertEqual(1, sum(community <= component for component in components))
+        self.assertEqual(communities, significant_groups_from_df(self.history, options=options._replace(
+            method=GroupingMethod.louvain)))
+
+
+def nx_components(pairs) -> list[list[str]]:
+    import networkx as nx
+    graph = nx.Graph()
+    graph.add_edges_from(pairs)
+    return [sorted(group) for group in nx.connected_components(graph)]
+
+
+class CoChangeAnalysisTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        import networkx as nx
+        cls.history = random_history(commits=120)
+        cls.analysis = CoChangeAnalysis(cls.history, MegaCommitPolicy(max_files=10))
+        cls.graph = nx.Graph([pair for names in cls.history.iter_filenames() for pair in combinations(names, 2)])
+
+    def test_counts_and_strengths_line_up(self):
+        self.assertEqual(pair_counts(self.history), self.analysis.pair_counts())
+        self.assertEqual(pair_strengths(self.history), self.analysis.pair_strengths())
+
+    def test_super_connectors_match_the_graph(self):
+        expected = sorted(((degree, name) for name, degree in self.graph.degree), reverse=True)
+        self.assertEqual(expected[:20], list_super_connectors(self.analysis))
+        self.assertEqual(expected, self.analysis.super_connectors(None))
+
+    def test_neighbors_come_in_graph_order(self):
+        for _, filename in self.analysis.super_connectors(5):
+            with self.subTest(filename):
+                self.assertEqual(list(self.graph.neighbors(filename)), self.analysis.neighbors(filename))
+        self.assertEqual([], self.analysis.neighbors('no/such/file.py'))
+
+    def test_graph_has_the_same_edges(self):
+        graph = self.analysis.graph()
+        self.assertEqual(set(self.graph.nodes), set(graph.nodes))
+        self.assertEqual({frozenset(edge) for edge in self.graph.edges}, {frozenset(edge) for edge in graph.edges})
+
+    def test_mega_commits(self):
+        expected = [(index, len(names)) for index, names in enumerate(self.history.iter_filenames())
+                    if len(names) > 10]
+        self.assertTrue(expected)
+        self.assertEqual(expected, [(index, size) for index, size, *_ in list_mega_commits(self.analysis)])
+
+
+class MegaCommitPolicyTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.history = random_history(commits=120)
+        cls.exact = strengths_pair_by_pair(cls.history)
+        cls.mega = [index for index, size in enumerate(cls.history.sizes.tolist()) if size > 10]
+
+    def analysis(self, action: MegaCommitAction, **options) -> CoChangeAnalysis:
+        return CoChangeAnalysis(self.history, MegaCommitPolicy(action, max_files=10, **options))
+
+    def test_keep_is_the_default(self):
+        analysis = self.analysis(MegaCommitAction.keep)
+        self.assertEqual(self.exact, analysis.pair_strengths())
+        self.assertEqual(len(self.mega), analysis.mega_commit_report.commits)
+        self.assertEqual(0, analysis.mega_commit_report.avoided_pairs)
+
+    def test_skip_leaves_out_the_mega_commits(self):
+        others = numpy.ones(len(self.history), dtype=bool)
+        others[self.mega] = False
+        analysis = self.analysis(MegaCommitAction.skip)
+        self.assertEqual(pair_strengths(self.history.select(others)), analysis.pair_strengths())
+        report = analysis.mega_commit_report
+        self.assertEqual(report.possible_pairs, report.avoided_pairs)
+        self.assertEqual(sum(66 / 12 for _ in self.mega), report.skipped_strength)
+
+    def test_sampled_strengths_are_bounded_lower_estimates(self):
+        analysis = self.analysis(MegaCommitAction.sample, sample_size=4)
+        again = self.analysis(MegaCommitAction.sample, sample_size=4)
+        self.assertEqual(analysis.pair_strengths(), again.pair_strengths())
+        report = analysis.mega_commit_report
+        self.assertEqual(len(self.mega) * 6, report.generated_pairs)
+        estimates = analysis.pair_strengths()
+        bounds = dict(zip(self.exact, analysis.error_bounds(list(self.exact))))
+        for pair, exact in self.exact.items():
+            estimate = estimates.get(pair, 0.0)
+            self.assertLessEqual(estimate, exact + 1e-12)
+            self.assertLessEqual(exact, estimate + bounds[pair] + 1e-12)
+        self.assertAlmostEqual(sum(self.exact.values()) - sum(estimates.values()), report.skipped_strength)
+
+    def test_collapse_pairs_directories(self):
+        analysis = self.analysis(MegaCommitAction.collapse)
+        directories = [name for name in analysis.filenames if name.endswith('/')]
+        self.assertEqual(sorted({f"pkg{number}/" for number in range(7)}), sorted(directories))
+        expected = defaultdict(float, pair_strengths(analysis.history.select(
+            [index for index in range(len(self.history)) if index not in self.mega])))
+        for index in self.mega:
+            names = sorted({name.split('/')[0] + '/' for name in self.history.filenames_of(index)})
+            for pair in combinations(names, 2):
+                expected[pair] += 1 / len(names)
+        actual = analysis.pair_strengths()
+        self.assertEqual(set(expected), set(actual))
+        for pair, value in expected.items():
+            self.assertAlmostEqual(value, actual[pair])
+        self.assertEqual(self.mega, [index for index, *_ in analysis.list_mega_commits()])
+
+    def test_command_reports_the_work_avoided(self):
+        import json
+        import os
+        import tempfile
+        from typer.testing import CliRunner
+        from gminer.miner import app
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'history.json')
+            with open(path, 'w') as out:
+                json.dump(list(self.history.iter_records()), out)
+            for command in ['strongest-pairs', 'tightest-groupings']:
+                with self.subTest(command):
+                    arguments = [command, path, '--mega-commits', 'skip', '--mega-commit-size', '10', '--jobs', '2']
+                    if command == 'tightest-groupings':
+                        arguments += ['--since', '2022-01-01']
+                    result = CliRunner().invoke(app, arguments)
+                    self.assertEqual(0, result.exit_code, result.output)
+                    self.assertIn(f"Mega-commits (over 10 files, skip): {len(self.mega)}, ", result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+import networkx as nx
+
+from gminer.cochange import CoChangeAnalysis
+from gminer.cochange_index import CoChangeIndex
+from tests.test_cochange import random_history, strengths_pair_by_pair
+
+
+class CoChangeGraphTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.history = random_history()
+        cls.graph = CoChangeAnalysis(cls.history).cochange_graph
+        cls.expected = nx.Graph()
+        cls.expected.add_weighted_edges_from((a, b, w) for (a, b), w in strengths_pair_by_pair(cls.history).items())
+
+    def test_degrees_match_networkx(self):
+        for filename in self.expected:
+            file_id = self.graph.file_id(filename)
+            self.assertEqual(self.expected.degree(filename), self.graph.degrees[file_id])
+            self.assertAlmostEqual(self.expected.degree(filename, weight='weight'),
+                                   self.graph.weighted_degrees[file_id], places=12)
+
+    def test_super_connectors_rank_like_sorting(self):
+        by_count = sorted(((degree, name) for name, degree in self.expected.degree), reverse=True)
+        self.assertEqual(by_count[:20], self.graph.super_connectors(20))
+        weighted = dict(self.expected.degree(weight='weight'))
+        ranked = self.graph.super_connectors(None, weighted=True)
+        self.assertEqual(set(weighted), {name for _, name in ranked})
+        for (value, name), (next_value, _) in zip(ranked, ranked[1:]):
+            self.assertAlmostEqual(weighted[name], value, places=12)
+            self.assertGreaterEqual(value, next_value)
+
+    def test_top_neighbors_are_the_strongest_pairs(self):
+        _, filename = self.graph.super_connectors(1)[0]
+        counts = CoChangeAnalysis(self.history).pair_counts()
+        expected = sorted(((data['weight'], neighbor, counts[tuple(sorted((filename, neighbor)))])
+                           for neighbor, data in self.expected[filename].items()), reverse=True)
+        self.assertEqual(expected[:5], self.graph.top_neighbors(filename, 5))
+        self.assertEqual(sorted(self.expected[filename]), sorted(self.graph.neighbors(filename)))
+        self.assertEqual([], self.graph.top_neighbors('no/such/file.py'))
+
+    def test_exports_the_same_graph(self):
+        exported = self.graph.to_networkx()
+        self.assertEqual(set(self.expected.nodes), set(exported.nodes))
+        self.assertEqual({frozenset(edge) for edge in self.expected.edges},
+                         {frozenset(edge) for edge in exported.edges})
+        for first, second, weight in self.expected.edges(data='weight'):
+            self.assertEqual(weight, exported[first][second]['weight'])
+
+    def test_index_gives_the_same_graph(self):
+        graph = CoChangeIndex.build(self.history).graph()
+        self.assertEqual(self.graph.super_connectors(None), graph.super_connectors(None))
+        self.assertEqual(self.graph.super_connectors(None, weighted=True), graph.super_connectors(None, weighted=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import random
+import unittest
+
+import numpy
+
+from gminer.associative_modularity import calculate_relative_strengths, count_combinations, strongest_pairs_by_ranking
+from gminer.cochange_index import CoChangeIndex, index_path, load_cochange_index
+from gminer.history_store import HistoryStore
+from tests.sample_repo import ScratchExtract
+from tests.test_cochange import random_history
+
+
+class CoChangeIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.records = list(random_history(commits=300).iter_records())
+        self.extract = ScratchExtract()
+        self.path = self.extract.path
+        self.write = self.extract.write
+
+    def tearDown(self):
+        self.extract.cleanup()
+
+    def assertMatchesTheHistory(self, index: CoChangeIndex, history):
+        expected = calculate_relative_strengths(history)
+        actual = index.pair_strengths()
+        self.assertEqual(set(expected), set(actual))
+        for pair, strength in expected.items():
+            self.assertAlmostEqual(strength, actual[pair], places=12)
+        self.assertEqual(dict(count_combinations(history)), index.pair_counts())
+        self.assertEqual(dict(history.most_committed(None)), index.commit_counts())
+        self.assertEqual([(pair, count) for _, pair, count in strongest_pairs_by_ranking(history, 30)],
+                         [(pair, count) for _, pair, count in index.strongest_pairs(30)])
+
+    def test_new_commits_are_folded_in(self):
+        self.write(self.records[100:])
+        first = load_cochange_index(self.path)
+        self.assertEqual((200, True), (first.added, first.rebuilt))
+        self.write(self.records)
+        second = load_cochange_index(self.path)
+        self.assertEqual((100, False), (second.added, second.rebuilt))
+        self.assertEqual(300, second.index.commits)
+        self.assertMatchesTheHistory(second.index, second.history)
+
+    def test_folded_in_ties_rank_as_a_rebuild_does(self):
+        # few files and small commits: many pairs tie on sums of thirds and sixths
+        generator = random.Random(11)
+        files = [f"z{number}" for number in range(8)]
+        records = [dict(hash=f"{number:040x}", author="Pat", coauthors=[], date=f"2023-01-01T00:{number:02d}:00",
+                        message="", files=[dict(filename=name, insertions=1, deletions=0, lines=1)
+                                           for name in sorted(generator.sample(files, generator.choice([2, 3, 4])))])
+                   for number in range(60)]
+        history = HistoryStore.from_records(records)
+        for added in [1, 20, 45]:
+            with self.subTest(added=added):
+                folded = CoChangeIndex.build(history.select(numpy.arange(added, len(history)))).absorb(history, added)
+                rebuilt = CoChangeIndex.build(history)
+                self.assertEqual([(pair, count) for _, pair, count in rebuilt.strongest_pairs()],
+                                 [(pair, count) for _, pair, count in folded.strongest_pairs()])
+                self.assertEqual([(name, count) for _, name, count in rebuilt.graph().top_neighbors('z0', None)],
+                                 [(name, count) for _, name, count in folded.graph().top_neighbors('z0', None)])
+
+    def test_up_to_date_index_is_mapped(self):
+        self.write(self.records)
+        built = load_cochange_index(self.path).index
+        again = load_cochange_index(self.path)
+        self.assertEqual((0, False), (again.added, again.rebuilt))
+        self.assertIsInstance(again.index.strengths, numpy.memmap)
+        self.assertEqual(built.strongest_pairs(), again.index.strongest_pairs())
+        self.assertTrue(os.path.isdir(index_path(self.path)))
+
+    def test_rewritten_extract_is_indexed_again(self):
+        self.write(self.records)
+        load_cochange_index(self.path)
+        self.write(self.records[:250])
+        rewritten = load_cochange_index(self.path)
+        self.assertEqual((250, True), (rewritten.added, rewritten.rebuilt))
+        self.assertMatchesTheHistory(rewritten.index, rewritten.history)
+        self.assertTrue(load_cochange_index(self.path, rebuild=True).rebuilt)
+
+    def test_extract_with_other_filters_is_indexed_again(self):
+        self.extract.extract_standard()
+        load_cochange_index(self.path)
+        # the same commits, at both ends, but without the files under src/
+        self.extract.extract_standard('-x', 'src/')
+        update = load_cochange_index(self.path)
+        self.assertEqual((7, True), (update.added, update.rebuilt))
+        self.assertEqual([], [name for name in update.index.filenames if name.startswith('src/')])
+        self.assertMatchesTheHistory(update.index, update.history)
+
+    def test_commands_use_the_index(self):
+        from typer.testing import CliRunner
+        from gminer.miner import app
+        self.write(self.records)
+        plain = CliRunner().invoke(app, ['strongest-pairs', self.path])
+        indexed = CliRunner().invoke(app, ['strongest-pairs', self.path, '--index'])
+        self.assertEqual(0, indexed.exit_code, indexed.output)
+        self.assertIn('Index of 300 commits (rebuilt)', indexed.output)
+        self.assertEqual(plain.output.splitlines()[1:], indexed.output.splitlines()[2:])
+        plain = CliRunner().invoke(app, ['tightest-groupings', self.path, '--since', '2000-01-01'])
+        indexed = CliRunner().invoke(app, ['tightest-groupings', self.path, '--index'])
+        self.assertEqual(0, indexed.exit_code, indexed.output)
+        self.assertEqual(plain.output, indexed.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
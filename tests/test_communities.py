@@ -0,0 +1,38 @@
+import unittest
+
+import networkx as nx
+import numpy
+
+from gminer.communities import louvain_communities
+
+
+class LouvainTestCase(unittest.TestCase):
+    def setUp(self):
+        self.graph = nx.planted_partition_graph(6, 12, 0.6, 0.02, seed=4)
+        for first, second in self.graph.edges:
+            self.graph[first][second]['weight'] = 1 + (first * 7 + second) % 5
+        self.adjacency = nx.to_scipy_sparse_array(self.graph, weight='weight', format='csr')
+
+    def communities(self, membership):
+        return [set(numpy.flatnonzero(membership == community).tolist()) for community in range(membership.max() + 1)]
+
+    def test_finds_the_planted_groups(self):
+        membership = louvain_communities(self.adjacency)
+        expected = [set(range(start, start + 12)) for start in range(0, 72, 12)]
+        self.assertCountEqual(expected, self.communities(membership))
+
+    def test_as_good_as_networkx(self):
+        ours = nx.community.modularity(self.graph, self.communities(louvain_communities(self.adjacency)))
+        theirs = nx.community.modularity(self.graph, nx.community.louvain_communities(self.graph, seed=0))
+        self.assertGreaterEqual(ours, theirs - 1e-9)
+
+    def test_same_graph_same_split(self):
+        self.assertEqual(louvain_communities(self.adjacency).tolist(), louvain_communities(self.adjacency).tolist())
+
+    def test_graph_without_edges(self):
+        empty = nx.to_scipy_sparse_array(nx.empty_graph(3), format='csr')
+        self.assertEqual([0, 1, 2], louvain_communities(empty).tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
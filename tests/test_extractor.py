@@ -0,0 +1,247 @@
+import json
+import os
+import tempfile
+import unittest
+
+from typer.testing import CliRunner
+
+from gminer.extractor import emit_commit_records, emit_commit_records_in_parallel
+from gminer.miner import app
+from gminer.stats_cache import cached_commit_stats
+from tests.sample_repo import SampleRepo
+
+runner = CliRunner()
+
+
+class ExtractorTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.repo = SampleRepo.standard()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.repo.cleanup()
+
+    def extract(self, *options) -> str:
+        result = runner.invoke(app, ['extract-to-json', self.repo.path, *options])
+        self.assertEqual(0, result.exit_code, result.output)
+        return result.output
+
+    def test_git_log_engine_matches_gitpython_byte_for_byte(self):
+        self.assertEqual(self.extract('--engine', 'gitpython', '--no-cache'),
+                         self.extract('--engine', 'log', '--no-cache'))
+
+    def test_cached_stats_give_the_same_extract(self):
+        uncached = self.extract('--no-cache')
+        self.assertEqual(uncached, self.extract('--cache'))
+        self.assertTrue(os.path.exists(os.path.join(self.repo.path, '.git', 'gminer-cache', 'stats.sqlite')))
+        self.assertEqual(uncached, self.extract('--cache'))
+        self.assertEqual(uncached, self.extract('--cache', '--engine', 'gitpython'))
+
+    def test_limits_are_passed_to_git(self):
+        limits = {
+            ('--since', '2023-01-05T00:00:00+00:00'): ['last', 'empty', "Merge branch 'side'", 'main work'],
+            ('--until', '2023-01-03T23:00:00+00:00'): ['second', 'first'],
+            ('--max-count', '2'): ['last', 'empty'],
+            ('--rev-range', 'HEAD~3..HEAD~1'): ['empty', "Merge branch 'side'", 'side work'],
+            ('--first-parent',): ['last', 'empty', "Merge branch 'side'", 'main work', 'second', 'first'],
+        }
+        for options, expected in limits.items():
+            with self.subTest(options):
+                records = json.loads(self.extract(*options, '--no-cache'))
+                self.assertEqual(expected, [r['message'].split('\n')[0] for r in records])
+                self.assertEqual(self.extract(*options, '--no-cache', '--engine', 'gitpython'),
+                                 self.extract(*options, '--no-cache'))
+
+    def test_parallel_extraction_matches_a_single_process(self):
+        self.assertEqual(self.extract('--no-cache'), self.extract('--jobs', '2'))
+
+    def test_shards_come_back_in_commit_order(self):
+        from git import Repo
+        repository = Repo(self.repo.path)
+        expected = list(emit_commit_records(repository))
+        for use_cache in [False, True]:
+            with self.subTest(use_cache=use_cache):
+                self.assertEqual(expected, list(emit_commit_records_in_parallel(
+                    repository, jobs=2, use_cache=use_cache, shard_size=2)))
+
+    def test_cached_commit_stats_look_like_gitpython_stats(self):
+        from git import Repo
+        repository = Repo(self.repo.path)
+        commits = list(repository.iter_commits())
+        stats = cached_commit_stats(repository.common_dir, [c.hexsha for c in commits])
+        for commit in commits:
+            with self.subTest(commit.summary):
+                self.assertEqual(commit.stats.total, stats[commit.hexsha].total)
+                self.assertEqual(commit.stats.files, stats[commit.hexsha].files)
+
+    def test_git_log_engine_is_the_default(self):
+        self.assertEqual(self.extract('--engine', 'log'), self.extract())
+
+    def test_record_shape(self):
+        records = json.loads(self.extract())
+        self.assertEqual(7, len(records))
+        second = records[-2]
+        self.assertEqual(['Lee Helper'], second['coauthors'])
+        self.assertEqual({'a.txt', 'image.bin'}, {f['filename'] for f in second['files']})
+        self.assertEqual({'insertions': 1, 'deletions': 0, 'lines': 1, 'files': 2}, second['totals'])
+        self.assertEqual('2023-01-03T12:00:00+02:00', second['date'])
+
+
+class PathFilterTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.repo = SampleRepo.standard()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.repo.cleanup()
+
+    def extract(self, *options) -> list[dict]:
+        result = runner.invoke(app, ['extract-to-json', self.repo.path, *options])
+        self.assertEqual(0, result.exit_code, result.output)
+        return json.loads(result.output)
+
+    def filenames(self, records) -> set[str]:
+        return {entry['filename'] for record in records for entry in record['files']}
+
+    def test_excluded_files_are_left_out_but_commits_are_kept(self):
+        everything = self.extract()
+        filtered = self.extract('--exclude', 'src/', '--exclude', '*.bin')
+        self.assertEqual([r['hash'] for r in everything], [r['hash'] for r in filtered])
+        self.assertEqual({'a.txt', 'docs/readme.md'}, self.filenames(filtered))
+        side_work = next(r for r in filtered if r['message'] == 'side work\n')
+        self.assertEqual([], side_work['files'])
+        self.assertEqual({'insertions': 0, 'deletions': 0, 'lines': 0, 'files': 0}, side_work['totals'])
+
+    def test_include_patterns_match_at_any_depth(self):
+        self.assertEqual({'src/core.py', 'src/side.py'}, self.filenames(self.extract('--include', '*.py')))
+        self.assertEqual({'a.txt'}, self.filenames(self.extract('--include', '/*.txt')))
+
+    def test_ignore_file_is_read_from_the_repository(self):
+        self.repo.write('.gminerignore', '# generated\n\n*.md\nimage.bin\n')
+        try:
+            records = self.extract()
+            unfiltered = self.extract('--no-ignore-file')
+            gitpython = self.extract('--engine', 'gitpython', '--no-cache')
+        finally:
+            os.unlink(os.path.join(self.repo.path, '.gminerignore'))
+        self.assertEqual({'a.txt', 'src/core.py', 'src/side.py'}, self.filenames(records))
+        self.assertEqual(self.extract(), unfiltered)
+        # the gitpython engine can't filter, so it leaves the ignore file alone
+        self.assertEqual(unfiltered, gitpython)
+
+    def test_filters_apply_to_parallel_extraction(self):
+        self.assertEqual(self.extract('--exclude', 'a.txt'), self.extract('--exclude', 'a.txt', '--jobs', '2'))
+
+    def test_filters_need_the_git_log_engine(self):
+        result = runner.invoke(app, ['extract-to-json', self.repo.path, '--exclude', '*.md', '--engine', 'gitpython'])
+        self.assertNotEqual(0, result.exit_code)
+
+
+class UpdateExtractTestCase(unittest.TestCase):
+    def setUp(self):
+        self.repo = SampleRepo.standard()
+        self.output = tempfile.TemporaryDirectory()
+        self.extract_path = os.path.join(self.output.name, 'history.json')
+        self.write_full_extract(self.extract_path)
+
+    def tearDown(self):
+        self.repo.cleanup()
+        self.output.cleanup()
+
+    def write_full_extract(self, path):
+        result = runner.invoke(app, ['extract-to-json', self.repo.path])
+        self.assertEqual(0, result.exit_code, result.output)
+        with open(path, 'w') as f:
+            f.write(result.output)
+
+    def update(self, *options):
+        result = runner.invoke(app, ['extract-to-json', self.repo.path, '--update', self.extract_path, *options])
+        self.assertEqual(0, result.exit_code, result.output)
+
+    def assert_matches_full_extract(self):
+        expected_path = os.path.join(self.output.name, 'expected.json')
+        self.write_full_extract(expected_path)
+        with open(expected_path) as expected, open(self.extract_path) as actual:
+            self.assertEqual(expected.read(), actual.read())
+
+    def test_new_commits_are_added_in_front(self):
+        self.repo.commit("newer", **{"a.txt": "newer\n"})
+        self.repo.commit("newest", **{"b.txt": "newest\n"})
+        self.update()
+        self.assert_matches_full_extract()
+
+    def test_merged_older_commits_take_their_place_in_the_log(self):
+        self.repo.git("checkout", "-q", "-b", "late", "HEAD~1")
+        day, self.repo.day = self.repo.day, 0
+        self.repo.commit("dated before the extract's newest", **{"late.txt": "late\n"})
+        self.repo.git("checkout", "-q", "main")
+        self.repo.day = day
+        self.repo.git("merge", "-q", "--no-edit", "late")
+        for options in [(), ('--jobs', '2')]:
+            with self.subTest(options=options):
+                self.write_full_extract(self.extract_path)
+                with open(self.extract_path) as source:
+                    records = json.load(source)
+                # as it was before the merge
+                with open(self.extract_path, 'w') as out:
+                    json.dump([record for record in records
+                               if not record['message'].startswith(("Merge branch 'late'", "dated before"))], out)
+                self.update(*options)
+                self.assert_matches_full_extract()
+
+    def test_nothing_new(self):
+        self.update()
+        self.assert_matches_full_extract()
+
+    def test_rewritten_history_drops_unreachable_commits(self):
+        self.repo.git("reset", "-q", "--hard", "HEAD~2")
+        self.repo.commit("replacement", **{"c.txt": "c\n"})
+        self.update()
+        self.assert_matches_full_extract()
+
+    def test_update_with_the_same_filters(self):
+        filtered_path = os.path.join(self.output.name, 'filtered.json')
+        result = runner.invoke(app, ['extract-to-json', self.repo.path, '-x', 'src/', '-o', filtered_path])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.repo.commit("newer", **{"a.txt": "newer\n", "src__new.py": "n = 1\n"})
+        result = runner.invoke(app, ['extract-to-json', self.repo.path, '-x', 'src/', '--update', filtered_path])
+        self.assertEqual(0, result.exit_code, result.output)
+        expected = runner.invoke(app, ['extract-to-json', self.repo.path, '-x', 'src/']).output
+        with open(filtered_path) as actual:
+            self.assertEqual(expected, actual.read())
+
+    def test_gitpython_engine_updates_the_same_way(self):
+        self.repo.git("reset", "-q", "--hard", "HEAD~1")
+        self.repo.commit("replacement", **{"c.txt": "c\n"})
+        self.update('--engine', 'gitpython')
+        self.assert_matches_full_extract()
+
+
+class QuotedFilenameTestCase(unittest.TestCase):
+    def setUp(self):
+        self.repo = SampleRepo()
+        self.repo.commit("first", **{"caf\u00e9.txt": "a\n", "tab\there.txt": "b\n", 'say "hi".txt': "c\n"})
+        self.repo.commit("second", **{"caf\u00e9.txt": "a\nb\n", "back\\slash.txt": "d\n"})
+
+    def tearDown(self):
+        self.repo.cleanup()
+
+    def extract(self, *options) -> str:
+        result = runner.invoke(app, ['extract-to-json', self.repo.path, *options])
+        self.assertEqual(0, result.exit_code, result.output)
+        return result.output
+
+    def test_engines_and_cache_agree_on_quoted_filenames(self):
+        uncached = self.extract('--no-cache')
+        self.assertIn("tab\there.txt", [entry['filename'] for record in json.loads(uncached)
+                                         for entry in record['files']])
+        self.assertEqual(uncached, self.extract('--no-cache', '--engine', 'gitpython'))
+        # the gitpython engine fills the cache that the log engine then reads
+        self.assertEqual(uncached, self.extract('--cache', '--engine', 'gitpython'))
+        self.assertEqual(uncached, self.extract('--cache'))
+
+
+if __name__ == '__main__':
+    unittest.main()
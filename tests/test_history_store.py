@@ -0,0 +1,178 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from collections import Counter
+from datetime import datetime, timezone
+
+import numpy
+
+from gminer.associative_modularity import calculate_relative_strengths, count_combinations
+from gminer import history_store
+from gminer.history_store import HistoryStore, load_history, sidecar_path
+from gminer.per_date_stats import count_commits_per_day
+from gminer.utility import iter_history_records, read_git_history_from_file
+from tests.sample_repo import SampleRepo
+
+
+class HistoryStoreTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from typer.testing import CliRunner
+        from gminer.miner import app
+        cls.repo = SampleRepo.standard()
+        cls.output = tempfile.TemporaryDirectory()
+        cls.json_path = os.path.join(cls.output.name, 'history.json')
+        cls.parquet_path = os.path.join(cls.output.name, 'history.parquet')
+        for path in [cls.json_path, cls.parquet_path]:
+            result = CliRunner().invoke(app, ['extract-to-json', cls.repo.path, '--output', path])
+            assert result.exit_code == 0, result.output
+        cls.store = HistoryStore.from_extract(cls.json_path)
+        cls.history = read_git_history_from_file(cls.json_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.repo.cleanup()
+        cls.output.cleanup()
+
+    def test_records_come_back_unchanged(self):
+        expected = list(iter_history_records(self.json_path))
+        self.assertEqual(expected, list(self.store.iter_records()))
+        self.assertEqual(expected, list(HistoryStore.from_extract(self.parquet_path).iter_records()))
+        self.assertEqual(expected, list(HistoryStore.from_dataframe(self.history).iter_records()))
+
+    def test_filenames_are_interned(self):
+        self.assertEqual(7, len(self.store))
+        self.assertEqual(5, len(self.store.filenames))
+        self.assertEqual([3, 0, 2, 2, 2, 2, 2], self.store.sizes.tolist())
+        self.assertEqual(self.history.files.map(len).tolist(), self.store.sizes.tolist())
+        core = self.store.file_id('src/core.py')
+        self.assertEqual(['a.txt', 'src/core.py', 'src/side.py'], self.store.filenames_of(0))
+        self.assertEqual(4, self.store.file_commit_counts()[core])
+
+    def test_most_committed_breaks_ties_like_counter(self):
+        counter = Counter(f['filename'] for files in self.history.files for f in files)
+        self.assertEqual(counter.most_common(3), self.store.most_committed(3))
+
+    def test_select_keeps_the_chosen_commits(self):
+        records = list(self.store.iter_records())
+        chosen = self.store.select([5, 0, 3])
+        self.assertEqual([records[5], records[0], records[3]], list(chosen.iter_records()))
+        mask = self.store.sizes > 1
+        self.assertEqual([r for r in records if len(r['files']) > 1], list(self.store.select(mask).iter_records()))
+
+    def test_analyses_agree_with_the_dataframe(self):
+        self.assertEqual(count_combinations(self.history), count_combinations(self.store))
+        self.assertEqual(calculate_relative_strengths(self.history), calculate_relative_strengths(self.store))
+        after = datetime(2023, 1, 3, tzinfo=timezone.utc)
+        before = datetime(2023, 1, 7, 11, tzinfo=timezone.utc)
+        for bounds in [{}, {'after': after}, {'before': before}, {'after': after, 'before': before}]:
+            with self.subTest(**bounds):
+                expected = count_commits_per_day(self.history, **bounds)
+                actual = count_commits_per_day(self.store, **bounds)
+                self.assertEqual(list(expected.items()), list(actual.items()))
+
+    def test_date_window_is_applied_while_loading(self):
+        after = datetime(2023, 1, 3, 12, tzinfo=timezone.utc)
+        before = datetime(2023, 1, 7, 10, tzinfo=timezone.utc)
+        records = list(iter_history_records(self.json_path))
+        expected = [r for r in records if after < datetime.fromisoformat(r['date']) < before]
+        self.assertEqual(['Merge branch \'side\'\n', 'main work\n', 'side work\n'],
+                         [r['message'] for r in expected])
+        self.assertEqual(expected, list(load_history(self.json_path, after=after, before=before).iter_records()))
+        self.assertEqual([r['hash'] for r in expected],
+                         read_git_history_from_file(self.parquet_path, after=after, before=before).hash.tolist())
+        self.assertEqual(0, len(self.store.between(after=before, before=after)))
+
+    def test_tightest_groupings_loads_only_its_window(self):
+        from typer.testing import CliRunner
+        from gminer.miner import app
+        result = CliRunner().invoke(app, ['tightest-groupings', self.json_path, '--since', '2023-01-05'])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn('From 2023-01-05 12:00:00+02:00 through 2023-01-08 12:00:00+02:00', result.output)
+
+    def test_dataframe_matches_the_extract_reader(self):
+        from pandas.testing import assert_frame_equal
+        assert_frame_equal(self.history, self.store.to_dataframe())
+
+
+class SidecarTestCase(unittest.TestCase):
+    def setUp(self):
+        from typer.testing import CliRunner
+        from gminer.miner import app
+        self.repo = SampleRepo.standard()
+        self.output = tempfile.TemporaryDirectory()
+        self.extract_path = os.path.join(self.output.name, 'history.jsonl')
+        result = CliRunner().invoke(app, ['extract-to-json', self.repo.path, '--output', self.extract_path])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.expected = list(iter_history_records(self.extract_path))
+
+    def tearDown(self):
+        self.repo.cleanup()
+        self.output.cleanup()
+
+    def test_second_load_maps_the_sidecar(self):
+        first = load_history(self.extract_path)
+        self.assertTrue(os.path.isdir(sidecar_path(self.extract_path)))
+        self.assertNotIsInstance(first.file_ids, numpy.memmap)
+        second = load_history(self.extract_path)
+        self.assertIsInstance(second.file_ids, numpy.memmap)
+        self.assertEqual(self.expected, list(second.iter_records()))
+
+    def test_sidecar_can_be_read_by_whoever_can_read_the_extract(self):
+        umask = os.umask(0o022)
+        try:
+            load_history(self.extract_path)
+            # only the time changes, so just the sidecar's metadata is rewritten
+            os.utime(self.extract_path, ns=(0, 0))
+            load_history(self.extract_path)
+        finally:
+            os.umask(umask)
+        sidecar = sidecar_path(self.extract_path)
+        self.assertEqual(0o755, os.stat(sidecar).st_mode & 0o777)
+        for name in os.listdir(sidecar):
+            self.assertEqual(0o644, os.stat(os.path.join(sidecar, name)).st_mode & 0o777, name)
+
+    def test_sidecar_swapped_while_it_is_opened_is_not_used(self):
+        load_history(self.extract_path)
+        sidecar = sidecar_path(self.extract_path)
+        other = HistoryStore.from_records(self.expected[:2])
+        opened = HistoryStore.open
+
+        def open_during_a_swap(directory):
+            # another process replaces the sidecar with one of another extract part way through
+            store = opened(directory)
+            history_store._write_sidecar(other, sidecar, {**history_store._read_sidecar_metadata(sidecar),
+                                                          "digest": "another extract"})
+            return store
+
+        for swap in [mock.DEFAULT, FileNotFoundError]:
+            with self.subTest(swap=swap), mock.patch.object(
+                    HistoryStore, 'open', side_effect=open_during_a_swap if swap is mock.DEFAULT else swap):
+                reloaded = load_history(self.extract_path)
+            self.assertNotIsInstance(reloaded.file_ids, numpy.memmap)
+            self.assertEqual(self.expected, list(reloaded.iter_records()))
+            history_store._write_sidecar(HistoryStore.from_records(self.expected), sidecar,
+                                         {**history_store._extract_fingerprint(self.extract_path),
+                                          "digest": history_store._extract_digest(self.extract_path)})
+        self.assertEqual(['history.jsonl', os.path.basename(sidecar)], sorted(os.listdir(self.output.name)))
+
+    def test_changed_extract_is_parsed_again(self):
+        load_history(self.extract_path)
+        with open(self.extract_path, 'w') as out:
+            out.writelines(f'{json.dumps(record)}\n' for record in self.expected[:3])
+        reloaded = load_history(self.extract_path)
+        self.assertNotIsInstance(reloaded.file_ids, numpy.memmap)
+        self.assertEqual(self.expected[:3], list(reloaded.iter_records()))
+        self.assertEqual(self.expected[:3], list(load_history(self.extract_path).iter_records()))
+
+    def test_touched_extract_is_checked_by_content(self):
+        load_history(self.extract_path)
+        stat = os.stat(self.extract_path)
+        os.utime(self.extract_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertIsInstance(load_history(self.extract_path).file_ids, numpy.memmap)
+
+
+if __name__ == '__main__':
+    unittest.main()
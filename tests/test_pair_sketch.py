@@ -0,0 +1,58 @@
+import unittest
+from collections import Counter
+from itertools import combinations
+
+from gminer.associative_modularity import strongest_pairs_by_ranking
+from gminer.cochange import iter_pair_chunks
+from gminer.pair_sketch import strongest_pairs_sketched
+from tests.test_cochange import random_history, strengths_pair_by_pair
+
+
+class PairSketchTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.history = random_history()
+        cls.exact = strengths_pair_by_pair(cls.history)
+        cls.expected = strongest_pairs_by_ranking(cls.history, limit=20)
+
+    def test_chunks_hold_every_pair_once(self):
+        from gminer.cochange import filename_rank
+        files = len(self.history.filenames)
+        names = self.history.filenames
+        pairs = Counter()
+        for keys, commits in iter_pair_chunks(self.history, filename_rank(self.history), chunk_pairs=50):
+            self.assertLessEqual(len(keys), 50 + 11)
+            for key, commit in zip(keys.tolist(), commits.tolist()):
+                self.assertIn(names[key % files], self.history.filenames_of(commit))
+            pairs.update((names[key // files], names[key % files]) for key in keys.tolist())
+        self.assertEqual(Counter(pair for names in self.history.iter_filenames() for pair in combinations(names, 2)),
+                         pairs)
+
+    def test_large_enough_sketch_is_exact(self):
+        result = strongest_pairs_sketched(self.history, 20, capacity=len(self.exact), chunk_pairs=100)
+        self.assertEqual(0, result.error)
+        self.assertTrue(result.certain)
+        self.assertEqual(self.expected, result.pairs)
+
+    def test_second_pass_recounts_the_candidates(self):
+        result = strongest_pairs_sketched(self.history, 20, capacity=800, chunk_pairs=100)
+        self.assertGreater(result.error, 0)
+        self.assertTrue(result.certain)
+        self.assertEqual(self.expected, result.pairs)
+
+    def test_summary_values_are_within_the_error(self):
+        result = strongest_pairs_sketched(self.history, 20, capacity=200, exact=False, chunk_pairs=100)
+        self.assertFalse(result.certain)
+        self.assertEqual(sum(len(names) * (len(names) - 1) // 2 for names in self.history.iter_filenames()),
+                         result.total_pairs)
+        for value, pair, _ in result.pairs:
+            self.assertLessEqual(value, self.exact[pair] + 1e-12)
+            self.assertLessEqual(self.exact[pair], value + result.error + 1e-12)
+
+    def test_sketch_must_hold_the_limit(self):
+        with self.assertRaises(ValueError):
+            strongest_pairs_sketched(self.history, 20, capacity=10)
+
+
+if __name__ == '__main__':
+    unittest.main()
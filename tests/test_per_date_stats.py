@@ -0,0 +1,88 @@
+import random
+import unittest
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from gminer.history_store import HistoryStore
+from gminer.per_date_stats import count_commits_per_day, stats_per_period
+from gminer.types import Metric, Period
+
+
+def random_history(commits: int = 300, seed: int = 11) -> HistoryStore:
+    generator = random.Random(seed)
+    files = [f"src/file{number}.py" for number in range(8)]
+    authors = ["Pat", "Lee", "Sam", "Kim"]
+    start = datetime(2023, 12, 20, 6, tzinfo=timezone(timedelta(hours=2)))
+    records = []
+    for number in range(commits):
+        chosen = sorted(generator.sample(files, generator.randint(1, 4)))
+        moment = start + timedelta(hours=number * 7, minutes=generator.randint(0, 59))
+        records.append(dict(hash=f"{number:040x}", author=generator.choice(authors), coauthors=[],
+                            date=moment.isoformat(), message="",
+                            files=[dict(filename=name, insertions=generator.randint(0, 9),
+                                        deletions=generator.randint(0, 9), lines=0) for name in chosen]))
+    return HistoryStore.from_records(list(reversed(records)))
+
+
+def recount(history: HistoryStore, bucket_of) -> dict[date, dict[str, int]]:
+    """
+    The stats the slow way: commit by commit.
+    """
+    buckets: dict[date, dict] = {}
+    for index in range(len(history)):
+        stats = buckets.setdefault(bucket_of(history.date_of(index)), dict(
+            commits=0, files=0, insertions=0, deletions=0, authors=set()))
+        changes = slice(history.commit_offsets[index], history.commit_offsets[index + 1])
+        stats["commits"] += 1
+        stats["files"] += int(history.sizes[index])
+        stats["insertions"] += int(history.insertions[changes].sum())
+        stats["deletions"] += int(history.deletions[changes].sum())
+        stats["authors"].add(int(history.author_ids[index]))
+    return {start: {**stats, "authors": len(stats["authors"])} for start, stats in buckets.items()}
+
+
+class StatsPerPeriodTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.history = random_history()
+
+    def test_every_metric_matches_a_recount(self):
+        tokyo = timezone(timedelta(hours=9))
+        bucket_starts = {
+            (Period.day, "UTC"): lambda moment: moment.astimezone(timezone.utc).date(),
+            (Period.day, "Asia/Tokyo"): lambda moment: moment.astimezone(tokyo).date(),
+            (Period.week, "UTC"): lambda moment: moment.astimezone(timezone.utc).date()
+            - timedelta(days=moment.astimezone(timezone.utc).weekday()),
+            (Period.month, "Asia/Tokyo"): lambda moment: moment.astimezone(tokyo).date().replace(day=1),
+        }
+        for (period, zone), bucket_of in bucket_starts.items():
+            with self.subTest(period=period, timezone=zone):
+                stats = stats_per_period(self.history, period, timezone=zone)
+                expected = recount(self.history, bucket_of)
+                self.assertEqual(sorted(expected), stats.index.date.tolist())
+                self.assertEqual([expected[start] for start in sorted(expected)],
+                                 stats.to_dict(orient="records"))
+
+    def test_weeks_are_iso_weeks(self):
+        stats = stats_per_period(self.history, Period.week)
+        self.assertTrue(all(start.isocalendar().weekday == 1 for start in stats.index))
+        self.assertEqual(len(self.history), stats[Metric.commits].sum())
+
+    def test_chosen_metrics_and_extract_order(self):
+        stats = stats_per_period(self.history, Period.day, [Metric.commits, Metric.authors], chronological=False)
+        self.assertEqual(["commits", "authors"], list(stats.columns))
+        self.assertEqual(sorted(stats.index, reverse=True), list(stats.index))
+
+    def test_commits_per_day_in_a_time_zone_with_daylight_saving(self):
+        after = datetime(2024, 1, 3, tzinfo=timezone.utc)
+        counts = count_commits_per_day(self.history, after=after, timezone="America/New_York")
+        eastern = ZoneInfo("America/New_York")
+        window = self.history.between(after, None)
+        self.assertEqual(Counter(window.date_of(index).astimezone(eastern).date() for index in range(len(window))),
+                         counts)
+        self.assertEqual(sorted(counts, reverse=True), list(counts))
+
+
+if __name__ == '__main__':
+    unittest.main()
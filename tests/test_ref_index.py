@@ -0,0 +1,71 @@
+import json
+import os
+import unittest
+from unittest import mock
+
+import git
+
+from gminer import ref_index
+from gminer.miner import release_tag_intervals, releases_by_week_numbers
+from gminer.ref_index import CACHE_DIRECTORY, CACHE_FILE, load_ref_index
+from gminer.types import RefKind
+from tests.sample_repo import SampleRepo
+
+
+class RefIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.sample = SampleRepo.standard()
+        self.sample.git("tag", "v1.0", "HEAD~3")
+        self.sample.git("tag", "-a", "-m", "annotated", "v1.1", "HEAD~1")
+        self.sample.git("tag", "-a", "-m", "nested", "v1.1-signed", "v1.1")
+        self.sample.git("tag", "v2.0", "HEAD")
+        self.sample.git("tag", "a-tree", "HEAD^{tree}")
+        self.repo = git.Repo(self.sample.path)
+        ref_index._loaded.clear()
+
+    def tearDown(self):
+        self.repo.close()
+        self.sample.cleanup()
+
+    def test_refs_match_gitpython(self):
+        index = load_ref_index(self.repo.common_dir)
+        tags = {tag.name: tag for tag in index.tags}
+        self.assertEqual(sorted(tag.name for tag in self.repo.tags), sorted(tags))
+        for tag in self.repo.tags:
+            with self.subTest(tag=tag.name):
+                if tag.name == "a-tree":
+                    self.assertIsNone(tags[tag.name].commit)
+                    continue
+                self.assertEqual(tag.commit.hexsha, tags[tag.name].commit)
+                self.assertEqual(tag.commit.authored_datetime, tags[tag.name].authored)
+                self.assertEqual(tag.commit.committed_datetime, tags[tag.name].committed)
+        self.assertEqual("tag", tags["v1.1"].object_type)
+        self.assertEqual({head.name: head.commit.hexsha for head in self.repo.heads},
+                         {branch.name: branch.commit for branch in index.branches})
+        self.assertEqual(["v1.0", "v1.1", "v1.1-signed", "v2.0"],
+                         [tag.name for tag in index.by_date(RefKind.tag)])
+
+    def test_release_pages_read_the_index(self):
+        intervals = release_tag_intervals(self.repo, r"v\d")
+        self.assertEqual(["v1.0", "v1.1", "v1.1-signed", "v2.0"], intervals["name"].tolist())
+        self.assertEqual([None, 2, 0, 1], [None if days != days else int(days) for days in intervals["days_since"]])
+        weeks = releases_by_week_numbers(self.repo, 2023, r"^v")
+        self.assertEqual(4, weeks["releases"].sum())
+
+    def test_cached_until_the_refs_change(self):
+        first = load_ref_index(self.repo.common_dir)
+        self.assertTrue(os.path.isfile(os.path.join(self.repo.common_dir, CACHE_DIRECTORY, CACHE_FILE)))
+        ref_index._loaded.clear()
+        with mock.patch.object(ref_index, "read_refs", side_effect=AssertionError("read again")):
+            self.assertEqual(first.refs, load_ref_index(self.repo.common_dir).refs)
+        self.sample.git("tag", "v3.0", "HEAD")
+        self.assertIn("v3.0", [tag.name for tag in load_ref_index(self.repo.common_dir).tags])
+        self.sample.git("pack-refs", "--all")
+        self.sample.git("tag", "-d", "v1.0")
+        self.assertNotIn("v1.0", [tag.name for tag in load_ref_index(self.repo.common_dir).tags])
+        with open(os.path.join(self.repo.common_dir, CACHE_DIRECTORY, CACHE_FILE)) as source:
+            self.assertEqual(5, len([row for row in json.load(source)["refs"] if row[2] == "tag"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
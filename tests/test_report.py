@@ -0,0 +1,93 @@
+import csv
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from gminer.associative_modularity import strongest_pairs_by_ranking
+from gminer.miner import analyze_and_report
+from gminer.report import ReportOptions, Task, run_tasks, write_report
+from tests.sample_repo import SampleRepo
+from tests.test_cochange import random_history
+
+
+def read_csv(path: str) -> list[dict]:
+    with open(path, newline="") as source:
+        return list(csv.DictReader(source))
+
+
+class RunTasksTestCase(unittest.TestCase):
+    def test_tasks_run_after_what_they_need(self):
+        started = []
+        lock = threading.Lock()
+
+        def step(name, value):
+            def run(*inputs):
+                with lock:
+                    started.append(name)
+                return value + sum(inputs)
+            return run
+
+        tasks = [Task("total", ("left", "right"), step("total", 0)), Task("left", ("root",), step("left", 1)),
+                 Task("right", ("root",), step("right", 2)), Task("root", (), step("root", 10))]
+        results, timings = run_tasks(tasks, workers=3)
+        self.assertEqual(dict(root=10, left=11, right=12, total=23), results)
+        self.assertEqual("root", started[0])
+        self.assertEqual("total", started[-1])
+        self.assertEqual(set(started), {timing.name for timing in timings})
+        self.assertEqual(["root", "total"], [timings[0].name, timings[-1].name])
+
+    def test_failures_and_bad_graphs(self):
+        def fail():
+            raise RuntimeError("no")
+
+        with self.assertRaises(RuntimeError):
+            run_tasks([Task("fails", (), fail), Task("after", ("fails",), lambda _: 1)])
+        with self.assertRaises(ValueError):
+            run_tasks([Task("a", ("b",), lambda _: 1), Task("b", ("a",), lambda _: 1)])
+        with self.assertRaises(ValueError):
+            run_tasks([Task("a", ("missing",), lambda _: 1)])
+
+
+class ReportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.output = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.output.cleanup()
+
+    def test_outputs_match_the_commands(self):
+        history = random_history(commits=300)
+        manifest = write_report(history, self.output.name, ReportOptions(size=10, workers=4))
+        self.assertEqual(["releases"], manifest["skipped"])
+        for filenames in manifest["outputs"].values():
+            for filename in filenames:
+                self.assertTrue(os.path.isfile(os.path.join(self.output.name, filename)), filename)
+        pairs = read_csv(os.path.join(self.output.name, "strongest_pairs.csv"))
+        self.assertEqual([(first, second, int(count)) for _, (first, second), count
+                          in strongest_pairs_by_ranking(history, 10)],
+                         [(row["first"], row["second"], int(row["count"])) for row in pairs])
+        committed = read_csv(os.path.join(self.output.name, "most_committed.csv"))
+        self.assertEqual(history.most_committed(10), [(row["filename"], int(row["commits"])) for row in committed])
+        days = read_csv(os.path.join(self.output.name, "commits_per_day.csv"))
+        self.assertEqual(len(history), sum(int(row["commits"]) for row in days))
+        with open(os.path.join(self.output.name, "report.json")) as source:
+            self.assertEqual(manifest, json.load(source))
+
+    def test_a_repository_is_read_and_its_tags_reported(self):
+        sample = SampleRepo.standard()
+        try:
+            sample.git("tag", "v1.0", "HEAD~2")
+            sample.git("tag", "v1.1", "HEAD")
+            manifest = analyze_and_report(sample.path, os.path.join(self.output.name, "report"))
+            self.assertEqual(7, manifest["commits"])
+            self.assertEqual([], manifest["skipped"])
+            releases = read_csv(os.path.join(self.output.name, "report", "release_intervals.csv"))
+            self.assertEqual(["v1.0", "v1.1"], [row["tag"] for row in releases])
+        finally:
+            sample.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+from datetime import date, datetime, timedelta, timezone
+
+import numpy
+
+from gminer.cochange import pair_counts, pair_strengths
+from gminer.history_store import HistoryStore
+from gminer.temporal_coupling import TemporalCoupling, bucket_numbers, bucket_start, coupling_trend
+from gminer.types import Period
+
+
+def spread_history(commits: int = 400, seed: int = 5) -> HistoryStore:
+    generator = random.Random(seed)
+    files = [f"src/file{number}.py" for number in range(12)]
+    start = datetime(2022, 12, 25, 9, tzinfo=timezone(timedelta(hours=-5)))
+    records = []
+    for number in range(commits):
+        chosen = sorted(generator.sample(files, generator.choice([1, 2, 2, 3, 4])))
+        moment = start + timedelta(hours=number * 13)
+        records.append(dict(hash=f"{number:040x}", author="Pat", coauthors=[], date=moment.isoformat(), message="",
+                            files=[dict(filename=name, insertions=1, deletions=0, lines=1) for name in chosen]))
+    return HistoryStore.from_records(list(reversed(records)))
+
+
+class TemporalCouplingTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.history = spread_history()
+        cls.pair = ('src/file3.py', 'src/file7.py')
+
+    def test_buckets_start_on_mondays_and_firsts(self):
+        moments = [datetime(2023, 1, 1, 23, 59, tzinfo=timezone.utc), datetime(2023, 1, 2, tzinfo=timezone.utc),
+                   datetime(2024, 2, 29, 12, tzinfo=timezone.utc)]
+        timestamps = numpy.array([int(moment.timestamp()) for moment in moments])
+        self.assertEqual([date(2022, 12, 26), date(2023, 1, 2), date(2024, 2, 26)],
+                         [bucket_start(number, Period.week) for number in bucket_numbers(timestamps, Period.week)])
+        self.assertEqual([date(2023, 1, 1), date(2023, 1, 1), date(2024, 2, 1)],
+                         [bucket_start(number, Period.month) for number in bucket_numbers(timestamps, Period.month)])
+
+    def test_windows_match_recounting_their_commits(self):
+        for period, window, step in [(Period.week, 13, 1), (Period.week, 4, 3), (Period.month, 2, 1)]:
+            with self.subTest(period=period, window=window, step=step):
+                coupling = TemporalCoupling(self.history, period, chunk_pairs=40)
+                trend = coupling.rolling(*self.pair, window, step)
+                days = (self.history.timestamps // 86400).astype('datetime64[D]').tolist()
+                for start, end, strength, count in trend:
+                    chosen = self.history.select([start <= day <= end for day in days])
+                    self.assertAlmostEqual(pair_strengths(chosen).get(self.pair, 0.0), strength, places=12)
+                    self.assertEqual(pair_counts(chosen).get(self.pair, 0), count)
+                self.assertTrue(trend[-1].start <= max(days) <= trend[-1].end)
+                self.assertGreater(trend[-1].end, trend[-2].end)
+
+    def test_pair_order_and_strangers(self):
+        coupling = TemporalCoupling(self.history)
+        first, second = self.pair
+        self.assertEqual(coupling.rolling(first, second, 13), coupling.rolling(second, first, 13))
+        self.assertEqual({0.0}, {point.strength for point in coupling.rolling(first, 'no/such/file.py', 13)})
+
+    def test_a_query_buckets_only_its_pair(self):
+        everything = TemporalCoupling(self.history, Period.week)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'history.json')
+            with open(path, 'w') as out:
+                json.dump(list(self.history.iter_records()), out)
+            with mock.patch('gminer.temporal_coupling.iter_pair_chunks',
+                            side_effect=AssertionError('every pair bucketed')):
+                for pair in [self.pair, ('src/file7.py', 'src/file0.py'), ('src/file1.py', 'no/such/file.py')]:
+                    with self.subTest(pair=pair):
+                        expected = everything.rolling(*pair, 13)
+                        trend = coupling_trend(path, *pair)
+                        self.assertEqual([(start, end, count) for start, end, _, count in expected],
+                                         [(start, end, count) for start, end, _, count in trend])
+                        for point, expected_point in zip(trend, expected):
+                            self.assertAlmostEqual(expected_point.strength, point.strength, places=12)
+
+    def test_command_prints_the_trend(self):
+        from typer.testing import CliRunner
+        from gminer.miner import app
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'history.json')
+            with open(path, 'w') as out:
+                json.dump(list(self.history.iter_records()), out)
+            expected = coupling_trend(path, *self.pair, Period.month, 3)
+            result = CliRunner().invoke(app, ['coupling-trend', path, *self.pair, '--period', 'month', '--window', '3'])
+        self.assertEqual(0, result.exit_code, result.output)
+        lines = result.output.splitlines()[3:]
+        self.assertEqual(len(expected), len(lines))
+        self.assertEqual(f"{expected[-1].start} .. {expected[-1].end} {expected[-1].strength:8.3f}:"
+                         f"{expected[-1].count:5d}", lines[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
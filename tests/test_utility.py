@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from pandas.testing import assert_frame_equal
+from typer.testing import CliRunner
+
+from gminer.miner import app
+from gminer.types import ExtractFormat
+from gminer.utility import (extract_format, iter_history_records, read_git_history_from_file,
+                            read_git_history_in_chunks)
+from tests.sample_repo import SampleRepo
+
+runner = CliRunner()
+
+
+class ExtractFormatsTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.repo = SampleRepo.standard()
+        cls.output = tempfile.TemporaryDirectory()
+        cls.extracts = {}
+        for name in ['history.json', 'history.jsonl', 'history.json.gz', 'history.jsonl.gz', 'history.parquet']:
+            path = os.path.join(cls.output.name, name)
+            result = runner.invoke(app, ['extract-to-json', cls.repo.path, '--output', path])
+            assert result.exit_code == 0, result.output
+            cls.extracts[name] = path
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.repo.cleanup()
+        cls.output.cleanup()
+
+    def test_format_is_detected_from_content(self):
+        self.assertEqual(ExtractFormat.json, extract_format(self.extracts['history.json.gz']))
+        self.assertEqual(ExtractFormat.jsonl, extract_format(self.extracts['history.jsonl.gz']))
+
+    def test_every_format_holds_the_same_records(self):
+        expected = list(iter_history_records(self.extracts['history.json']))
+        self.assertEqual(7, len(expected))
+        for name, path in self.extracts.items():
+            with self.subTest(name):
+                self.assertEqual(expected, list(iter_history_records(path)))
+
+    def test_whole_file_reader_handles_every_format(self):
+        for name, path in self.extracts.items():
+            with self.subTest(name):
+                history = read_git_history_from_file(path)
+                self.assertEqual(7, len(history))
+
+    def test_columnar_extract_loads_the_same_dataframe(self):
+        expected = read_git_history_from_file(self.extracts['history.json'])
+        # built from the tables' columns, not by rebuilding each record
+        with mock.patch('gminer.columnar.iter_columnar_records', side_effect=AssertionError('read by record')):
+            assert_frame_equal(expected, read_git_history_from_file(self.extracts['history.parquet']))
+
+    def test_chunks_cover_the_whole_history(self):
+        chunks = list(read_git_history_in_chunks(self.extracts['history.jsonl.gz'], chunk_size=3))
+        self.assertEqual([3, 3, 1], [len(chunk) for chunk in chunks])
+        whole = read_git_history_from_file(self.extracts['history.json'])
+        self.assertEqual(list(whole.hash), [h for chunk in chunks for h in chunk.hash])
+
+    def test_commands_give_the_same_answers_for_every_format(self):
+        for command in ['most-committed', 'commits-per-day']:
+            expected = runner.invoke(app, [command, self.extracts['history.json']]).output
+            for name, path in self.extracts.items():
+                with self.subTest(command=command, extract=name):
+                    self.assertEqual(expected, runner.invoke(app, [command, path]).output)
+
+    def test_update_keeps_format_and_compression(self):
+        for name, expected_format in [('updated.jsonl.gz', ExtractFormat.jsonl),
+                                      ('updated.parquet', ExtractFormat.parquet)]:
+            with self.subTest(name):
+                path = os.path.join(self.output.name, name)
+                runner.invoke(app, ['extract-to-json', self.repo.path, '--output', path])
+                before = list(iter_history_records(path))
+                result = runner.invoke(app, ['extract-to-json', self.repo.path, '--update', path])
+                self.assertEqual(0, result.exit_code, result.output)
+                self.assertEqual(expected_format, extract_format(path))
+                self.assertEqual(before, list(iter_history_records(path)))
+
+
+if __name__ == '__main__':
+    unittest.main()